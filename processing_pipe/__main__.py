@@ -29,7 +29,9 @@ def main(args=None):
 	# ––––––––––––
 	# Build parser
 
-	main_parser = parser()
+	# Auto-completion needs all subcommands, otherwise only the selected one
+	# is imported
+	main_parser = parser(None if "_ARGCOMPLETE" in os.environ else args)
 
 	# –––––––––––––––
 	# Auto-completion
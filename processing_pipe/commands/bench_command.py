@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# Standard libraries
+import itertools
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Third-party libraries
+import argparse
+
+# Local modules
+from processing_pipe.graph import Graph
+from processing_pipe.profiler import percentile
+from processing_pipe.utils import loadJSONFile, saveJSONFile
+
+DESCRIPTION = """Measure latency and throughput of given processing graph, for
+each of its parameter configurations. Like with run, the graph should be
+auto-sufficient.
+"""
+
+def benchAlgorithm(args):
+	throwIfAbsent(args.GRAPH)
+	graph = Graph.createFromDict(loadJSONFile(args.GRAPH))
+
+	report = dict(
+	    graph=args.GRAPH,
+	    warmup=args.warmup,
+	    repeat=args.repeat,
+	    duration=args.duration,
+	    configurations=[],
+	    retention=[]
+	)
+
+	switching_parameters = graph.getSwitchingParameters()
+	for values in itertools.product(*[p[2] for p in switching_parameters]):
+		# Fix one configuration
+		params = dict()
+		for (cell_id, param_name, _), value in zip(switching_parameters, values):
+			graph.setSwitchingParameters(cell_id, param_name, [value])
+			params[cell_id+"."+param_name] = value
+
+		latencies = benchConfiguration(graph, args.warmup, args.repeat, args.duration)
+		configuration = dict(params=params, runs=len(latencies))
+		configuration.update(summarizeLatencies(latencies))
+		report["configurations"].append(configuration)
+
+		print "Configuration: %s"%", ".join(["%s=%r"%x for x in sorted(params.items())])
+		print "Throughput: %f runs/s (%d runs)"%(configuration["throughput"],
+		                                         configuration["runs"])
+		print "Latency (ms): mean %.3f, p50 %.3f, p95 %.3f, p99 %.3f, max %.3f"%(
+		    1000*configuration["latency"]["mean"],
+		    1000*configuration["latency"]["p50"],
+		    1000*configuration["latency"]["p95"],
+		    1000*configuration["latency"]["p99"],
+		    1000*configuration["latency"]["max"]
+		)
+
+	# Put back all values
+	for cell_id, param_name, values in switching_parameters:
+		graph.setSwitchingParameters(cell_id, param_name, values)
+
+	for policy in args.retention or []:
+		peak_rss, sweep_rss = measureSweepMemory(graph, policy)
+		report["retention"].append(dict(
+		    policy=policy,
+		    peak_rss=peak_rss,
+		    sweep_rss=sweep_rss
+		))
+		print "Retention %s: peak RSS %d kB (%d kB more during the sweep)"%(
+		    policy,
+		    peak_rss,
+		    sweep_rss
+		)
+
+	# Peak memory of the bench process
+	report["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print "Peak RSS: %d kB"%report["peak_rss"]
+
+	if args.output:
+		saveJSONFile(report, args.output)
+	return report
+
+def benchConfiguration(graph, warmup, repeat, duration):
+	"""
+	Runs the graph repeatedly and times each run
+
+	:param graph: Graph to run, with a single parameter configuration
+	:param warmup: Number of runs to do before measuring
+	:param repeat: Minimum number of measured runs
+	:param duration: Minimum time spent measuring, in seconds
+	:return: List of run durations, in seconds
+	"""
+	for _ in range(warmup):
+		graph.run()
+
+	latencies = []
+	start = time.time()
+	while len(latencies) < max(1, repeat) or time.time()-start < duration:
+		before_run = time.time()
+		graph.run()
+		latencies.append(time.time()-before_run)
+	return latencies
+
+def setRetentionPolicy(graph, policy, log_folder):
+	"""
+	Chooses what the graph keeps of the results of a run
+
+	:param policy: "all" (all results kept), "keep:<n>" (n most recent
+	results kept), "repr" (representations of the outputs kept), "callback"
+	(results given to a callback, none kept) or "log" (results written to a
+	ResultLog)
+	:param log_folder: Folder of the log of the "log" policy
+	"""
+	if "all" == policy:
+		graph.setResultRetention()
+	elif policy.startswith("keep:"):
+		graph.setResultRetention(keep=int(policy[5:]))
+	elif "repr" == policy:
+		graph.setResultRetention(reduction=repr)
+	elif "callback" == policy:
+		graph.setResultRetention(keep=0, callback=lambda result: None)
+	elif "log" == policy:
+		graph.setResultLog(log_folder)
+	else:
+		raise Exception("Unknown result retention policy: %s"%policy)
+
+def measureSweepMemory(graph, policy):
+	"""
+	Runs the whole parameter sweep of a graph with a result retention
+	policy, in a child process so that policies do not affect each other
+
+	:param policy: See ``setRetentionPolicy``
+	:return: (peak RSS of the child process, increase of its peak RSS during
+	the sweep), in kB
+	"""
+	queue = multiprocessing.Queue()
+	def sweep():
+		log_folder = tempfile.mkdtemp()
+		try:
+			start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			setRetentionPolicy(graph, policy, log_folder)
+			graph.run()
+			peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			queue.put((peak_rss, peak_rss-start_rss))
+		except Exception as e:
+			queue.put(e)
+		finally:
+			shutil.rmtree(log_folder)
+	process = multiprocessing.Process(target=sweep)
+	process.start()
+	measure = queue.get()
+	process.join()
+	if isinstance(measure, Exception):
+		raise measure
+	return measure
+
+def summarizeLatencies(latencies):
+	"""
+	Computes throughput and latency statistics
+
+	:param latencies: Non-empty list of run durations, in seconds
+	:return: Dict with throughput (runs/s) and latency statistics (s)
+	"""
+	sorted_latencies = sorted(latencies)
+	total_time = sum(latencies)
+	return dict(
+	    throughput=len(latencies)/total_time if total_time > 0 else float("inf"),
+	    latency=dict(
+	        mean=total_time/len(latencies),
+	        min=sorted_latencies[0],
+	        p50=percentile(sorted_latencies, 50),
+	        p95=percentile(sorted_latencies, 95),
+	        p99=percentile(sorted_latencies, 99),
+	        max=sorted_latencies[-1]
+	    )
+	)
+
+# ───────
+# Helpers
+
+def throwIfAbsent(path):
+	if not os.path.exists(path):
+		sys.exit(path+" doesn't exist")
+
+def retentionPolicy(value):
+	if value in ("all", "repr", "callback", "log"):
+		return value
+	if value.startswith("keep:") and value[5:].isdigit():
+		return value
+	raise argparse.ArgumentTypeError("invalid result retention policy: %s"%value)
+
+# ──────
+# Parser
+
+def make_command_parser(parent_parser=argparse.ArgumentParser(description=DESCRIPTION)):
+
+	parent_parser.add_argument("GRAPH",
+	                                default="", type=str,
+	                                help="File describing the graph to process")
+	parent_parser.add_argument("--warmup",
+	                                default=3, type=int,
+	                                help="Number of runs before measuring, for each configuration")
+	parent_parser.add_argument("--repeat",
+	                                default=10, type=int,
+	                                help="Minimum number of measured runs, for each configuration")
+	parent_parser.add_argument("--duration",
+	                                default=0., type=float,
+	                                help="Minimum time (in s) spent measuring, for each configuration")
+	parent_parser.add_argument("--retention",
+	                                default=None, type=retentionPolicy, action="append",
+	                                help="Measure the peak memory of the whole sweep with a result retention policy: all, keep:<n>, repr, callback or log (can be repeated)")
+	parent_parser.add_argument("-o", "--output",
+	                                default="", type=str,
+	                                help="JSON file to write the report to")
+	parent_parser.set_defaults(func=benchAlgorithm)
+
+	return parent_parser
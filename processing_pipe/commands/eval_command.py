@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
 
 # Standard libraries
-import bisect
 import copy
 import glob
+import multiprocessing
 import os
 import time
 from warnings import warn
 
 # Third-party libraries
 import argparse
+import numpy
 import qidata
 from qidata import QiDataSet, isDataset, DataType
 from ecto_opencv import highgui
@@ -17,167 +18,150 @@ from ecto_opencv import cv_bp # is not used directly, but import cv python bindi
 from ecto_qidata import qidata_image
 
 # Local modules
+from processing_pipe.dataset_pack import DataSetPack, PackStager, isPack
 from processing_pipe.graph import Graph
-from processing_pipe.utils import loadJSONFile
+from processing_pipe.manifest import ManifestCache
+from processing_pipe.matching import locationMatrix, matchPairs
+from processing_pipe.utils import loadJSONFile, hashJSON, saveCheckpoint, loadCheckpoint, mergeStreams, groupStreams, prefetchStreams
 
 DESCRIPTION = "Evaluate a given processing graph"
 
-def createValueComparator(comparison_rule):
-	# Create comparator
-	if "" == comparison_rule[0]:
-		default_comparison = "True"
-		def get_annotation(x):
-			return x
-	else:
-		annotation_prop_type, annotation_prop_name=comparison_rule[0].split(":")
-		default_comparison = "Strict"
-		if "attr" == annotation_prop_type:
-			def get_annotation(x):
-				return getattr(x,annotation_prop_name)
-		elif "key" == annotation_prop_type:
-			def get_annotation(x):
-				return x[annotation_prop_name]
-		elif "item" == annotation_prop_type:
-			def get_annotation(x):
-				return x[int(annotation_prop_name)]
-
-	if "" == comparison_rule[1]:
-		def get_output(y):
-			return y
-	else:
-		output_prop_type, output_prop_name=comparison_rule[1].split(":")
-		if "attr" == output_prop_type:
-			def get_output(y):
-				return getattr(y,output_prop_name)
-
-		elif "key" == output_prop_type:
-			def get_output(y):
-				return y[output_prop_name]
-
-		elif "item" == output_prop_type:
-			def get_output(y):
-				return y[int(output_prop_name)]
-
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "processing_pipe")
+
+def createAccessor(address):
+	"""
+	Creates a function reading a property of a value
+
+	:param address: Comma-separated list of properties to read one after
+	the other, each given by "attr:<name>", "key:<name>" or "item:<index>".
+	The value itself is returned if empty.
+	"""
+	getters = []
+	for property_address in address.split(",") if "" != address else []:
+		property_type, property_name = property_address.split(":")
+		if "attr" == property_type:
+			getters.append(lambda x, name=property_name: getattr(x, name))
+		elif "key" == property_type:
+			getters.append(lambda x, name=property_name: x[name])
+		elif "item" == property_type:
+			getters.append(lambda x, index=int(property_name): x[index])
+		else:
+			raise RuntimeError("Invalid property address: %s"%property_address)
+
+	if len(getters) == 0:
+		return lambda x: x
+	if len(getters) == 1:
+		return getters[0]
+	def get_property(x):
+		for getter in getters:
+			x = getter(x)
+		return x
+	return get_property
+
+def _isPrimitive(value):
+	"""
+	Tells if values equal to this one all have its hash, and are all
+	found by a dict lookup (strings, numbers and tuples of them)
+	"""
+	if isinstance(value, float):
+		# NaN is not equal to itself
+		return value == value
+	if isinstance(value, (basestring, int, long, bool)) or value is None:
+		return True
+	if isinstance(value, tuple):
+		return all([_isPrimitive(v) for v in value])
+	return False
+
+def createValueMatcher(comparison_rule):
+	"""
+	Creates the functions telling which outputs have the value of which
+	annotations
+
+	:param comparison_rule: (annotation property, output property,
+	comparison mode) as given in the graph description
+	:return: (function reading the compared property of an annotation value,
+	function reading it from an output, function taking the properties of
+	all annotations and of all outputs, and returning a boolean array with a
+	row per annotation and a column per output), or None if all outputs
+	match all annotations
+	"""
+	get_annotation = createAccessor(comparison_rule[0])
+	get_output = createAccessor(comparison_rule[1])
+	default_comparison = "True" if "" == comparison_rule[0] else "Strict"
 	comparison_details = (default_comparison\
 	                         if "" == comparison_rule[2]\
 	                         else comparison_rule[2]).split(":")
 
-
 	if "True" == comparison_details[0]:
-		return lambda x,y: True
+		return None
 
 	elif "Strict" == comparison_details[0]:
-		return lambda x,y: get_annotation(x) == get_output(y)
+		def match(annotation_values, output_values):
+			if all([_isPrimitive(x) for x in annotation_values])\
+			   and all([_isPrimitive(y) for y in output_values]):
+				# Equal values get the same code, codes are compared at once
+				codes = dict()
+				coded_values = []
+				annotation_codes = []
+				for x in annotation_values:
+					if not codes.has_key(x):
+						codes[x] = len(coded_values)
+						coded_values.append(x)
+					annotation_codes.append(codes[x])
+				# The value found by the lookup is confirmed with ==
+				output_codes = []
+				for y in output_values:
+					code = codes.get(y, -1)
+					output_codes.append(code if code >= 0 and coded_values[code] == y else -1)
+				return numpy.array(annotation_codes, dtype=int)[:,numpy.newaxis]\
+				       == numpy.array(output_codes, dtype=int)[numpy.newaxis,:]
+			return numpy.array([
+			    [annotation_value == output_value for output_value in output_values]\
+			    for annotation_value in annotation_values
+			], dtype=bool).reshape(len(annotation_values), len(output_values))
 
 	elif "Loose" == comparison_details[0]:
 		try:
 			comparison_param = float(comparison_details[1])
-		except KeyError:
+		except IndexError:
 			warn("An additional parameter is necessary when using \"Loose\" comparison")
 			raise
 		except ValueError:
 			warn("Only numbers can be used as parameters for \"Loose\" comparison")
 			raise
-		return lambda x,y: get_annotation(x) >= get_output(y)-comparison_param\
-		                   and get_annotation(x) <= get_output(y)+comparison_param
+		def match(annotation_values, output_values):
+			annotation_values = numpy.array(annotation_values, dtype=float).reshape(-1, 1)
+			output_values = numpy.array(output_values, dtype=float).reshape(1, -1)
+			return (annotation_values >= output_values-comparison_param)\
+			       & (annotation_values <= output_values+comparison_param)
 	else:
-		raise Exception("Unsupported comparison mode %s"%comparison_type)
+		raise Exception("Unsupported comparison mode %s"%comparison_details[0])
 
-def createLocationComparator(annot_location):
-	# Create comparator
-	if "None" == annot_location:
-		def loc_compare(x,y):return True
-	else:
-		if "" == annot_location:
-			def get_output_location(x):
-				return x
-		else:
-			functions = []
-			def get_output_location(x):
-				for location_address in annot_location.split(","):
-					location_prop_type, location_prop_name=location_address.split(":")
-					if "attr" == location_prop_type:
-						x = getattr(x,location_prop_name)
-					elif "key" == location_prop_type:
-						x = x[location_prop_name]
-					elif "item" == location_prop_type:
-						x = x[int(location_prop_name)]
-					else:
-						raise RuntimeError("Invalid location value: %s"%location_address)
-				return x
-
-		def loc_compare(x,y):
-			if x is None:
-				return True
-			output_location = get_output_location(y)
-
-			# Annotation is a bounding box defined by the two extremal points
-			bbox_dimension = len(x[0])
-
-			if isinstance(output_location, cv_bp.Rect):
-				# If location is a cv::Rect, convert it to a list
-				output_location = [
-				  [output_location.tl().x, output_location.tl().y],
-				  [output_location.br().x, output_location.br().y]
-				]
-				out_loc_is_point = False
-				out_loc_dimension = len(output_location[0])
-
-			# From here on, output must be a list representing a point or a
-			# bounding box
-			elif len(output_location) != 2:
-				# output location is a point
-				out_loc_is_point = True
-				out_loc_dimension = len(output_location)
-			else:
-				if isinstance(output_location[0], list):
-					# output location is roi
-					out_loc_is_point = False
-					out_loc_dimension = len(output_location[0])
-				else:
-					# output location is a 2D point
-					out_loc_is_point = True
-					out_loc_dimension = 2
+	return get_annotation, get_output, match
 
-			if out_loc_dimension == bbox_dimension:
-				# Output location has the same dimension as annotation location
-				pass
-			else:
-				# TODO: projection needed
-				# Return false for now
-				return False
-
-			if out_loc_is_point:
-				# Output location is a point, make sure it is included in the
-				# annotation box
-				for i in range(bbox_dimension):
-					if output_location[i] < x[0][i]\
-					   or output_location[i] > x[1][i]:
-						return False
-			else:
-				# Output location is a roi
-				intersection_box = [None]*bbox_dimension
-				common_hyper_volume = 1
-				annot_hyper_volume = 1
-				out_hyper_volume = 1
-				for i in range(bbox_dimension):
-					if output_location[1][i] < x[0][i]\
-					   or x[1][i] < output_location[0][i]:
-						# No intersection between locations
-						return False
-
-					common_hyper_volume *= (
-					    min(x[1][i], output_location[1][i])\
-					    - max(x[0][i], output_location[0][i])
-					)
-					annot_hyper_volume *= (x[1][i]-x[0][i])
-					out_hyper_volume *= (output_location[1][i]-output_location[0][i])
-				return common_hyper_volume == out_hyper_volume\
-				       or (2*common_hyper_volume>annot_hyper_volume\
-				           and 2*common_hyper_volume>out_hyper_volume)
-			return True
+def createLocationGetter(annot_location):
+	"""
+	Creates a function reading the location of an output
 
-	return loc_compare
+	:param annot_location: Address of the location in the output (see
+	``createAccessor``), or "None" if locations are not compared
+	:return: Function returning a box given by its two extremal points, or
+	a point, or None if locations are not compared
+	"""
+	if "None" == annot_location:
+		return None
+	get_output_location = createAccessor(annot_location)
+
+	def get_location(y):
+		output_location = get_output_location(y)
+		if isinstance(output_location, cv_bp.Rect):
+			# If location is a cv::Rect, convert it to a list
+			output_location = [
+			  [output_location.tl().x, output_location.tl().y],
+			  [output_location.br().x, output_location.br().y]
+			]
+		return output_location
+	return get_location
 
 def specifyName(basetype, comparison_rule):
 	if "" == comparison_rule[0]:
@@ -222,37 +206,53 @@ class OutputDescription:
 		# Get output type
 		self.metadata_type = description["qidata_type"]
 
-		self.comparators = [createValueComparator(x) for x in comparison_rules]
-
-		def value_compare(x,y):
-			for comparator in self.comparators:
-				if not comparator(x,y):
-					return False
-			return True
-		self.value_match = value_compare
+		self.value_matchers = [
+		    value_matcher for value_matcher in map(createValueMatcher, comparison_rules)\
+		    if value_matcher is not None
+		]
 
 		# Get annotation location property
-		self.location_match = createLocationComparator(description.get("location", "None"))
+		self.get_location = createLocationGetter(description.get("location", "None"))
+
+	def getMatches(self, annotations, outputs):
+		"""
+		Tells which outputs match which annotations
+
+		:param annotations: List of (value, location) annotations
+		:param outputs: List of output values
+		:return: (matches, overlaps) arrays with a row per annotation and a
+		column per output (see ``matching.locationMatrix``)
+		"""
+		matches = numpy.ones((len(annotations), len(outputs)), dtype=bool)
+		overlaps = numpy.ones(matches.shape)
+		annotation_values = [annotation[0] for annotation in annotations]
+		# Properties are read once per annotation and output, not per pair
+		for get_annotation, get_output, value_matcher in self.value_matchers:
+			matches &= value_matcher([get_annotation(x) for x in annotation_values],
+			                         [get_output(y) for y in outputs])
+		if self.get_location is not None and matches.any():
+			location_matches, overlaps = locationMatrix(
+			    [annotation[1] for annotation in annotations],
+			    [self.get_location(y) for y in outputs]
+			)
+			matches &= location_matches
+		return matches, overlaps
 
 def compare(annotations, outputs, output_desc):
-	annotations = copy.deepcopy(annotations)
-	res = [0,0,0,0]
-
-	for output in outputs:
-		for i in range(len(annotations)):
-			annot = annotations[i]
-			if output_desc.location_match(annot[1], output)\
-			   and output_desc.value_match(annot[0], output):
-				res[0] += 1
-				break
-		else:
-			# If none was found, mark it and continue to iterate immediately
-			res[1] += 1
-			continue
-		annotations.pop(i)
-	res[2] += len(annotations)
-
-	return res
+	"""
+	Pairs outputs with annotations, maximizing the number of pairs first and
+	their overlap then
+
+	:return: [true positives, false positives, false negatives, 0]
+	"""
+	matches, overlaps = output_desc.getMatches(annotations, outputs)
+	true_positives = len(matchPairs(matches, overlaps))
+	return [
+	    true_positives,
+	    len(outputs) - true_positives,
+	    len(annotations) - true_positives,
+	    0
+	]
 
 def parseOutputDescription(outputs_description):
 	res = []
@@ -264,47 +264,45 @@ def parseOutputDescription(outputs_description):
 			res.append(OutputDescription(graph_output, graph_output.get("compare", [["","",""]])))
 	return res
 
-def validateInputSets(input_datasets, inputs_description, outputs_description):
+def validateInputSets(input_datasets, inputs_description, outputs_description, manifest):
 	out = []
 	try:
 		while 1:
 			input_qidataset = input_datasets.pop(0)
 
-			# Check if folder is a qidataset:
-			if not isDataset(input_qidataset):
+			# Check if folder is a qidataset, or a packed one:
+			if not isDataset(input_qidataset) and not isPack(input_qidataset):
 				print "%s is not a valid QiDataSet"%input_qidataset
 				continue
 
 			# Check if dataset provides annotations for outputs
 			# and required input datatypes
-			with qidata.QiDataSet(input_qidataset, "r") as _ds:
+			inputs_required_by_type = dict()
 
-				inputs_required_by_type = dict()
-
-				for input_desc in inputs_description:
-					if not inputs_required_by_type.has_key(input_desc["qidata_type"]):
-						inputs_required_by_type[input_desc["qidata_type"]] = 1
-					else:
-						inputs_required_by_type[input_desc["qidata_type"]] += 1
+			for input_desc in inputs_description:
+				if not inputs_required_by_type.has_key(input_desc["qidata_type"]):
+					inputs_required_by_type[input_desc["qidata_type"]] = 1
+				else:
+					inputs_required_by_type[input_desc["qidata_type"]] += 1
 
-				_all_required_data_available = True
-				for required_input_type, n in inputs_required_by_type.iteritems():
-					if len(_ds.getStreamsOfType(qidata.DataType[required_input_type])) < n:
-						_all_required_data_available = False
+			_all_required_data_available = True
+			for required_input_type, n in inputs_required_by_type.iteritems():
+				if len(manifest.getDataSetStreams(input_qidataset, required_input_type)) < n:
+					_all_required_data_available = False
 
-				if not _all_required_data_available:
-					print "%s dataset does not have all required data to run the given graph"%input_qidataset
-					continue
+			if not _all_required_data_available:
+				print "%s dataset does not have all required data to run the given graph"%input_qidataset
+				continue
 
-				_something_can_be_evaluated = False
-				for output_to_eval in outputs_description:
-					if output_to_eval is None: continue
+			_something_can_be_evaluated = False
+			for output_to_eval in outputs_description:
+				if output_to_eval is None: continue
 
-					for k, v in _ds.annotations_available.iteritems():
-						if not output_to_eval.metadata_type == k[1]:
-							continue
-						output_to_eval.can_be_evaluated_by.append((input_qidataset,k[0]))
-						_something_can_be_evaluated = True
+				for k in manifest.getDataSetAnnotations(input_qidataset):
+					if not output_to_eval.metadata_type == k[1]:
+						continue
+					output_to_eval.can_be_evaluated_by.append((input_qidataset,k[0]))
+					_something_can_be_evaluated = True
 
 			if not _something_can_be_evaluated:
 				print "Annotations is not complete enough in %s dataset to evaluate what you want"%input_qidataset
@@ -317,7 +315,7 @@ def validateInputSets(input_datasets, inputs_description, outputs_description):
 
 	return out
 
-def validateInputFiles(input_datafiles, input_description, outputs_description):
+def validateInputFiles(input_datafiles, input_description, outputs_description, manifest):
 	out = []
 	try:
 		while 1:
@@ -325,9 +323,9 @@ def validateInputFiles(input_datafiles, input_description, outputs_description):
 			# Check if file contains annotation for outputs
 			# and required input datatype
 			try:
-				with qidata.open(input_qidatafile, "r") as _f:
-					metadata = _f.annotations
-					file_qidatatype = _f.type
+				file_info = manifest.getFileInfo(input_qidatafile)
+				metadata = file_info["annotations"]
+				file_qidatatype = file_info["type"]
 			except TypeError:
 				# File is not supported by QiData. Skip !
 				print "%s is not a valid QiDataFile"%input_qidatafile
@@ -362,6 +360,9 @@ def validateInputFiles(input_datafiles, input_description, outputs_description):
 	return out
 
 def initEvaluationGraph(graph_description):
+	# Keep a copy to rebuild the graph in worker processes
+	pristine_description = copy.deepcopy(graph_description)
+
 	# Create graph based on JSON
 	graph = Graph.createFromDict(graph_description)
 
@@ -426,9 +427,24 @@ def initEvaluationGraph(graph_description):
 
 		input_provider_index += 1
 
+	graph.setFactory(initEvaluationGraph, pristine_description)
 	return graph
 
-def runOnFiles(graph, input_files):
+def setInputFrameCache(graph, input_count, max_bytes):
+	"""
+	Keeps the decoded images of the input providers, to share them between
+	the parameter combinations and datasets evaluated by the process
+
+	:param input_count: Number of graph inputs
+	:param max_bytes: Maximum size of the kept images (not kept if 0)
+	"""
+	if max_bytes > 0:
+		graph.setFrameCache(
+		    ["input_provider_%d"%i for i in range(input_count)],
+		    max_bytes
+		)
+
+def runOnFiles(graph, input_files, jobs=1):
 	# Set graph inputs
 	graph.setSwitchingParameters(
 	    "input_provider_0",
@@ -438,147 +454,186 @@ def runOnFiles(graph, input_files):
 
 	# Run !
 	start = time.time()
-	graph.run()
+	graph.run(workers=jobs)
 	return time.time() - start
 
-def runOnStreams(graph, streams, starting_ts):
-
-	# Init situation
-	while streams[0][0] <= starting_ts:
-		change = streams.pop(0)
-		input_to_set = change[1]
-		file_to_set = change[2]
-		graph.setSwitchingParameters(
-		    "input_provider_%d"%input_to_set,
-		    "image_file",
-		    [file_to_set]
-		)
+def runOnStreams(graph, streams, starting_ts, on_results, progress=None, on_progress=None,
+                 sync_tolerance=None, prefetch=0, stage=None):
+	"""
+	Runs the graph on each state of the streams, from the given time
+
+	A state is the set of files of the streams at a given time. Results are
+	given to ``on_results`` as they are obtained, and not kept.
+
+	:param streams: Iterable of (timestamp, input index, file path) of each
+	file, sorted by timestamp (see ``getDatasetStreams``)
+	:param on_results: Function called after each state was processed, with
+	its index, the list of (timestamp, input index, file path) of the files
+	that changed to reach it, and the list of results obtained on it (one per
+	parameter combination)
+	:param progress: Dict given to ``on_progress`` by an interrupted call, to
+	continue from it
+	:param on_progress: Function called after each state was processed, with
+	a dict containing the number of states processed and the processing time
+	:param sync_tolerance: If not None, changes of different inputs closer
+	than this time (in s) are applied together, to run the graph once per
+	synchronized frame. Otherwise, the graph is run after each change.
+	:param prefetch: Number of files read in background threads ahead of
+	the one the graph is run on, to hide disk latency
+	:param stage: Function returning the path the input provider reads a
+	file from, given the file path in the streams and the input index (see
+	``openDatasetFiles``). Files are read from their path in the streams if
+	None.
+	:return: (number of states, processing time)
+	"""
+	if prefetch > 0:
+		streams = prefetchStreams(streams, prefetch)
+	if sync_tolerance is None:
+		groups = ([change] for change in streams)
+	else:
+		groups = groupStreams(streams, sync_tolerance)
+	last_group = None
+	next_group = next(groups, None)
 
-	# Run !
-	processing_time = 0
-	current_ts = starting_ts
-	results = []
-	try:
-		while True:
-			before_run = time.time()
-			graph.run()
-			processing_time += time.time()-before_run
-			results.extend(graph.result)
-			change = streams.pop(0)
-			next_ts = change[0]
-			input_to_set = change[1]
-			file_to_set = change[2]
+	def apply_group(group):
+		for change in group:
 			graph.setSwitchingParameters(
-			    "input_provider_%d"%input_to_set,
+			    "input_provider_%d"%change[1],
 			    "image_file",
-			    [file_to_set]
+			    [change[2] if stage is None else stage(change[2], change[1])]
 			)
-			current_ts = next_ts
-	except IndexError:
-		# Files have all been used
-		pass
-	return results, processing_time
-
-def evaluateOnFiles(output_descriptions, results, inputs, proc_time):
+		return group, next(groups, None)
 
-	run_per_file = len(results) / len(inputs)
-	mean_execution_time = proc_time / len(results)
-	evaluation = dict()
-	evaluation["_time_"]=mean_execution_time
-
-	for output_desc in output_descriptions:
-		if output_desc is None: continue
-		for _,brave_annotator in output_desc.can_be_evaluated_by:
-			if not output_desc.true_positives.has_key(brave_annotator):
-				output_desc.true_positives[brave_annotator] = [0]*run_per_file
-				output_desc.false_negatives[brave_annotator] = [0]*run_per_file
-				output_desc.false_positives[brave_annotator] = [0]*run_per_file
+	# Init situation
+	while next_group is not None and next_group[0][0] <= starting_ts:
+		last_group, next_group = apply_group(next_group)
 
-	for file_index in range(len(inputs)):
-		input_qidatafile = inputs[file_index]
-		with qidata.open(input_qidatafile, "r") as _f:
-			annotations = _f.annotations
+	# Run !
+	# Without parameters to sweep, only re-execute what each change affects
+	single_combination = (1 == graph.countParamCombinations())
+	processing_time = 0
+	position = 0
+	if progress is not None:
+		# Replay the changes leading to the first state not processed
+		position = progress["position"]
+		processing_time = progress["processing_time"]
+		for _ in range(position):
+			if next_group is None:
+				# All states were processed
+				return position, processing_time
+			last_group, next_group = apply_group(next_group)
+	while True:
+		before_run = time.time()
+		if single_combination:
+			results = [graph.step()]
+		else:
+			graph.run()
+			results = graph.result
+		processing_time += time.time()-before_run
+		on_results(position, last_group, results)
+		position += 1
+		if on_progress is not None:
+			on_progress(dict(
+			    position=position,
+			    processing_time=processing_time
+			))
+		if next_group is None:
+			break
+		last_group, next_group = apply_group(next_group)
+	return position, processing_time
+
+def countResult(output_descriptions, annotators, annotations, result, configuration_index):
+	"""
+	Compares the outputs of a result with the annotations of its input, and
+	adds the outcome to the counters of the output descriptions
+
+	:param annotators: Dict associating each output description to the
+	annotators of the input that can evaluate it
+	:param annotations: Annotations of the input
+	:param result: Result dict, with an ``outputs`` key
+	:param configuration_index: Index of the parameter combination used
+	"""
+	for (out_description, graph_output) in zip(output_descriptions, result["outputs"]):
+		if out_description is None: continue
+		if not out_description.is_list:
+			graph_output = [graph_output]
+
+		for annotator in annotators[out_description]:
+			try:
+				annotation_list = annotations[annotator][out_description.metadata_type]
+			except KeyError:
+				annotation_list = []
+			res = compare(annotation_list, graph_output, out_description)
+			out_description.true_positives[annotator][configuration_index] += res[0]
+			out_description.false_positives[annotator][configuration_index] += res[1]
+			out_description.false_negatives[annotator][configuration_index] += res[2]
+
+def createFileScorer(output_descriptions, run_per_file, manifest):
+	"""
+	Creates a function counting the results obtained on independent files,
+	to be given as callback to ``Graph.setResultRetention``
+
+	The file of a result is read from its parameters, as files are swept
+	like any parameter of the input provider. Combinations of the other
+	parameters come in the same order for every file, the n-th result of a
+	file is counted as the n-th configuration. Counters of the output
+	descriptions are updated in place.
+
+	:param run_per_file: Number of parameter combinations run on each file
+	:return: (scoring function, dict giving the number of results scored
+	on each file)
+	"""
+	initCounters(output_descriptions, run_per_file)
+	scored = dict()
+
+	def score(result):
+		input_qidatafile = result["params"]["input_provider_0.image_file"]
+		annotations = manifest.getFileInfo(input_qidatafile)["annotations"]
 
 		# Retrieve annotators of this file that annotates the type we want
 		annotators = dict()
 		for output_desc in output_descriptions:
 			if output_desc is None: continue
 			annotators[output_desc] = [x[1] for x in output_desc.can_be_evaluated_by if x[0]==input_qidatafile]
-			# for _f, brave_annotator in output_to_eval.can_be_evaluated_by:
-			# 	if _f == input_qidatafile:
-			# 		annotators[output_desc].append(brave_annotator)
-
-		for i in range(run_per_file):
-			result = results[run_per_file*file_index + i]
-
-			outputs = []
-			for (out_description, graph_output) in zip(output_descriptions, result["outputs"]):
-				if out_description is None: continue
-				if not out_description.is_list:
-					graph_output = [graph_output]
-
-				for annotator in annotators[out_description]:
-					try:
-						annotation_list = annotations[annotator][out_description.metadata_type]
-					except KeyError:
-						annotation_list = []
-					res = compare(annotation_list, graph_output, out_description)
-					out_description.true_positives[annotator][i] += res[0]
-					out_description.false_positives[annotator][i] += res[1]
-					out_description.false_negatives[annotator][i] += res[2]
 
-	print "Mean execution time: %f s"%evaluation["_time_"]
-	for output_desc in output_descriptions:
-		if output_desc is None: continue
-		evaluation[output_desc.name] = dict()
-		print "Output: %s"%(output_desc.name)
-		for brave_annotator in output_desc.true_positives.keys():
-			print "Annotator: %s"%brave_annotator
-			evaluation[output_desc.name][brave_annotator] = list()
-			for i in range(run_per_file):
-				print "Configuration: %d"%(i+1)
-				evaluation[output_desc.name][brave_annotator].append(
-				  dict(
-				    sensitivity=(
-				      output_desc.true_positives[brave_annotator][i],
-				      output_desc.true_positives[brave_annotator][i]\
-				       + output_desc.false_negatives[brave_annotator][i]
-				    ),
-				    fdr=(
-				      output_desc.false_positives[brave_annotator][i],
-				      output_desc.true_positives[brave_annotator][i]\
-				       + output_desc.false_positives[brave_annotator][i]
-				    )
-				  )
-				)
-				try:
-					print "Sensitivity: %f%% (%d/%d)"%(
-						100*float(output_desc.true_positives[brave_annotator][i])/float(output_desc.true_positives[brave_annotator][i]+output_desc.false_negatives[brave_annotator][i]),
-						output_desc.true_positives[brave_annotator][i],
-						output_desc.true_positives[brave_annotator][i]+output_desc.false_negatives[brave_annotator][i]
-					)
-				except ZeroDivisionError:
-					print "Sensitivity: N/A"
+		configuration_index = scored.get(input_qidatafile, 0)
+		countResult(output_descriptions,
+		            annotators,
+		            annotations,
+		            result,
+		            configuration_index)
+		scored[input_qidatafile] = configuration_index + 1
 
-				try:
-					print "False Discovery Rate: %f%% (%d/%d)"%(
-						100*float(output_desc.false_positives[brave_annotator][i])/float(output_desc.false_positives[brave_annotator][i]+output_desc.true_positives[brave_annotator][i]),
-						output_desc.false_positives[brave_annotator][i],
-						output_desc.false_positives[brave_annotator][i]+output_desc.true_positives[brave_annotator][i]
-					)
-				except ZeroDivisionError:
-					print "False Discovery Rate: N/A"
+	return score, scored
 
-	return evaluation
+def createStreamScorer(output_descriptions, qidataset, run_per_file, manifest):
+	"""
+	Creates a function counting the results obtained on each state of the
+	streams, to be given to ``runOnStreams``
 
-def evaluateOnStreams(output_descriptions, results, qidataset, streams, start_ts, proc_time):
+	Each state is evaluated with the annotations of the file that changed
+	to reach it, or of the first input among those that changed together.
+	Counters of the output descriptions are updated in place.
 
-	streams = streams[bisect.bisect_right([x[0] for x in streams], start_ts)-1:]
-	run_per_file = len(results) / len(streams)
-	mean_execution_time = proc_time / len(results)
-	evaluation = dict()
-	evaluation["_time_"] = mean_execution_time
+	:param run_per_file: Number of parameter combinations run on each state
+	"""
+	initCounters(output_descriptions, run_per_file)
 
+	# Retrieve annotators of this dataset that annotates the type we want
+	annotators = dict()
+	for output_desc in output_descriptions:
+		if output_desc is None: continue
+		annotators[output_desc] = [x[1] for x in output_desc.can_be_evaluated_by if x[0]==qidataset]
+
+	def score(position, changes, results):
+		changed_file = min(changes, key=lambda change: change[1])[2]
+		annotations = manifest.getFileInfo(changed_file)["annotations"]
+		for i in range(len(results)):
+			countResult(output_descriptions, annotators, annotations, results[i], i)
+
+	return score
+
+def initCounters(output_descriptions, run_per_file):
 	for output_desc in output_descriptions:
 		if output_desc is None: continue
 		for _,brave_annotator in output_desc.can_be_evaluated_by:
@@ -587,35 +642,44 @@ def evaluateOnStreams(output_descriptions, results, qidataset, streams, start_ts
 				output_desc.false_negatives[brave_annotator] = [0]*run_per_file
 				output_desc.false_positives[brave_annotator] = [0]*run_per_file
 
-	for file_index in range(len(streams)):
-		input_qidatafile = streams[file_index][2]
-		with qidata.open(input_qidatafile, "r") as _f:
-			annotations = _f.annotations
+def setCounters(output_descriptions, counters):
+	for output_desc, output_counters in zip(output_descriptions, counters):
+		if output_desc is None: continue
+		(output_desc.true_positives,
+		 output_desc.false_negatives,
+		 output_desc.false_positives) = copy.deepcopy(output_counters)
+
+def getCounters(output_descriptions):
+	return [
+	    None if output_desc is None else (
+	        output_desc.true_positives,
+	        output_desc.false_negatives,
+	        output_desc.false_positives
+	    ) for output_desc in output_descriptions
+	]
+
+def mergeCounters(output_descriptions, counters):
+	# Add counters obtained with other instances of the output descriptions
+	for output_desc, output_counters in zip(output_descriptions, counters):
+		if output_desc is None: continue
+		for total, partial in zip(getCounters([output_desc])[0], output_counters):
+			for annotator, counts in partial.iteritems():
+				if not total.has_key(annotator):
+					total[annotator] = [0]*len(counts)
+				for i in range(len(counts)):
+					total[annotator][i] += counts[i]
+
+def printFrameCacheStatistics(hits, misses):
+	if hits + misses > 0:
+		print "Frame cache: %d hits, %d misses (%.1f%% hit rate)"%(
+		    hits,
+		    misses,
+		    100.*hits/(hits+misses)
+		)
 
-		# Retrieve annotators of this file that annotates the type we want
-		annotators = dict()
-		for output_desc in output_descriptions:
-			if output_desc is None: continue
-			annotators[output_desc] = [x[1] for x in output_desc.can_be_evaluated_by if x[0]==qidataset]
-
-		for i in range(run_per_file):
-			result = results[run_per_file*file_index + i]
-
-			outputs = []
-			for (out_description, graph_output) in zip(output_descriptions, result["outputs"]):
-				if out_description is None: continue
-				if not out_description.is_list:
-					graph_output = [graph_output]
-
-				for annotator in annotators[out_description]:
-					try:
-						annotation_list = annotations[annotator][out_description.metadata_type]
-					except KeyError:
-						annotation_list = []
-					res = compare(annotation_list, graph_output, out_description)
-					out_description.true_positives[annotator][i] += res[0]
-					out_description.false_positives[annotator][i] += res[1]
-					out_description.false_negatives[annotator][i] += res[2]
+def reportEvaluation(output_descriptions, run_per_file, mean_execution_time):
+	evaluation = dict()
+	evaluation["_time_"] = mean_execution_time
 
 	print "Mean execution time: %f s"%evaluation["_time_"]
 	for output_desc in output_descriptions:
@@ -661,6 +725,262 @@ def evaluateOnStreams(output_descriptions, results, qidataset, streams, start_ts
 
 	return evaluation
 
+def getDatasetStreams(input_dataset, inputs_description, manifest):
+	"""
+	Lists the files of the dataset streams feeding each graph input
+
+	:param input_dataset: Path of the QiDataSet
+	:param inputs_description: Inputs of the evaluation graph description
+	:param manifest: ManifestCache listing the dataset streams
+	:return: Generator of (timestamp, input index, file path) of each file,
+	sorted by timestamp, and the timestamp from which all inputs have a file
+	"""
+	input_types_index = dict()
+	input_to_stream_map = list()
+	for graph_input in inputs_description:
+		input_data_type = graph_input["qidata_type"]
+		if not input_types_index.has_key(input_data_type):
+			input_types_index[input_data_type] = 0
+		else:
+			input_types_index[input_data_type] += 1
+
+		input_to_stream_map.append(
+		    manifest.getDataSetStreams(
+		        input_dataset,
+		        input_data_type
+		    )[input_types_index[input_data_type]]
+		)
+
+	start_ts = max([min(x.keys()) for x in input_to_stream_map])
+	start_ts = float(start_ts[0])+float(start_ts[1])/1000000000
+	return mergeStreams(input_to_stream_map, input_dataset), start_ts
+
+def openDatasetFiles(input_dataset):
+	"""
+	Prepares the files of a dataset to be read by the input providers
+
+	The files of a dataset pack are written one at a time in a temporary
+	folder, as the input providers only read files given by their path.
+
+	:param input_dataset: Path of the QiDataSet or dataset pack
+	:return: (function to give to ``runOnStreams`` or None, function to call
+	once done with the dataset)
+	"""
+	if not isPack(input_dataset):
+		return None, lambda: None
+	stager = PackStager(DataSetPack(input_dataset))
+	return stager.stage, stager.close
+
+def initWorkerGraph(graph_description, cache_settings, frame_cache_size):
+	"""
+	Creates an evaluation graph in a worker process, with the caches of the
+	main one
+
+	:param graph_description: Graph description as loaded, modified as by
+	``initEvaluationGraph``
+	:param cache_settings: Result cache (folder, key, size in bytes), or None
+	:param frame_cache_size: Maximum size (in bytes) of the frame cache
+	"""
+	graph = initEvaluationGraph(graph_description)
+	setInputFrameCache(graph, len(graph_description["inputs"]), frame_cache_size)
+	if cache_settings is not None:
+		graph.setResultCache(cache_settings[0],
+		                     key=cache_settings[1],
+		                     max_bytes=cache_settings[2])
+	return graph
+
+def getStreamStates(streams, starting_ts, sync_tolerance=None):
+	"""
+	Lists the states of the streams processed by ``runOnStreams``
+
+	:param streams: Iterable of (timestamp, input index, file path) of each
+	file, sorted by timestamp
+	:param starting_ts: Time of the first state
+	:param sync_tolerance: See ``runOnStreams``
+	:return: List of (list of the changes to reach the state, dict
+	associating each input index to its file path in the state)
+	"""
+	if sync_tolerance is None:
+		groups = ([change] for change in streams)
+	else:
+		groups = groupStreams(streams, sync_tolerance)
+	states = []
+	files = dict()
+	for group in groups:
+		for change in group:
+			files[change[1]] = change[2]
+		if group[0][0] <= starting_ts:
+			# Only the state reached at the starting time is processed
+			states = [(group, dict(files))]
+		else:
+			states.append((group, dict(files)))
+	return states
+
+def initWorkerOutputs(graph_description, can_be_evaluated_by):
+	"""
+	Creates the output descriptions of an evaluation graph in a worker
+	process, with the annotators found by the main one
+
+	:param graph_description: Graph description as loaded
+	:param can_be_evaluated_by: Annotators able to evaluate each output
+	"""
+	outputs_description = parseOutputDescription(graph_description["outputs"])
+	for output_desc, annotators in zip(outputs_description, can_be_evaluated_by):
+		if output_desc is None: continue
+		output_desc.can_be_evaluated_by = annotators
+	return outputs_description
+
+def _runStreamStates(job):
+	"""
+	Runs a graph on consecutive states of the streams and scores the
+	results, in a worker process
+
+	Results are compared with the annotations in the worker, only counters
+	are sent back, as outputs may not be picklable.
+
+	:param job: (graph description as loaded, dataset path, annotators able
+	to evaluate each output, result cache settings or None, manifest folder,
+	frame cache size, states as given by ``getStreamStates``)
+	:return: (counters of these states only, processing time)
+	"""
+	(graph_description, input_dataset, can_be_evaluated_by, cache_settings,
+	 manifest_dir, frame_cache_size, states) = job
+	manifest = ManifestCache(manifest_dir)
+	graph_description = copy.deepcopy(graph_description)
+	outputs_description = initWorkerOutputs(graph_description, can_be_evaluated_by)
+	graph = initWorkerGraph(graph_description, cache_settings, frame_cache_size)
+	single_combination = (1 == graph.countParamCombinations())
+	score = createStreamScorer(outputs_description,
+	                           input_dataset,
+	                           graph.countParamCombinations(),
+	                           manifest)
+	stage, close_dataset = openDatasetFiles(input_dataset)
+	processing_time = 0
+	applied_files = dict()
+	try:
+		for position, (changes, files) in enumerate(states):
+			for input_index, file_path in files.iteritems():
+				if applied_files.get(input_index) == file_path:
+					continue
+				graph.setSwitchingParameters(
+				    "input_provider_%d"%input_index,
+				    "image_file",
+				    [file_path if stage is None else stage(file_path, input_index)]
+				)
+			applied_files = files
+			before_run = time.time()
+			if single_combination:
+				results = [graph.step()]
+			else:
+				graph.run()
+				results = graph.result
+			processing_time += time.time()-before_run
+			score(position, changes, results)
+	finally:
+		close_dataset()
+	return getCounters(outputs_description), processing_time
+
+def runOnStreamsInPool(pool, jobs, graph_description, input_dataset, streams, starting_ts,
+                       outputs_description, manifest_dir, progress=None, on_progress=None,
+                       sync_tolerance=None, cache_settings=None, frame_cache_size=0):
+	"""
+	Evaluates a stateless graph on each state of the streams, in worker
+	processes
+
+	States are split in consecutive chunks, each run and scored by a graph
+	rebuilt in a worker process. As the graph does not depend on the
+	previous states, the counters of the chunks, added to those of the
+	output descriptions, are the same as with ``runOnStreams`` and
+	``createStreamScorer``.
+
+	:param pool: multiprocessing.Pool running the chunks
+	:param jobs: Number of processes of the pool
+	:param graph_description: Graph description as loaded
+	:param input_dataset: Path of the QiDataSet or dataset pack
+	:param outputs_description: Output descriptions whose counters are
+	updated, once each chunk is done
+	:param manifest_dir: Folder of the manifests read by the processes
+	:param on_progress: Function called after each chunk was counted, see
+	``runOnStreams``
+	:param cache_settings: Result cache (folder, key, size in bytes), or None
+	:param frame_cache_size: Maximum size (in bytes) of the frame cache of
+	each process
+	:return: (number of states, processing time summed over the processes)
+
+	See ``runOnStreams`` for other parameters.
+	"""
+	states = getStreamStates(streams, starting_ts, sync_tolerance)
+	position = 0
+	processing_time = 0
+	if progress is not None:
+		position = progress["position"]
+		processing_time = progress["processing_time"]
+
+	can_be_evaluated_by = [
+	    None if output_desc is None else output_desc.can_be_evaluated_by\
+	    for output_desc in outputs_description
+	]
+	# Several chunks per process, so that processes finishing first take
+	# the remaining ones
+	chunk_size = max(1, -(-(len(states)-position) // (4*jobs)))
+	chunk_jobs = [
+	    (graph_description, input_dataset, can_be_evaluated_by, cache_settings,
+	     manifest_dir, frame_cache_size, states[first:first+chunk_size])\
+	    for first in range(position, len(states), chunk_size)
+	]
+	for counters, chunk_processing_time in pool.imap(_runStreamStates, chunk_jobs):
+		mergeCounters(outputs_description, counters)
+		processing_time += chunk_processing_time
+		position = min(position+chunk_size, len(states))
+		if on_progress is not None:
+			on_progress(dict(
+			    position=position,
+			    processing_time=processing_time
+			))
+	return position, processing_time
+
+def _evaluateDataset(job):
+	"""
+	Evaluates a graph on one dataset, in a worker process
+
+	:param job: (graph description as loaded, dataset path, annotators able
+	to evaluate each output, result cache settings or None, manifest folder,
+	synchronization tolerance, number of prefetched files, frame cache size)
+	:return: (counters of this dataset only, runs per file, mean execution
+	time, frame cache statistics or None)
+	"""
+	(graph_description, input_dataset, can_be_evaluated_by, cache_settings,
+	 manifest_dir, sync_tolerance, prefetch, frame_cache_size) = job
+	manifest = ManifestCache(manifest_dir)
+	graph_description = copy.deepcopy(graph_description)
+	outputs_description = initWorkerOutputs(graph_description, can_be_evaluated_by)
+	graph = initWorkerGraph(graph_description, cache_settings, frame_cache_size)
+
+	streams, start_ts = getDatasetStreams(input_dataset, graph_description["inputs"], manifest)
+	run_per_file = graph.countParamCombinations()
+	score = createStreamScorer(outputs_description,
+	                           input_dataset,
+	                           run_per_file,
+	                           manifest)
+	stage, close_dataset = openDatasetFiles(input_dataset)
+	try:
+		state_count, processing_time = runOnStreams(graph,
+		                                            streams,
+		                                            start_ts,
+		                                            score,
+		                                            sync_tolerance=sync_tolerance,
+		                                            prefetch=prefetch,
+		                                            stage=stage)
+	finally:
+		close_dataset()
+	manifest.save()
+	return (
+	    getCounters(outputs_description),
+	    run_per_file,
+	    processing_time / (state_count*run_per_file),
+	    graph.frame_cache_statistics
+	)
+
 def evalAlgorithm(args):
 	# Prepare resulting evaluation dictionnary
 	eval_res = dict()
@@ -673,6 +993,8 @@ def evalAlgorithm(args):
 
 	# Read graph description (will raise if file is not a proper JSON file)
 	graph_description = loadJSONFile(args.GRAPH)
+	graph_hash = hashJSON(graph_description)
+	original_description = copy.deepcopy(graph_description)
 
 	# If there is more than one input, do not use given files
 	if len(graph_description["inputs"])>1 and len(input_datafiles)>0:
@@ -684,69 +1006,252 @@ def evalAlgorithm(args):
 
 	# Create graph based on JSON and adapt it to evaluation
 	graph = initEvaluationGraph(graph_description)
+	setInputFrameCache(graph,
+	                   len(graph_description["inputs"]),
+	                   args.frame_cache*1024*1024)
+	if args.profile:
+		graph.enableProfiling()
+	# Outputs of a stateless graph only depend on the current frame
+	stateless = graph_description.get("stateless", False)
+	process_count = args.jobs
+	if args.jobs > 1 and not stateless:
+		# Processes would each run a new graph on part of the data, while a
+		# single graph carries its state from one frame and dataset to the next
+		warn("Graphs not declared stateless are evaluated by a single process")
+		process_count = 1
+	cache_settings = None
+	if args.cache and not stateless:
+		# Cached outputs are restored without executing the cells, which
+		# would then miss the frames they were computed on
+		warn("The output cache is only used with graphs declared stateless")
+	elif args.cache:
+		# Input files are parameters of the input providers, identified by
+		# their content
+		cache_settings = (
+		    os.path.join(args.cache_dir, "outputs"),
+		    graph_hash,
+		    args.cache_size*1024*1024
+		)
+		graph.setResultCache(cache_settings[0],
+		                     key=cache_settings[1],
+		                     max_bytes=cache_settings[2])
+
+	# Types, streams and annotations of the data, read once and kept until
+	# files change
+	manifest_dir = os.path.join(args.cache_dir, "manifests")
+	manifest = ManifestCache(manifest_dir)
 
 	# Filter out datasets that can't be used for evaluation
 	valid_input_datasets = validateInputSets(input_datasets,
 	                                         graph_description["inputs"],
-	                                         outputs_description)
+	                                         outputs_description,
+	                                         manifest)
 
 	# Filter out datafiles that can't be used for evaluation
 	valid_input_datafiles = validateInputFiles(input_datafiles,
 	                                           graph_description["inputs"],
-	                                           outputs_description)
+	                                           outputs_description,
+	                                           manifest)
+	manifest.save()
 
 	if len(valid_input_datasets) == 0 and len(valid_input_datafiles) == 0:
 		raise Exception(
 		    "None of the given data can be used to evaluate the given graph"
 		)
 
+	# Evaluation state, saved when a dataset is done and periodically while
+	# running on its streams
+	checkpoint_key = hashJSON(dict(
+	    graph=graph_hash,
+	    datasets=valid_input_datasets,
+	    files=valid_input_datafiles,
+	    sync_tolerance=args.sync_tolerance
+	))
+	checkpoint = None
+	if args.checkpoint and args.resume:
+		checkpoint = loadCheckpoint(args.checkpoint, checkpoint_key)
+	if checkpoint is None:
+		checkpoint = dict(key=checkpoint_key, datasets=dict(), counters=None, stream=None)
+	elif checkpoint["counters"] is not None:
+		# Evaluation counters are accumulated from one dataset to the next
+		setCounters(outputs_description, checkpoint["counters"])
+	last_checkpoint_time = [time.time()]
+
+	def save_checkpoint():
+		checkpoint["counters"] = getCounters(outputs_description)
+		saveCheckpoint(checkpoint, args.checkpoint)
+		last_checkpoint_time[0] = time.time()
+
 	# Run the graph
+	pending_datasets = [
+	    input_dataset for input_dataset in valid_input_datasets\
+	        if not checkpoint["datasets"].has_key(input_dataset)
+	]
 	for input_dataset in valid_input_datasets:
-		input_types_index = dict()
-		input_to_stream_map = list()
-		for graph_input in graph_description["inputs"]:
-			input_data_type = qidata.DataType[graph_input["qidata_type"]]
-			if not input_types_index.has_key(input_data_type):
-				input_types_index[input_data_type] = 0
+		if checkpoint["datasets"].has_key(input_dataset):
+			# Evaluated before being interrupted
+			eval_res[input_dataset] = checkpoint["datasets"][input_dataset]
+
+	# Frames of a stateless graph can be processed in any order, they are
+	# shared between processes when datasets are too few to keep them busy
+	if process_count > 1 and len(pending_datasets) >= process_count:
+		# Each worker process evaluates whole datasets with its own graph.
+		# Counters are accumulated from one dataset to the next, so they are
+		# merged in the same order as in a serial evaluation.
+		if checkpoint["stream"] is not None:
+			# Drop what was counted on the interrupted dataset, it is
+			# evaluated again from its start
+			setCounters(outputs_description, checkpoint["stream"]["counters"])
+			checkpoint["stream"] = None
+		jobs = [(
+		    original_description,
+		    input_dataset,
+		    [
+		        None if output_desc is None else output_desc.can_be_evaluated_by\
+		        for output_desc in outputs_description
+		    ],
+		    cache_settings,
+		    manifest_dir,
+		    args.sync_tolerance,
+		    args.prefetch,
+		    args.frame_cache*1024*1024
+		) for input_dataset in pending_datasets]
+		worker_frame_cache_lookups = [0, 0]
+		pool = multiprocessing.Pool(process_count)
+		try:
+			for input_dataset, (counters, run_per_file, mean_execution_time, frame_cache_statistics)\
+			    in zip(pending_datasets, pool.imap(_evaluateDataset, jobs)):
+				mergeCounters(outputs_description, counters)
+				if frame_cache_statistics is not None:
+					worker_frame_cache_lookups[0] += frame_cache_statistics["hits"]
+					worker_frame_cache_lookups[1] += frame_cache_statistics["misses"]
+				eval_res[input_dataset] = reportEvaluation(outputs_description,
+				                                            run_per_file,
+				                                            mean_execution_time)
+				if args.checkpoint:
+					checkpoint["datasets"][input_dataset] = eval_res[input_dataset]
+					checkpoint["stream"] = None
+					save_checkpoint()
+		except BaseException:
+			pool.terminate()
+			raise
+		else:
+			pool.close()
+		finally:
+			pool.join()
+		pending_datasets = []
+		printFrameCacheStatistics(*worker_frame_cache_lookups)
+
+	for input_dataset in pending_datasets:
+		streams, start_ts = getDatasetStreams(input_dataset, graph_description["inputs"], manifest)
+
+		# Counters are updated as results are obtained, and saved with the
+		# position in the streams
+		progress = None
+		if checkpoint["stream"] is not None\
+		   and checkpoint["stream"]["dataset"] == input_dataset:
+			progress = checkpoint["stream"]
+		dataset_start_counters = copy.deepcopy(getCounters(outputs_description))\
+		                         if progress is None else progress["counters"]
+
+		def on_progress(stream_progress):
+			if not args.checkpoint\
+			   or time.time() - last_checkpoint_time[0] < args.checkpoint_interval:
+				return
+			checkpoint["stream"] = dict(
+			    dataset=input_dataset,
+			    counters=dataset_start_counters,
+			    **stream_progress
+			)
+			save_checkpoint()
+
+		run_per_file = graph.countParamCombinations()
+		score = createStreamScorer(outputs_description,
+		                           input_dataset,
+		                           run_per_file,
+		                           manifest)
+		if process_count > 1:
+			# Processes read the dataset manifest written so far
+			manifest.save()
+			pool = multiprocessing.Pool(process_count)
+			try:
+				state_count, processing_time = runOnStreamsInPool(pool,
+				                                                  process_count,
+				                                                  original_description,
+				                                                  input_dataset,
+				                                                  streams,
+				                                                  start_ts,
+				                                                  outputs_description,
+				                                                  manifest_dir,
+				                                                  progress,
+				                                                  on_progress,
+				                                                  args.sync_tolerance,
+				                                                  cache_settings,
+				                                                  args.frame_cache*1024*1024)
+			except BaseException:
+				pool.terminate()
+				raise
 			else:
-				input_types_index[input_data_type] += 1
-
-			with QiDataSet(input_dataset, "r") as _ds:
-				input_to_stream_map.append(
-				    _ds.getStreamsOfType(
-				        input_data_type
-				    ).values()[input_types_index[input_data_type]]
-				)
-
-		streams = [
-		  (
-		    float(ts[0])+float(ts[1])/1000000000,
-		    input_index,
-		    os.path.join(input_dataset, filename)
-		  ) for input_index in range(len(input_to_stream_map))\
-		      for ts,filename in input_to_stream_map[input_index].iteritems()
-		]
-		streams = sorted(streams)
-		start_ts = max([sorted(x.keys())[0] for x in input_to_stream_map])
-		start_ts = float(start_ts[0])+float(start_ts[1])/1000000000
-
-		results, processing_time = runOnStreams(graph, sorted(streams), start_ts)
-
-		eval_res[input_dataset] = evaluateOnStreams(outputs_description,
-		                                            results,
-		                                            input_dataset,
-		                                            streams,
-		                                            start_ts,
-		                                            processing_time)
+				pool.close()
+			finally:
+				pool.join()
+		else:
+			stage, close_dataset = openDatasetFiles(input_dataset)
+			try:
+				state_count, processing_time = runOnStreams(graph,
+				                                            streams,
+				                                            start_ts,
+				                                            score,
+				                                            progress,
+				                                            on_progress,
+				                                            args.sync_tolerance,
+				                                            args.prefetch,
+				                                            stage)
+			finally:
+				close_dataset()
+
+		eval_res[input_dataset] = reportEvaluation(outputs_description,
+		                                           run_per_file,
+		                                           processing_time / (state_count*run_per_file))
+		if args.checkpoint:
+			checkpoint["datasets"][input_dataset] = eval_res[input_dataset]
+			checkpoint["stream"] = None
+			save_checkpoint()
 
 	if len(valid_input_datafiles) > 0:
-		processing_time = runOnFiles(graph, valid_input_datafiles)
-
-		# Evaluate results
-		eval_res["_free_files_"] = evaluateOnFiles(outputs_description,
-		                                           graph.result,
-		                                           valid_input_datafiles,
-		                                           processing_time)
+		# Results are scored as they come, and not kept
+		graph.setSwitchingParameters("input_provider_0", "image_file", valid_input_datafiles)
+		run_per_file = graph.countParamCombinations() / len(valid_input_datafiles)
+		score, scored = createFileScorer(outputs_description, run_per_file, manifest)
+		graph.setResultRetention(keep=0, callback=score)
+		first_scored = [0]
+		if args.checkpoint:
+			def set_state(state):
+				setCounters(outputs_description, state[0])
+				scored.update(state[1])
+				first_scored[0] = sum(scored.itervalues())
+			graph.setCheckpoint(args.checkpoint+".files",
+			                    key=checkpoint_key,
+			                    interval=args.checkpoint_interval,
+			                    resume=args.resume,
+			                    get_state=lambda: (getCounters(outputs_description), scored),
+			                    set_state=set_state)
+		processing_time = runOnFiles(graph, valid_input_datafiles, process_count)
+
+		result_count = sum(scored.itervalues()) - first_scored[0]
+		eval_res["_free_files_"] = reportEvaluation(outputs_description,
+		                                            run_per_file,
+		                                            processing_time / max(1, result_count))
+
+	manifest.save()
+
+	if graph.frame_cache_statistics is not None:
+		printFrameCacheStatistics(graph.frame_cache_statistics["hits"],
+		                          graph.frame_cache_statistics["misses"])
+
+	if args.profile:
+		graph.profiler.printSummary()
+		graph.profiler.exportChromeTrace(args.profile)
 
 	return eval_res
 
@@ -760,7 +1265,51 @@ def make_command_parser(parent_parser=argparse.ArgumentParser(description=DESCRI
 
 	parent_parser.add_argument("--input-dataset",
 	                                default="", type=str,
-	                                help="QiDataSet to use")
+	                                help="QiDataSet or dataset pack (see the pack command) to use")
+
+	parent_parser.add_argument("-j", "--jobs",
+	                                default=1, type=int,
+	                                help="Number of processes evaluating datasets (or sharing the frames of each dataset when there are fewer datasets than processes), or sharing the parameter sweep on datafiles. Only used for graphs declared stateless, other graphs are evaluated by a single process.")
+
+	parent_parser.add_argument("--sync-tolerance",
+	                                default=None, type=float,
+	                                help="Group changes of the dataset streams closer than this time (in s), to run the graph once per synchronized frame instead of once per change")
+
+	parent_parser.add_argument("--prefetch",
+	                                default=0, type=int,
+	                                help="Number of dataset files read in background ahead of the graph (none by default)")
+
+	parent_parser.add_argument("--frame-cache",
+	                                default=0, type=int,
+	                                help="Maximum size (in MB) of the decoded input images kept in memory to be reused by other parameter combinations and datasets (disabled by default). Sizes are estimates, images wrapped in objects without a buffer may take more.")
+
+	parent_parser.add_argument("--profile",
+	                                default="", type=str,
+	                                help="Time each cell execution and write a Chrome trace to the given file")
+
+	parent_parser.add_argument("--checkpoint",
+	                                default="", type=str,
+	                                help="File to periodically save the progress of the evaluation to")
+
+	parent_parser.add_argument("--checkpoint-interval",
+	                                default=60., type=float,
+	                                help="Minimum time (in s) between two checkpoints")
+
+	parent_parser.add_argument("--resume",
+	                                action="store_true",
+	                                help="Continue from the checkpoint, if it was saved for the same graph and data")
+
+	parent_parser.add_argument("--cache-dir",
+	                                default=DEFAULT_CACHE_DIR, type=str,
+	                                help="Folder where outputs and dataset manifests are kept to be reused by later evaluations")
+
+	parent_parser.add_argument("--cache-size",
+	                                default=1024, type=int,
+	                                help="Maximum size (in MB) of the output cache folder")
+
+	parent_parser.add_argument("--cache",
+	                                action="store_true",
+	                                help="Read and write outputs in the output cache, to reuse them in later evaluations (only for graphs declared stateless)")
 
 	parent_parser.add_argument("GRAPH",
 	                                default="", type=str,
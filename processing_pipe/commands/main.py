@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 # Standard libraries
+import ast
+import pkgutil
 import pkg_resources as _pkg
 
 # Third-party libraries
@@ -12,9 +14,11 @@ from processing_pipe import VERSION
 DESCRIPTION = "Tool to design and run processing graphs. Very useful for testing and prototyping"
 SUBCOMMANDS = []
 
+# Subcommand modules are only imported when selected, as some of them depend
+# on heavy libraries
 for _ep in _pkg.iter_entry_points(group="processing.commands"):
 	_name = _pkg.EntryPoint.pattern.match(str(_ep)).groupdict()["name"]
-	SUBCOMMANDS.append([_ep.load(), _name])
+	SUBCOMMANDS.append([_ep, _name])
 
 class VersionAction(argparse.Action):
 	def __init__(self, option_strings, dest, nargs, **kwargs):
@@ -23,14 +27,53 @@ class VersionAction(argparse.Action):
 		version_string = VERSION + "\n"
 		parser.exit(message=version_string)
 
-def parser():
+def _readDescription(entry_point):
+	"""
+	Reads the DESCRIPTION of a subcommand module without importing it
+
+	:param entry_point: Entry point of the subcommand
+	:return: The description string
+	"""
+	loader = pkgutil.get_loader(entry_point.module_name)
+	source = loader.get_source(entry_point.module_name) if loader else None
+	if source is None:
+		# Only compiled code is available
+		return entry_point.load().DESCRIPTION
+	for node in ast.parse(source).body:
+		if isinstance(node, ast.Assign)\
+		   and "DESCRIPTION" in [getattr(t, "id", None) for t in node.targets]:
+			return ast.literal_eval(node.value)
+	return ""
+
+def parser(args=None):
+	"""
+	Builds the command line parser
+
+	:param args: Arguments to parse. When given, only the selected
+	subcommand module is imported to build its parser. Otherwise, all
+	subcommands are fully built.
+	"""
 	parser = argparse.ArgumentParser(description=DESCRIPTION)
 	subparsers = parser.add_subparsers()
+
+	selected_command = None
+	if args is not None:
+		positional_args = [a for a in args if not a.startswith("-")]
+		if len(positional_args) > 0:
+			selected_command = positional_args[0]
+
 	for sc in SUBCOMMANDS:
-		sub_parser = subparsers.add_parser(sc[1],
-		                                      description=sc[0].DESCRIPTION,
-		                                      help=sc[0].DESCRIPTION)
-		sc[0].make_command_parser(sub_parser)
+		if args is None or sc[1] == selected_command:
+			command_module = sc[0].load()
+			sub_parser = subparsers.add_parser(sc[1],
+			                                      description=command_module.DESCRIPTION,
+			                                      help=command_module.DESCRIPTION)
+			command_module.make_command_parser(sub_parser)
+		else:
+			description = _readDescription(sc[0])
+			subparsers.add_parser(sc[1],
+			                      description=description,
+			                      help=description)
 
 	parser.add_argument("-v", "--version", action=VersionAction, nargs=0,
 	                    help="print processing_pipe release version number")
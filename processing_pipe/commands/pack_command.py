@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Standard libraries
+import os
+import sys
+
+# Third-party libraries
+import argparse
+from qidata import isDataset
+
+# Local modules
+from processing_pipe.dataset_pack import PACK_EXTENSION, packDataSet
+from processing_pipe.manifest import ManifestCache
+
+DESCRIPTION = """Pack a QiDataSet in a single file, with its streams and
+annotations indexed, to evaluate graphs on it faster.
+"""
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "processing_pipe")
+
+def packAlgorithm(args):
+	if not isDataset(args.DATASET):
+		sys.exit(args.DATASET+" is not a valid QiDataSet")
+	output = args.output
+	if not output:
+		output = os.path.abspath(args.DATASET).rstrip(os.sep) + PACK_EXTENSION
+
+	manifest = ManifestCache(os.path.join(args.cache_dir, "manifests"))
+	file_count = packDataSet(args.DATASET, output, manifest)
+	manifest.save()
+	print "Packed %d files in %s (%d bytes)"%(file_count, output, os.path.getsize(output))
+	return output
+
+# ──────
+# Parser
+
+def make_command_parser(parent_parser=argparse.ArgumentParser(description=DESCRIPTION)):
+	parent_parser.add_argument("-o", "--output",
+	                                default="", type=str,
+	                                help="Pack file to write (the dataset path followed by %s by default)"%PACK_EXTENSION)
+
+	parent_parser.add_argument("--cache-dir",
+	                                default=DEFAULT_CACHE_DIR, type=str,
+	                                help="Folder where dataset manifests are kept to be reused by later commands")
+
+	parent_parser.add_argument("DATASET",
+	                                default="", type=str,
+	                                help="QiDataSet to pack")
+	parent_parser.set_defaults(func=packAlgorithm)
+
+	return parent_parser
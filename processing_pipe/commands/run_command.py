@@ -9,7 +9,7 @@ import argparse
 
 # Local modules
 from processing_pipe.graph import Graph
-from processing_pipe.utils import loadJSONFile
+from processing_pipe.utils import loadJSONFile, saveJSONFile, hashJSON
 
 DESCRIPTION = """Run given processing graph. The graph should be auto-sufficient
 and any declared input or output is ignored.
@@ -17,8 +17,54 @@ and any declared input or output is ignored.
 
 def runAlgorithm(args):
 	throwIfAbsent(args.GRAPH)
-	graph = Graph.createFromDict(loadJSONFile(args.GRAPH))
-	graph.run()
+	graph_description = loadJSONFile(args.GRAPH)
+	graph_hash = hashJSON(graph_description)
+	graph = Graph.createFromDict(graph_description)
+	if args.gray_code:
+		graph.setGrayCodeEnumeration()
+		executions = graph.countCellExecutions()
+		print "Cell executions: %d (%d saved by Gray-code enumeration)"%(
+		    executions,
+		    graph.countCellExecutions(gray_code=False) - executions
+		)
+
+	cell_costs = None
+	if args.calibrate:
+		cell_costs = graph.measureCellCosts()
+		if args.cell_costs:
+			saveJSONFile(cell_costs, args.cell_costs)
+	elif args.cell_costs:
+		throwIfAbsent(args.cell_costs)
+		cell_costs = loadJSONFile(args.cell_costs)
+	if cell_costs is not None:
+		graph.setCellCosts(cell_costs)
+		print "Predicted sweep cost: %f s (%f s with default ordering)"%(
+		    graph.predictSweepCost(cell_costs),
+		    graph.predictSweepCost(cell_costs, order_by_cost=False)
+		)
+
+	if args.output_cache > 0:
+		graph.setOutputCache(args.output_cache*1024*1024)
+
+	if args.profile:
+		graph.enableProfiling()
+
+	# Outputs are ignored, do not keep them
+	graph.setResultRetention(keep=0)
+	if args.cache_dir:
+		graph.setResultCache(args.cache_dir,
+		                     key=graph_hash,
+		                     max_bytes=args.cache_size*1024*1024)
+	if args.checkpoint:
+		graph.setCheckpoint(args.checkpoint,
+		                    key=graph_hash,
+		                    interval=args.checkpoint_interval,
+		                    resume=args.resume)
+	graph.run(workers=args.jobs)
+
+	if args.profile:
+		graph.profiler.printSummary()
+		graph.profiler.exportChromeTrace(args.profile)
 
 # ───────
 # Helpers
@@ -35,6 +81,39 @@ def make_command_parser(parent_parser=argparse.ArgumentParser(description=DESCRI
 	parent_parser.add_argument("GRAPH",
 	                                default="", type=str,
 	                                help="File describing the graph to process")
+	parent_parser.add_argument("-j", "--jobs",
+	                                default=1, type=int,
+	                                help="Number of processes sharing the parameter sweep")
+	parent_parser.add_argument("--gray-code",
+	                                action="store_true",
+	                                help="Change exactly one parameter value between two runs")
+	parent_parser.add_argument("--output-cache",
+	                                default=0, type=int,
+	                                help="Memory (in MB) used to reuse cell outputs computed with the same upstream parameters")
+	parent_parser.add_argument("--profile",
+	                                default="", type=str,
+	                                help="Time each cell execution and write a Chrome trace to the given file")
+	parent_parser.add_argument("--calibrate",
+	                                action="store_true",
+	                                help="Time each cell before the sweep to order swept parameters by cost")
+	parent_parser.add_argument("--cell-costs",
+	                                default="", type=str,
+	                                help="JSON file with the cost of each cell, used to order swept parameters (written when calibrating)")
+	parent_parser.add_argument("--cache-dir",
+	                                default="", type=str,
+	                                help="Folder where outputs are kept, combinations whose outputs are found there are not run again")
+	parent_parser.add_argument("--cache-size",
+	                                default=1024, type=int,
+	                                help="Maximum size (in MB) of the output cache folder")
+	parent_parser.add_argument("--checkpoint",
+	                                default="", type=str,
+	                                help="File to periodically save the progress of the sweep to")
+	parent_parser.add_argument("--checkpoint-interval",
+	                                default=60., type=float,
+	                                help="Minimum time (in s) between two checkpoints")
+	parent_parser.add_argument("--resume",
+	                                action="store_true",
+	                                help="Continue from the checkpoint, if it was saved for the same graph")
 	parent_parser.set_defaults(func=runAlgorithm)
 
 	return parent_parser
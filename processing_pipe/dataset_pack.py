@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+The dataset_pack module stores a QiDataSet in a single file, to replay it
+without listing, opening and parsing its files one by one
+"""
+
+# Standard libraries
+import cPickle
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+# Third-party libraries
+from qidata import DataType
+
+PACK_EXTENSION = ".qipack"
+
+_MAGIC = "QIDPACK1"
+_PREAMBLE = struct.Struct("<8sQQ") # magic, header offset, header size
+_ALIGNMENT = mmap.PAGESIZE
+
+def isPack(path):
+	"""
+	Tells if a path is a dataset pack
+
+	:param path: Path of a file or folder
+	"""
+	if not os.path.isfile(path):
+		return False
+	with open(path, "rb") as f:
+		return f.read(len(_MAGIC)) == _MAGIC
+
+def packDataSet(dataset_path, pack_path, manifest):
+	"""
+	Writes a QiDataSet in a single file
+
+	All files of the dataset folder are copied as they are (images stay
+	losslessly compressed), each starting at a page-aligned offset. The
+	streams of each type, sorted by timestamp, and the annotations of the
+	dataset and of its stream files are stored in the header, so that no
+	file needs to be parsed to evaluate a graph on the pack.
+
+	:param dataset_path: Path of the QiDataSet
+	:param pack_path: Path of the pack to write, replaced if it exists
+	:param manifest: ManifestCache reading the dataset
+	:return: Number of files packed
+	"""
+	streams = dict()
+	file_info = dict()
+	for data_type in DataType:
+		type_streams = manifest.getDataSetStreams(dataset_path, data_type.name)
+		if len(type_streams) == 0:
+			continue
+		streams[data_type.name] = [sorted(stream.iteritems()) for stream in type_streams]
+		for stream in type_streams:
+			for file_name in stream.itervalues():
+				file_info[file_name] = manifest.getFileInfo(
+				    os.path.join(dataset_path, file_name)
+				)
+
+	files = dict()
+	temporary_path = "%s.%d.tmp"%(pack_path, os.getpid())
+	with open(temporary_path, "wb") as pack_file:
+		pack_file.write(_PREAMBLE.pack(_MAGIC, 0, 0))
+		for file_name in sorted(os.listdir(dataset_path)):
+			file_path = os.path.join(dataset_path, file_name)
+			if not os.path.isfile(file_path):
+				continue
+			offset = (pack_file.tell() + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+			pack_file.seek(offset)
+			with open(file_path, "rb") as f:
+				shutil.copyfileobj(f, pack_file, 1024*1024)
+			files[file_name] = (offset, pack_file.tell()-offset)
+
+		header = cPickle.dumps(dict(
+		    name=os.path.basename(os.path.abspath(dataset_path)),
+		    files=files,
+		    streams=streams,
+		    file_info=file_info,
+		    annotations_available=manifest.getDataSetAnnotations(dataset_path)
+		), cPickle.HIGHEST_PROTOCOL)
+		header_offset = pack_file.tell()
+		pack_file.write(header)
+		pack_file.seek(0)
+		pack_file.write(_PREAMBLE.pack(_MAGIC, header_offset, len(header)))
+	os.rename(temporary_path, pack_path)
+	return len(files)
+
+class DataSetPack(object):
+	"""
+	Read-only access to a dataset pack written by ``packDataSet``
+
+	The pack is memory-mapped: files are returned as buffers on the mapped
+	pages, without being copied.
+
+	:param path: Path of the pack
+	:raise: IOError if the file is not a dataset pack
+	"""
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as f:
+			magic, header_offset, header_size = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+			if magic != _MAGIC or header_offset == 0:
+				raise IOError("%s is not a dataset pack"%path)
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		header = cPickle.loads(self._map[header_offset:header_offset+header_size])
+		self.name = header["name"]
+		self._files = header["files"]
+		self._streams = header["streams"]
+		self._file_info = header["file_info"]
+		self._annotations_available = header["annotations_available"]
+
+	def listFiles(self):
+		"""
+		Returns the names of the packed files, in the order they are stored
+		"""
+		return sorted(self._files.keys(), key=lambda name: self._files[name][0])
+
+	def hasFile(self, file_name):
+		return self._files.has_key(file_name)
+
+	def getFile(self, file_name):
+		"""
+		Returns the content of a packed file
+
+		:param file_name: Name of the file in the dataset folder
+		:return: Read-only buffer on the mapped pack
+		:raise: KeyError if the file is not in the pack
+		"""
+		offset, size = self._files[file_name]
+		return buffer(self._map, offset, size)
+
+	def getFileInfo(self, file_name):
+		"""
+		Returns the type and annotations of a stream file, as
+		``ManifestCache.getFileInfo``
+
+		:raise: TypeError if the file is not part of a stream
+		"""
+		if not self._file_info.has_key(file_name):
+			raise TypeError("%s is not a QiDataFile of %s"%(file_name, self.path))
+		return self._file_info[file_name]
+
+	def getDataSetStreams(self, type_name):
+		"""
+		Returns the streams of a given type, as ``ManifestCache.getDataSetStreams``
+		"""
+		return [dict(stream) for stream in self._streams.get(type_name, [])]
+
+	def listStreamFiles(self):
+		"""
+		Returns the names of the files of all streams
+		"""
+		return self._file_info.keys()
+
+	def getDataSetAnnotations(self):
+		"""
+		Returns the annotations available, as ``ManifestCache.getDataSetAnnotations``
+		"""
+		return self._annotations_available
+
+	def close(self):
+		self._map.close()
+
+class PackStager(object):
+	"""
+	Writes the files of a pack that are being read in a folder, for readers
+	only accepting file paths
+
+	Files that are not part of a stream (dataset metadata, calibrations...)
+	are written at once. A stream file is written with its sidecar metadata
+	when staged, and removed when another file is staged in the same slot.
+	The folder is in memory (/dev/shm) when possible.
+
+	:param pack: DataSetPack to read
+	"""
+	def __init__(self, pack):
+		self.pack = pack
+		self.folder = tempfile.mkdtemp(
+		    prefix="processing_pipe_pack_",
+		    dir="/dev/shm" if os.path.isdir("/dev/shm") else None
+		)
+		self._staged = dict()
+		stream_files = set()
+		for file_name in self.pack.listStreamFiles():
+			stream_files.update(self._getFileGroup(file_name))
+		for file_name in self.pack.listFiles():
+			if not file_name in stream_files:
+				self._write(file_name)
+
+	def _getFileGroup(self, file_name):
+		# A file and its sidecar metadata
+		if self.pack.hasFile(file_name + ".xmp"):
+			return [file_name, file_name + ".xmp"]
+		return [file_name]
+
+	def _write(self, file_name):
+		with open(os.path.join(self.folder, file_name), "wb") as f:
+			f.write(self.pack.getFile(file_name))
+
+	def stage(self, file_path, slot):
+		"""
+		Writes a stream file in the folder, and removes the previous file of
+		the slot
+
+		:param file_path: Path of the file in the pack (pack path followed by
+		the file name), as given by the pack streams
+		:param slot: Identifier of the reader (input index)
+		:return: Path of the written file
+		"""
+		file_name = os.path.basename(file_path)
+		previous_file_name = self._staged.get(slot)
+		if previous_file_name == file_name:
+			return os.path.join(self.folder, file_name)
+		for staged_name in self._getFileGroup(file_name):
+			self._write(staged_name)
+		self._staged[slot] = file_name
+		if previous_file_name is not None\
+		   and not previous_file_name in self._staged.values():
+			for staged_name in self._getFileGroup(previous_file_name):
+				os.remove(os.path.join(self.folder, staged_name))
+		return os.path.join(self.folder, file_name)
+
+	def close(self):
+		shutil.rmtree(self.folder, ignore_errors=True)
@@ -1,17 +1,138 @@
 # -*- coding: utf-8 -*-
 
 # Standard libraries
+import collections
+import copy
+import cPickle
+import hashlib
+import multiprocessing
+import os
 import sys
+import time
+from warnings import warn
 
 # Third-party libraries
 import ecto
 
 # Local modules
 import utils as tools
+from profiler import Profiler
+from result_cache import ResultCache
+from result_log import ResultLog
+from result_store import ResultStore
 
 def write_only_property(func):
 	return property(fset=func)
 
+_OPAQUE_FRAME_SIZE = 640*480*3 #: size assumed for frames whose data cannot be measured (a VGA color image)
+
+def _estimateSize(value, opaque_size=0):
+	"""
+	Estimates the memory used by a value, in bytes
+
+	:param value: Any object (arrays, cv::Mat and objects exposing a buffer
+	are measured by their data)
+	:param opaque_size: Minimum size of objects whose data cannot be
+	measured, such as images wrapped by Boost.Python without a buffer
+	"""
+	if hasattr(value, "nbytes"):
+		return value.nbytes
+	if hasattr(value, "total") and hasattr(value, "elemSize"):
+		return value.total() * value.elemSize()
+	if isinstance(value, (list, tuple, set, frozenset)):
+		return sys.getsizeof(value) + sum([_estimateSize(v, opaque_size) for v in value])
+	if isinstance(value, dict):
+		return sys.getsizeof(value) + sum([
+		    _estimateSize(k, opaque_size) + _estimateSize(v, opaque_size)\
+		    for k, v in value.iteritems()
+		])
+	try:
+		# Images wrapped in objects supporting the buffer protocol, whose
+		# data may not be counted by getsizeof
+		return max(sys.getsizeof(value), len(buffer(value)))
+	except TypeError:
+		pass
+	if value is None or isinstance(value, (int, long, float, complex)):
+		return sys.getsizeof(value)
+	return max(sys.getsizeof(value), opaque_size)
+
+_file_hashes = dict() #: content hash of files, by (path, modification time, size)
+
+def _hashValue(value):
+	"""
+	Returns a string identifying a parameter or input value
+
+	Values naming an existing file are identified by the file content, and
+	arrays by their data.
+
+	:param value: Any object
+	:return: String, None if the value cannot be identified (its
+	representation contains an address)
+	"""
+	if isinstance(value, basestring) and os.path.isfile(value):
+		stat = os.stat(value)
+		file_id = (os.path.abspath(value), stat.st_mtime, stat.st_size)
+		if not file_id in _file_hashes:
+			content_hash = hashlib.sha1()
+			with open(value, "rb") as f:
+				for block in iter(lambda: f.read(1024*1024), ""):
+					content_hash.update(block)
+			_file_hashes[file_id] = "file:" + content_hash.hexdigest()
+		return _file_hashes[file_id]
+	if hasattr(value, "tostring") and hasattr(value, "dtype"):
+		return "array:%s:%s:%s"%(
+		    value.dtype,
+		    value.shape,
+		    hashlib.sha1(value.tostring()).hexdigest()
+		)
+	out = repr(value)
+	if " at 0x" in out:
+		return None
+	return out
+
+def _getFrameKeyValue(value):
+	"""
+	Returns a hashable value identifying a parameter value in the frame cache
+
+	Values naming an existing file are identified by its path and
+	modification time.
+
+	:param value: Any object
+	:return: None if the value cannot be identified (its representation
+	contains an address)
+	"""
+	if isinstance(value, basestring) and os.path.isfile(value):
+		return ("file", os.path.abspath(value), os.path.getmtime(value))
+	out = repr(value)
+	if " at 0x" in out:
+		return None
+	return out
+
+def _graphFromDict(graph_description):
+	"""
+	Default factory used to rebuild a graph in a worker process
+
+	:param graph_description: Dictionnary describing the graph to create
+	"""
+	return Graph.createFromDict(copy.deepcopy(graph_description))
+
+def _runSweepChunk(job):
+	"""
+	Rebuilds a graph and runs a contiguous part of its sweep
+
+	This is executed in worker processes by ``Graph.run``.
+
+	:param job: Tuple (factory, factory_args, param_overrides, run_settings,
+	input_combinations, first, last), as built by ``Graph._iterInPool``
+	:return: List of computation results for combinations [first, last[
+	"""
+	(factory, factory_args, param_overrides,
+	 run_settings, input_combinations, first, last) = job
+	graph = factory(*factory_args)
+	for (cell_id, param_name), values in param_overrides:
+		graph.setSwitchingParameters(cell_id, param_name, values)
+	return graph._runChunk(run_settings, input_combinations, first, last)
+
 class Graph(object):
 	"""
 	Represents a processing graph, wrapping ecto library
@@ -35,13 +156,18 @@ class Graph(object):
 
 			# Storage for possible values
 			# Key is (cell, parameter name)
-			# Values are (list of possible values, index of currently selected value)
+			# Values are (list of possible values, index of currently selected value,
+			# direction of the Gray-code enumeration)
 			self.parameter_storage = dict()
 
 			# Keep keys of parameter storage in an ordered fashion
 			# (most downstream in graph comes first)
 			self.ordered_cells = list()
 
+			# When True, parameters are enumerated in reflected Gray-code
+			# order: each step changes exactly one parameter value
+			self.gray_code = False
+
 			# m = self.maxDepth(depthDict)
 
 			# for d in range(m+1, 0, -1):
@@ -79,17 +205,36 @@ class Graph(object):
 
 		#   return ret
 
-		def initParamIteration(self, graph_depth_map):
+		def initParamIteration(self, graph_depth_map, downstream_costs=None):
 			"""
 			Initializes the iterators necessary to switch parameters upon the run
 
 			:param depthDict: the association between cell's ID and there depth in the graph
+			:param downstream_costs: the association between cell's ID and the
+			cost of re-executing it with its downstream cells. When given, the
+			parameters which are the most expensive to change change the least
+			often.
 			"""
 			self.ordered_cells = sorted(
 				self.parameter_storage.keys(),
 			    key=lambda x:graph_depth_map[x[0].name()],
 			    reverse = False
 			)
+			if downstream_costs is None:
+				return
+
+			def cost_key(param_key):
+				# Exchanging two neighbour parameters shows this key gives the
+				# cheapest sweep when parameters are sorted along it
+				value_count = len(self.parameter_storage[param_key][0])
+				if value_count == 1:
+					return float("inf")
+				cost = downstream_costs[param_key[0].name()]
+				if self.gray_code:
+					return cost
+				return cost*value_count/(value_count-1.)
+
+			self.ordered_cells.sort(key=cost_key)
 
 		def setParameterPossibleValues(self, cell_id, param_name, values):
 			"""
@@ -100,7 +245,7 @@ class Graph(object):
 			"""
 			cell = self.cell_list[cell_id]
 			values = map(lambda x: str(x) if isinstance(x,unicode) else x, values)
-			self.parameter_storage[(cell, param_name)] = [values, 0]
+			self.parameter_storage[(cell, param_name)] = [values, 0, 1]
 			setattr(cell.params, param_name, values[0])
 
 		def increment(self, reparametrized_cells, i=0):
@@ -116,6 +261,19 @@ class Graph(object):
 			param_key = self.ordered_cells[i]
 			param_value = self.parameter_storage[param_key]
 
+			if self.gray_code:
+				# Move one step in the current direction, or stay at the end
+				# and reverse direction while the next parameter moves
+				next_index = param_value[1] + param_value[2]
+				if next_index < 0 or next_index == len(param_value[0]):
+					param_value[2] = -param_value[2]
+					self.increment(reparametrized_cells, i+1)
+					return
+				param_value[1] = next_index
+				setattr(param_key[0].params, param_key[1], param_value[0][param_value[1]])
+				reparametrized_cells.append(param_key[0].name())
+				return
+
 			param_value[1] = param_value[1] + 1
 
 			if param_value[1] == len(param_value[0]):
@@ -125,6 +283,83 @@ class Graph(object):
 			setattr(param_key[0].params, param_key[1], param_value[0][param_value[1]])
 			reparametrized_cells.append(param_key[0].name())
 
+		def getCombinationCount(self):
+			"""
+			Returns the number of parameter combinations to iterate on
+			"""
+			count = 1
+			for param_value in self.parameter_storage.itervalues():
+				count *= len(param_value[0])
+			return count
+
+		def setParamCombination(self, rank):
+			"""
+			Jumps directly to the rank-th combination of parameters values
+
+			Combinations are ranked in the order ``increment`` visits them.
+
+			:param rank: Index of the combination to set
+			"""
+			for param_key in self.ordered_cells:
+				param_value = self.parameter_storage[param_key]
+				rank, param_value[1] = divmod(rank, len(param_value[0]))
+				# In Gray-code order, a parameter goes backward on every odd
+				# pass
+				param_value[2] = 1
+				if self.gray_code and rank % 2:
+					param_value[1] = len(param_value[0]) - 1 - param_value[1]
+					param_value[2] = -1
+				setattr(param_key[0].params, param_key[1], param_value[0][param_value[1]])
+
+		def countChanges(self):
+			"""
+			Counts how many times each parameter changes during a sweep
+
+			:return: List of (cells changed together, number of such steps),
+			cells being given as a list of names
+			"""
+			total = self.getCombinationCount()
+			changes = []
+			combinations_per_pass = 1
+			for i in range(len(self.ordered_cells)):
+				value_count = len(self.parameter_storage[self.ordered_cells[i]][0])
+				previous_combinations_per_pass = combinations_per_pass
+				combinations_per_pass *= value_count
+				if self.gray_code:
+					# Only this parameter moves, (value_count-1) times per pass
+					changed_params = self.ordered_cells[i:i+1]
+					step_count = (value_count-1) * (total // combinations_per_pass)
+				else:
+					# All faster parameters wrap while this one moves
+					changed_params = self.ordered_cells[:i+1]
+					step_count = total // previous_combinations_per_pass\
+					             - total // combinations_per_pass
+				changes.append(
+				    ([cell.name() for cell, _ in changed_params], step_count)
+				)
+			return changes
+
+		def getIterationSettings(self):
+			"""
+			Returns what is needed to iterate the same way in another graph
+			"""
+			return dict(
+			    order=[(cell.name(), param_name) for cell, param_name in self.ordered_cells],
+			    gray_code=self.gray_code
+			)
+
+		def setIterationSettings(self, settings):
+			"""
+			Forces the iteration order and enumeration
+
+			:param settings: Dict returned by ``getIterationSettings``
+			"""
+			self.ordered_cells = [
+			    (self.cell_list[cell_id], param_name)\
+			    for cell_id, param_name in settings["order"]
+			]
+			self.gray_code = settings["gray_code"]
+
 		def setNextParamCombination(self):
 			"""
 			Receive the cell's ID who were modified and return it
@@ -141,6 +376,7 @@ class Graph(object):
 			"""
 			for (param_adress, param_value) in self.parameter_storage.iteritems():
 				param_value[1] = 0
+				param_value[2] = 1
 				cell, param_name = param_adress
 				setattr(cell.params, param_name, param_value[0][0])
 
@@ -152,6 +388,71 @@ class Graph(object):
 				out[cell.name()+"."+param_name] = param_value
 			return out
 
+	class _OutputCache(object):
+		"""
+		Bounded LRU storage of cell output snapshots
+
+		:param max_bytes: Maximum estimated size of stored outputs
+		:param max_entries: Maximum number of stored snapshots (no limit if None)
+		:param opaque_size: Size counted for values whose data cannot be
+		measured (see ``_estimateSize``)
+		"""
+		def __init__(self, max_bytes, max_entries=None, opaque_size=0):
+			self.max_bytes = max_bytes
+			self.max_entries = max_entries
+			self.opaque_size = opaque_size
+			self.hits = 0
+			self.misses = 0
+			self._entries = collections.OrderedDict() # key -> (size, outputs)
+			self._size = 0
+
+		def __contains__(self, key):
+			return key in self._entries
+
+		def __len__(self):
+			return len(self._entries)
+
+		def get(self, key):
+			"""
+			Returns the outputs stored for key and marks them as recently used
+			"""
+			entry = self._entries.pop(key)
+			self._entries[key] = entry
+			return entry[1]
+
+		def put(self, key, outputs):
+			"""
+			Stores outputs for key, evicting least recently used ones if needed
+
+			:param key: Hashable key
+			:param outputs: Dict associating output port names to values
+			"""
+			if key in self._entries:
+				self._size -= self._entries.pop(key)[0]
+			size = _estimateSize(outputs, self.opaque_size)
+			if size > self.max_bytes:
+				return
+			self._entries[key] = (size, outputs)
+			self._size += size
+			while self._size > self.max_bytes\
+			      or (self.max_entries is not None and len(self._entries) > self.max_entries):
+				_, (evicted_size, _) = self._entries.popitem(last=False)
+				self._size -= evicted_size
+
+		def clear(self):
+			self._entries.clear()
+			self._size = 0
+
+		def getStatistics(self):
+			lookups = self.hits + self.misses
+			return dict(
+			    hits=self.hits,
+			    misses=self.misses,
+			    hit_rate=float(self.hits)/lookups if lookups > 0 else 0.,
+			    entries=len(self._entries),
+			    bytes=self._size
+			)
+
 	class _InputHandler(object):
 		"""
 		Stores and manages the inputs of a graph
@@ -161,12 +462,15 @@ class Graph(object):
 		def __init__(self, graph_cell_list):
 			self._cell_list = graph_cell_list
 			self._input_port_list = []
-			self._input_combinations = []
+			self._input_combinations = collections.deque()
+			self.modified_cells = set() #: cells whose inputs were set since last execution
+			self.input_index = 0 #: index of the current combination
 
 		def addInput(self, cell_id, port_name):
 			self._input_port_list.append((cell_id, port_name))
 
 		def __setitem__(self, item, value):
+			self.modified_cells.add(str(self._input_port_list[item][0]))
 			setattr(
 			    self._cell_list[self._input_port_list[item][0]].inputs,
 			    self._input_port_list[item][1],
@@ -175,12 +479,23 @@ class Graph(object):
 
 		@write_only_property
 		def input_combinations(self, value):
-			self._input_combinations = []
-			if not isinstance(value, list):
-				if not isinstance(value, tuple):
-					value = (value,)
-				value = [value]
-			self._input_combinations.extend(value)
+			"""
+			Sets the input combinations to run on
+
+			A list (or deque) is copied, whereas an iterator or a generator is
+			consumed lazily, one combination per step, so that combinations
+			never need to be all in memory. Anything else is a single
+			combination.
+			"""
+			if isinstance(value, collections.Iterator):
+				self._input_combinations = value
+			else:
+				if not isinstance(value, (list, collections.deque)):
+					if not isinstance(value, tuple):
+						value = (value,)
+					value = [value]
+				self._input_combinations = collections.deque(value)
+			self.input_index = -1
 			self.setNextInputCombination()
 
 		def getCurrentInputCombination(self):
@@ -195,21 +510,64 @@ class Graph(object):
 			return out
 
 		def setNextInputCombination(self):
-			input_combinations = self._input_combinations.pop(0)
+			if isinstance(self._input_combinations, collections.deque):
+				input_combinations = self._input_combinations.popleft()
+			else:
+				try:
+					input_combinations = next(self._input_combinations)
+				except StopIteration:
+					self._input_combinations = collections.deque()
+					raise IndexError("No more input combination")
+			self.input_index += 1
 			for i in range(len(input_combinations)):
 				self[i] = input_combinations[i]
 
+		def getPendingCount(self):
+			"""
+			Returns the number of combinations not set yet, None if unknown
+			"""
+			if isinstance(self._input_combinations, collections.deque):
+				return len(self._input_combinations)
+			return None
+
+		def popPendingCombinations(self):
+			"""
+			Returns all the combinations not set yet and forgets them
+			"""
+			out = list(self._input_combinations)
+			self._input_combinations = collections.deque()
+			return out
+
 		def __len__(self):
 			return len(self._input_port_list)
 
+	_frame_cache = None #: outputs of the frame cells of all graphs of the process, see setFrameCache
+
 	def __init__(self):
 		self.cellList = dict()
 		self.plasm = ecto.Plasm()
 		self._inputs_handler = Graph._InputHandler(self.cellList)
 		self._params_handler = Graph._ParamIterator(self.cellList)
 		self._outputs = []
-		self._graph_output_buffer = [] #: contains all computed outputs
-		self._graph_result_buffer = [] #: contains all outputs with corresponding inputs and parameters
+		self._result_store = ResultStore() #: contains all outputs with corresponding inputs and parameters
+		self._result_param_keys = [] #: swept parameters, in the order of the result store
+		self._result_retention = dict(keep=None, reduction=None, callback=None) #: what run keeps, see setResultRetention
+		self._result_log = None #: (folder, segment size) of the on-disk result log, if enabled
+		self._checkpoint = None #: where and how often run saves its progress, see setCheckpoint
+		self._result_cache = None #: outputs kept on disk across invocations, if enabled
+		self._result_cache_key = None #: identifies the graph in the result cache
+		self._connections = [] #: (upstream cell, output port, downstream cell, input port)
+		self._cell_costs = None #: cost of each cell, used to order swept parameters
+		self._output_cache = None #: memoized cell outputs, if enabled
+		self._frame_cells = set() #: cells whose outputs are kept in the frame cache
+		self._runner = None #: function executing the graph, reset when topology changes
+		self._depth_map = None #: depth of each cell, reset when topology changes
+		self._reparametrized_cells = set() #: cells reparametrized since last execution
+		self._stepped = False #: True when cells are up to date with current parameters
+		self._topological_order = None #: cell names sorted by dependency, reset when topology changes
+		self._profiler = None #: records cell execution times, if enabled
+		self._factory = None #: (callable, args) rebuilding this graph in a worker process
+		self._param_overrides = collections.OrderedDict() #: switching parameters set after the factory
 
 	@staticmethod
 	def createFromDict(graph_description):
@@ -218,6 +576,7 @@ class Graph(object):
 
 		:param graph_description: Dictionnary describing the graph to create
 		"""
+		pristine_description = copy.deepcopy(graph_description)
 		g=Graph()
 		if not graph_description.has_key("cells"):
 			raise Exception("No cell was declared. Use 'cells' field to declare cells")
@@ -244,8 +603,23 @@ class Graph(object):
 					input_port=graph_connection["to"].split(".")[1]
 				)
 
+		g.setFactory(_graphFromDict, pristine_description)
 		return g
 
+	def setFactory(self, factory, *args):
+		"""
+		Declares how to rebuild this graph in another process
+
+		Worker processes used by ``run`` call ``factory(*args)`` and then
+		replay every switching parameter set on this graph afterwards. Both
+		the factory and its arguments must be picklable.
+
+		:param factory: Module-level function returning a new ``Graph``
+		:param args: Arguments to give to the factory
+		"""
+		self._factory = (factory, args)
+		self._param_overrides.clear()
+
 	def addCell(self, cell):
 		"""
 		Adds a cell to the graph
@@ -253,6 +627,7 @@ class Graph(object):
 		:param cell: An ecto cell
 		"""
 		self.cellList[cell.name()] = cell
+		self._invalidateSchedule()
 
 	def connect(self, upstream_cell_name, output_port, downstream_cell_name, input_port):
 		"""
@@ -266,47 +641,350 @@ class Graph(object):
 		self.plasm.connect(
 		    self.cellList[str(upstream_cell_name)][str(output_port)] >> self.cellList[str(downstream_cell_name)][str(input_port)]
 		)
+		self._connections.append((
+		    str(upstream_cell_name),
+		    str(output_port),
+		    str(downstream_cell_name),
+		    str(input_port)
+		))
+		self._invalidateSchedule()
+
+	def _invalidateSchedule(self):
+		"""
+		Forgets the scheduler and depth map after a topology change
+		"""
+		self._runner = None
+		self._depth_map = None
+		self._topological_order = None
+		self._stepped = False
+
+	def getUpstreamCells(self, cell_names):
+		"""
+		Returns the given cells and all cells they depend on
+
+		:param cell_names: Iterable of cell names
+		:return: Set of cell names
+		"""
+		out = set(cell_names)
+		to_visit = list(out)
+		while len(to_visit) > 0:
+			cell_name = to_visit.pop()
+			for (upstream, _, downstream, _) in self._connections:
+				if downstream == cell_name and not upstream in out:
+					out.add(upstream)
+					to_visit.append(upstream)
+		return out
+
+	def getDownstreamCells(self, cell_names):
+		"""
+		Returns the given cells and all cells depending on them
 
-	def run(self):
+		:param cell_names: Iterable of cell names
+		:return: Set of cell names
+		"""
+		out = set(cell_names)
+		to_visit = list(out)
+		while len(to_visit) > 0:
+			cell_name = to_visit.pop()
+			for (upstream, _, downstream, _) in self._connections:
+				if upstream == cell_name and not downstream in out:
+					out.add(downstream)
+					to_visit.append(downstream)
+		return out
+
+	def run(self, workers=1):
 		"""
 		Runs the graph with all parameter and input values given
+
+		Results are stored and made available through ``output`` and
+		``result``. See ``iterRun`` for the meaning of ``workers``.
+
+		:param workers: Number of processes sharing the parameter sweep
 		"""
-		self._graph_output_buffer = []
-		self._graph_result_buffer = []
-		if len(self.plasm.cells())>0:
-			self.sched = ecto.CustomSchedulerSBR(self.plasm)
-			runner = self.sched.execute
-			self._params_handler.initParamIteration(self.sched.getDepthMap())
-		elif len(self.cellList)>0:
-			_lonely_cell = self.cellList.values()[0]
-			runner = (lambda x: [cell.process() for cell in self.cellList.values()])
-			self._params_handler.initParamIteration({_lonely_cell.name():0})
+		callback = self._result_retention["callback"]
+		if self._checkpoint is not None and self._result_log is None\
+		   and self._result_retention["keep"] != 0:
+			raise Exception(
+			    "Checkpoints need results to be written to a result log, or not to be kept"
+			)
+		checkpoint = self._loadCheckpoint()
+		if checkpoint is None:
+			done = 0
+			iteration_settings = None
+			self._result_store = self._createResultStore(
+			    self._result_retention["keep"],
+			    self._result_retention["reduction"],
+			    self._result_log
+			)
 		else:
+			done = checkpoint["done"]
+			iteration_settings = checkpoint["iteration"]
+			self._result_store = self._restoreResultStore(checkpoint)
+			if self._checkpoint["set_state"] is not None:
+				self._checkpoint["set_state"](checkpoint.get("state"))
+
+		last_checkpoint_time = time.time()
+		try:
+			for chunk in self._iterSweep(workers, done, iteration_settings):
+				if chunk is None:
+					self._storeResult(self._result_store)
+					done += 1
+					if callback is not None:
+						callback(self._getComputationResult())
+				else:
+					self._result_store.extend(chunk)
+					done += chunk.total_count
+					if callback is not None:
+						for computation_result in chunk:
+							callback(computation_result)
+				if self._checkpoint is not None\
+				   and time.time() - last_checkpoint_time >= self._checkpoint["interval"]:
+					self._saveCheckpoint(done)
+					last_checkpoint_time = time.time()
+		finally:
+			if isinstance(self._result_store, ResultLog):
+				self._result_store.close()
+		if self._checkpoint is not None:
+			self._saveCheckpoint(done)
+
+	def iterRun(self, workers=1):
+		"""
+		Runs the graph with all parameter and input values given, yielding
+		each result as soon as it is computed
+
+		Results are dict with ``outputs``, ``inputs`` and ``params`` keys, like
+		the items of ``result``. Unlike ``run``, nothing is kept by the graph.
+
+		:param workers: Number of processes sharing the parameter sweep. When
+		greater than 1, each worker rebuilds the graph with the factory given
+		to ``setFactory`` (see ``createFromDict``) and runs a contiguous part
+		of the combinations. Results are yielded in the order a serial run
+		produces them, which requires outputs to be picklable and cells not to
+		carry state from one combination to the next.
+		"""
+		for chunk in self._iterSweep(workers):
+			if chunk is None:
+				yield self._getComputationResult()
+			else:
+				for computation_result in chunk:
+					yield computation_result
+
+	def _iterSweep(self, workers, start=0, iteration_settings=None):
+		"""
+		Runs the graph with all parameter and input values given
+
+		:param workers: Number of processes sharing the parameter sweep
+		:param start: Number of combinations to skip, done by a previous run
+		:param iteration_settings: Iteration order and enumeration to follow,
+		as returned by ``_ParamIterator.getIterationSettings`` (chosen as
+		usual if None)
+		:return: Generator of None each time the graph holds the outputs of a
+		new combination, or of ResultStore of combinations run by workers
+		"""
+		runner = self._prepareRunner()
+		if runner is None:
+			return
+		if iteration_settings is not None:
+			self._params_handler.setIterationSettings(iteration_settings)
+			if self._output_cache is not None:
+				self._prepareOutputCacheKeys()
+
+		# Parameters are reset at the end, cells will not be up to date
+		self._stepped = False
+		self._reparametrized_cells.clear()
+		self._inputs_handler.modified_cells.clear()
+
+		input_skip, first_rank = divmod(start, self._params_handler.getCombinationCount())
+		try:
+			for _ in range(input_skip):
+				self._inputs_handler.setNextInputCombination()
+		except IndexError:
+			# All combinations were done
+			self._params_handler.reset()
 			return
-		cells_to_rerun = list()
 
-		while True:
-			runner(cells_to_rerun if len(cells_to_rerun)>0 else 1)
-			computation_result = dict(
-			    outputs=[
-			        self.cellList[self._outputs[i][0]].outputs[self._outputs[i][1]]\
-			        for i in range(len(self._outputs))
-			    ],
-			    inputs=self._inputs_handler.getCurrentInputCombination(),
-			    params=self._params_handler.getCurrentParamCombination(),
+		if workers > 1:
+			chunks = self._iterInPool(workers, first_rank)
+		else:
+			self._params_handler.setParamCombination(first_rank)
+			chunks = self._iterCombinations(runner)
+
+		for chunk in chunks:
+			yield chunk
+
+	def _getRunner(self):
+		"""
+		Returns the function executing the graph
+
+		The scheduler and the depth map are built once and kept until the
+		topology changes.
+
+		:return: Function taking the list of cells to rerun (or 1 to run them
+		all), None if the graph is empty
+		"""
+		if self._runner is None:
+			if len(self.plasm.cells())>0:
+				self.sched = ecto.CustomSchedulerSBR(self.plasm)
+				self._runner = self.sched.execute
+				self._depth_map = self.sched.getDepthMap()
+			elif len(self.cellList)>0:
+				_lonely_cell = self.cellList.values()[0]
+				self._runner = (lambda x: [cell.process() for cell in self.cellList.values()])
+				self._depth_map = {_lonely_cell.name():0}
+		return self._runner
+
+	def _prepareRunner(self):
+		"""
+		Returns the function executing the graph and sorts the parameters
+
+		:return: Function taking the list of cells to rerun (or 1 to run them
+		all), None if the graph is empty
+		"""
+		runner = self._getRunner()
+		if runner is None:
+			return None
+		self._sortParameters(self._cell_costs)
+		if self._output_cache is not None:
+			self._output_cache.clear()
+			self._prepareOutputCacheKeys()
+		return runner
+
+	def _prepareOutputCacheKeys(self):
+		"""
+		Lists, for each cell, the swept parameters its outputs depend on
+		"""
+		self._output_cache_params = dict()
+		for cell in self.plasm.cells():
+			upstream_cells = self.getUpstreamCells([cell.name()])
+			self._output_cache_params[cell.name()] = [
+			    param_key for param_key in self._params_handler.ordered_cells\
+			    if param_key[0].name() in upstream_cells
+			]
+
+	def _execute(self, runner, cells_to_rerun):
+		"""
+		Executes the reparametrized cells and their downstream cells
+
+		When the output cache is enabled, cells whose outputs were already
+		computed with the same parameters upstream get them restored instead.
+
+		:param runner: Function returned by ``_prepareRunner``
+		:param cells_to_rerun: Names of reparametrized cells, all cells are
+		executed if empty
+		"""
+		if self._profiler is not None:
+			self._profiler.beginRun(
+			    self._inputs_handler.input_index,
+			    self._params_handler.getCurrentParamCombination()
 			)
-			if len(self._outputs)>1:
-				self._graph_output_buffer.append(
-				    tuple(computation_result["outputs"])
-				)
-			elif len(self._outputs)==1:
-				self._graph_output_buffer.append(
-				    computation_result["outputs"][0]
+
+		if self._output_cache is None or len(self.plasm.cells()) == 0:
+			self._executeCells(runner, cells_to_rerun if len(cells_to_rerun)>0 else 1)
+			return
+
+		if len(cells_to_rerun) > 0:
+			dirty_cells = self.getDownstreamCells(cells_to_rerun)
+		else:
+			dirty_cells = set([cell.name() for cell in self.plasm.cells()])
+
+		parameter_storage = self._params_handler.parameter_storage
+		keys = dict()
+		for cell_name in dirty_cells:
+			keys[cell_name] = (cell_name, tuple([
+			    parameter_storage[param_key][1]\
+			    for param_key in self._output_cache_params[cell_name]
+			]))
+		missed_cells = set([
+		    cell_name for cell_name in dirty_cells\
+		    if not keys[cell_name] in self._output_cache
+		])
+
+		# Executing the first missed cells also executes all cells downstream
+		cells_to_execute = [
+		    cell_name for cell_name in missed_cells\
+		    if len(self.getUpstreamCells([cell_name]) & missed_cells) == 1
+		]
+		executed_cells = self.getDownstreamCells(cells_to_execute)
+
+		for cell_name in dirty_cells - executed_cells:
+			cell = self.cellList[cell_name]
+			for port_name, value in self._output_cache.get(keys[cell_name]).iteritems():
+				setattr(cell.outputs, port_name, value)
+		self._output_cache.hits += len(dirty_cells - executed_cells)
+		self._output_cache.misses += len(executed_cells)
+
+		if len(cells_to_execute) > 0:
+			self._executeCells(runner, cells_to_execute)
+		for cell_name in executed_cells:
+			cell = self.cellList[cell_name]
+			self._output_cache.put(keys[cell_name], dict([
+			    (port_name, getattr(cell.outputs, port_name))\
+			    for port_name in cell.outputs.keys()
+			]))
+
+	def _sortParameters(self, cell_costs):
+		"""
+		Sorts swept parameters by depth, or by cost when costs are given
+
+		:param cell_costs: Dict associating cell names to their cost, or None
+		"""
+		downstream_costs = None
+		if cell_costs is not None:
+			downstream_costs = dict()
+			for cell, _ in self._params_handler.parameter_storage.keys():
+				downstream_costs[cell.name()] = self._getRerunCost(
+				    [cell.name()],
+				    cell_costs
 				)
+		self._params_handler.initParamIteration(self._depth_map, downstream_costs)
+
+	def _getRerunCost(self, cell_names, cell_costs=None):
+		"""
+		Returns the cost of re-executing cells after a parameter change
 
-			self._graph_result_buffer.append(computation_result)
+		:param cell_names: Names of the reparametrized cells
+		:param cell_costs: Dict associating cell names to their cost (each
+		cell costs 1 if None)
+		"""
+		if len(self.plasm.cells()) > 0:
+			# Only modified cells and their downstream cells are executed
+			executed_cells = self.getDownstreamCells(cell_names)
+		else:
+			# Disconnected cells are all executed at every step
+			executed_cells = self.cellList.keys()
+		if cell_costs is None:
+			return len(executed_cells)
+		return sum([cell_costs.get(cell_name, 0) for cell_name in executed_cells])
+
+	def _iterCombinations(self, runner, count=None):
+		"""
+		Runs the graph from the current parameters and inputs combination
+
+		:param runner: Function returned by ``_prepareRunner``
+		:param count: Maximum number of combinations to run (all if None)
+		:return: Generator yielding None after each combination is run
+		"""
+		done = 0
+		cells_to_rerun = list()
+
+		while count is None or done < count:
+			cache_keys = None
+			if self._result_cache is not None:
+				cache_keys = self._getResultCacheKeys()
+			if cache_keys is not None and self._restoreCachedOutputs(cache_keys):
+				# Cells did not run, they are not up to date anymore
+				outdated = True
+			else:
+				self._execute(runner, cells_to_rerun)
+				outdated = False
+				if cache_keys is not None:
+					self._cacheOutputs(cache_keys)
+			done += 1
+			yield None
 			try:
 				cells_to_rerun = self._params_handler.setNextParamCombination()
+				if outdated:
+					cells_to_rerun = list()
 			except StopIteration:
 				self._params_handler.reset()
 				cells_to_rerun = list()
@@ -314,6 +992,503 @@ class Graph(object):
 					self._inputs_handler.setNextInputCombination()
 				except IndexError:
 					break
+				if self._output_cache is not None:
+					# Cached outputs were computed from previous inputs
+					self._output_cache.clear()
+
+	def _getResultCacheKeys(self):
+		"""
+		Returns the keys of the current outputs in the result cache
+
+		:return: One key per output, None if a parameter or input value
+		cannot be identified
+		"""
+		param_values = sorted([
+		    (cell.name(), param_name, _hashValue(param_value[0][param_value[1]]))\
+		    for (cell, param_name), param_value\
+		    in self._params_handler.parameter_storage.iteritems()
+		])
+		input_values = [
+		    _hashValue(value)\
+		    for value in self._inputs_handler.getCurrentInputCombination()
+		]
+		if None in input_values or None in [v[2] for v in param_values]:
+			return None
+		combination_id = "%s\n%r\n%r"%(
+		    self._result_cache_key,
+		    param_values,
+		    input_values
+		)
+		return [
+		    hashlib.sha1("%s\n%s.%s"%(combination_id, cell_id, port_name)).hexdigest()\
+		    for cell_id, port_name in self._outputs
+		]
+
+	def _restoreCachedOutputs(self, cache_keys):
+		"""
+		Sets the graph outputs to the values found in the result cache
+
+		:param cache_keys: Keys returned by ``_getResultCacheKeys``
+		:return: True if all outputs were found (nothing is set otherwise)
+		"""
+		try:
+			values = [self._result_cache.get(key) for key in cache_keys]
+		except KeyError:
+			return False
+		for (cell_id, port_name), value in zip(self._outputs, values):
+			setattr(self.cellList[cell_id].outputs, port_name, value)
+		return True
+
+	def _cacheOutputs(self, cache_keys):
+		"""
+		Stores the current graph outputs in the result cache
+
+		:param cache_keys: Keys returned by ``_getResultCacheKeys``
+		"""
+		for (cell_id, port_name), key in zip(self._outputs, cache_keys):
+			try:
+				self._result_cache.put(key, self.cellList[cell_id].outputs[port_name])
+			except Exception as e:
+				# Values which cannot be pickled (such as most Boost.Python
+				# objects) are not cached
+				warn("Output %s.%s is not cached: %s"%(cell_id, port_name, e))
+
+	def _getRunSettings(self):
+		"""
+		Returns what a worker process needs to run like this graph
+		"""
+		output_cache_limits = None
+		if self._output_cache is not None:
+			output_cache_limits = (
+			    self._output_cache.max_bytes,
+			    self._output_cache.max_entries
+			)
+		result_cache = None
+		if self._result_cache is not None:
+			result_cache = (
+			    self._result_cache.path,
+			    self._result_cache_key,
+			    self._result_cache.max_bytes
+			)
+		frame_cache = None
+		if len(self._frame_cells) > 0:
+			frame_cache = (list(self._frame_cells), Graph._frame_cache.max_bytes)
+		return dict(
+		    iteration=self._params_handler.getIterationSettings(),
+		    output_cache=output_cache_limits,
+		    result_cache=result_cache,
+		    frame_cache=frame_cache
+		)
+
+	def _executeCells(self, runner, cells_to_rerun):
+		"""
+		Executes cells with the runner, or one by one when profiling
+
+		:param runner: Function returned by ``_prepareRunner``
+		:param cells_to_rerun: Names of the cells to execute with their
+		downstream cells, or 1 to execute all cells
+		"""
+		frame_keys = dict()
+		if len(self._frame_cells) > 0 and len(self.plasm.cells()) > 0:
+			cells_to_rerun, frame_keys = self._restoreFrames(cells_to_rerun)
+			if len(cells_to_rerun) == 0:
+				return
+
+		self._runCells(runner, cells_to_rerun)
+
+		for cell_name, key in frame_keys.iteritems():
+			cell = self.cellList[cell_name]
+			Graph._frame_cache.put(key, dict([
+			    (port_name, getattr(cell.outputs, port_name))\
+			    for port_name in cell.outputs.keys()
+			]))
+
+	def _restoreFrames(self, cells_to_rerun):
+		"""
+		Sets the outputs of the frame cells about to be executed from the
+		frame cache, when found there
+
+		:param cells_to_rerun: Names of the cells to execute with their
+		downstream cells, or 1 to execute all cells
+		:return: Names of the cells still to execute with their downstream
+		cells, and keys of the frame cells to store in the cache once executed
+		"""
+		if cells_to_rerun == 1:
+			# Executing all cells is executing the cells without inputs
+			upstream_cells = set([
+			    downstream for (_, _, downstream, _) in self._connections
+			])
+			cells_to_rerun = [
+			    cell.name() for cell in self.plasm.cells()\
+			    if not cell.name() in upstream_cells
+			]
+
+		remaining_cells = []
+		frame_keys = dict()
+		for cell_name in cells_to_rerun:
+			cell = self.cellList[cell_name]
+			key = None
+			if cell_name in self._frame_cells\
+			   and len(self.getUpstreamCells([cell_name])) == 1:
+				key = [type(cell).__module__, type(cell).__name__]
+				for param_name in sorted(cell.params.keys()):
+					key.append((param_name, _getFrameKeyValue(getattr(cell.params, param_name))))
+				key = tuple(key)
+				if None in [value for _, value in key[2:]]:
+					key = None
+			if key is None:
+				remaining_cells.append(cell_name)
+			elif key in Graph._frame_cache:
+				for port_name, value in Graph._frame_cache.get(key).iteritems():
+					setattr(cell.outputs, port_name, value)
+				Graph._frame_cache.hits += 1
+				remaining_cells.extend([
+				    downstream for (upstream, _, downstream, _) in self._connections\
+				    if upstream == cell_name
+				])
+			else:
+				Graph._frame_cache.misses += 1
+				frame_keys[cell_name] = key
+				remaining_cells.append(cell_name)
+		return sorted(set(remaining_cells)), frame_keys
+
+	def _runCells(self, runner, cells_to_rerun):
+		"""
+		Executes cells with the runner, or one by one when profiling
+
+		:param runner: Function returned by ``_prepareRunner``
+		:param cells_to_rerun: Names of the cells to execute with their
+		downstream cells, or 1 to execute all cells
+		"""
+		if self._profiler is None:
+			runner(cells_to_rerun)
+			return
+
+		if len(self.plasm.cells()) == 0:
+			cells_to_execute = self.cellList.keys()
+		elif cells_to_rerun == 1:
+			cells_to_execute = self._getTopologicalOrder()
+		else:
+			dirty_cells = self.getDownstreamCells(cells_to_rerun)
+			cells_to_execute = [
+			    cell_name for cell_name in self._getTopologicalOrder()\
+			    if cell_name in dirty_cells
+			]
+
+		# Do what the scheduler does, timing each cell
+		for cell_name in cells_to_execute:
+			cell = self.cellList[cell_name]
+			for (upstream, output_port, downstream, input_port) in self._connections:
+				if downstream == cell_name:
+					setattr(
+					    cell.inputs,
+					    input_port,
+					    getattr(self.cellList[upstream].outputs, output_port)
+					)
+			start = time.time()
+			cell.process()
+			self._profiler.record(cell_name, start, time.time()-start)
+
+	def _getTopologicalOrder(self):
+		"""
+		Returns names of the connected cells, each after its upstream cells
+		"""
+		if self._topological_order is None:
+			upstream_counts = dict([(cell.name(), 0) for cell in self.plasm.cells()])
+			for (_, _, downstream, _) in self._connections:
+				upstream_counts[downstream] += 1
+			ready_cells = sorted([c for c, n in upstream_counts.iteritems() if n == 0])
+			self._topological_order = []
+			while len(ready_cells) > 0:
+				cell_name = ready_cells.pop(0)
+				self._topological_order.append(cell_name)
+				for (upstream, _, downstream, _) in self._connections:
+					if upstream == cell_name:
+						upstream_counts[downstream] -= 1
+						if upstream_counts[downstream] == 0:
+							ready_cells.append(downstream)
+		return self._topological_order
+
+	def _getComputationResult(self):
+		"""
+		Returns current outputs, with the inputs and parameters used
+		"""
+		return dict(
+		    outputs=[
+		        self.cellList[self._outputs[i][0]].outputs[self._outputs[i][1]]\
+		        for i in range(len(self._outputs))
+		    ],
+		    inputs=self._inputs_handler.getCurrentInputCombination(),
+		    params=self._params_handler.getCurrentParamCombination(),
+		)
+
+	def step(self):
+		"""
+		Runs the graph once, with the current parameter values and inputs
+
+		This is a cheaper alternative to ``run`` when the graph is fed frame
+		by frame: the scheduler is reused, and only the cells reparametrized
+		with ``setSwitchingParameters`` or whose inputs were set since the
+		previous step are executed again, with their downstream cells. All
+		cells are executed if nothing changed, or on the first step after
+		``run`` or a topology change. Swept parameters keep their first value.
+		With a result cache (see ``setResultCache``), outputs found in it are
+		restored instead, and all cells are executed on the next step.
+
+		:return: Computation result, as the items of ``result`` (None if the
+		graph is empty)
+		"""
+		runner = self._getRunner()
+		if runner is None:
+			return None
+
+		cache_keys = None
+		if self._result_cache is not None:
+			cache_keys = self._getResultCacheKeys()
+		if cache_keys is not None and self._restoreCachedOutputs(cache_keys):
+			# Cells did not run, they are not up to date anymore
+			self._stepped = False
+		else:
+			modified_cells = self._reparametrized_cells | self._inputs_handler.modified_cells
+			if self._profiler is not None:
+				self._profiler.beginRun(
+				    self._inputs_handler.input_index,
+				    self._params_handler.getCurrentParamCombination()
+				)
+			if self._stepped and len(modified_cells) > 0:
+				self._executeCells(runner, list(modified_cells))
+			else:
+				self._executeCells(runner, 1)
+			self._stepped = True
+			if cache_keys is not None:
+				self._cacheOutputs(cache_keys)
+		self._reparametrized_cells.clear()
+		self._inputs_handler.modified_cells.clear()
+		return self._getComputationResult()
+
+	def countParamCombinations(self):
+		"""
+		Returns the number of parameter combinations ``run`` iterates on
+		"""
+		return self._params_handler.getCombinationCount()
+
+	def _runChunk(self, run_settings, input_combinations, first, last):
+		"""
+		Runs combinations [first, last[ of a sweep split by ``_iterInPool``
+
+		:param run_settings: Dict returned by ``_getRunSettings`` on the
+		parent graph
+		:param input_combinations: All input combinations of the sweep
+		:param first: Rank of the first combination to run
+		:param last: Rank following the last combination to run
+		:return: ResultStore of the computation results
+		"""
+		if run_settings["output_cache"] is not None:
+			self.setOutputCache(*run_settings["output_cache"])
+		if run_settings["result_cache"] is not None:
+			self.setResultCache(*run_settings["result_cache"])
+		if run_settings["frame_cache"] is not None:
+			self.setFrameCache(*run_settings["frame_cache"])
+		runner = self._prepareRunner()
+		self._params_handler.setIterationSettings(run_settings["iteration"])
+		if self._output_cache is not None:
+			self._prepareOutputCacheKeys()
+		input_index, param_rank = divmod(
+		    first,
+		    self._params_handler.getCombinationCount()
+		)
+		self._params_handler.setParamCombination(param_rank)
+		if len(self._inputs_handler) > 0:
+			self._inputs_handler._input_combinations = collections.deque(input_combinations[input_index:])
+			self._inputs_handler.setNextInputCombination()
+		result_store = self._createResultStore()
+		for _ in self._iterCombinations(runner, last-first):
+			self._storeResult(result_store)
+		return result_store
+
+	def _iterInPool(self, workers, first_rank=0):
+		"""
+		Shares the sweep between several worker processes
+
+		:param workers: Number of worker processes
+		:param first_rank: Rank of the first parameter combination to run on
+		the current input combination
+		:return: Generator of ResultStore, in serial order
+		"""
+		if self._factory is None:
+			raise Exception(
+			    "Graph cannot be rebuilt in a worker process. Use createFromDict or setFactory"
+			)
+
+		# Gather all input combinations, including the one currently set
+		if len(self._inputs_handler) > 0:
+			input_combinations = [tuple(self._inputs_handler.getCurrentInputCombination())]
+			input_combinations.extend(self._inputs_handler.popPendingCombinations())
+		else:
+			input_combinations = [()]
+
+		param_combination_count = self._params_handler.getCombinationCount()
+		total = len(input_combinations) * param_combination_count
+		chunk_size = max(1, -(-total // (4*workers)))
+		jobs = []
+		for first in range(first_rank, total, chunk_size):
+			last = min(first+chunk_size, total)
+			# Only send the inputs needed by the chunk
+			first_input = first // param_combination_count
+			last_input = (last-1) // param_combination_count + 1
+			offset = first_input * param_combination_count
+			jobs.append((
+			    self._factory[0],
+			    self._factory[1],
+			    self._param_overrides.items(),
+			    self._getRunSettings(),
+			    input_combinations[first_input:last_input],
+			    first - offset,
+			    last - offset
+			))
+
+		pool = multiprocessing.Pool(min(workers, len(jobs)))
+		try:
+			for chunk in pool.imap(_runSweepChunk, jobs):
+				yield chunk
+		except BaseException:
+			pool.terminate()
+			raise
+		else:
+			pool.close()
+		finally:
+			pool.join()
+
+		# Leave the graph as a serial run would
+		for i in range(len(input_combinations[-1])):
+			self._inputs_handler[i] = input_combinations[-1][i]
+		self._params_handler.reset()
+
+	def _createResultStore(self, max_count=None, reduction=None, result_log=None):
+		"""
+		Returns an empty ResultStore for the current outputs and parameters
+
+		Parameters are sorted by name, so that stores created by workers have
+		the same columns.
+
+		:param max_count: Number of most recent results kept (all if None)
+		:param reduction: Function applied to output values before they are
+		kept, or None
+		:param result_log: (folder, segment size) of a ResultLog to create
+		instead of a ResultStore, or None
+		"""
+		self._result_param_keys = self._getResultParamKeys()
+		columns = dict(
+		    param_names=[
+		        cell.name()+"."+param_name\
+		        for cell, param_name in self._result_param_keys
+		    ],
+		    param_values=[
+		        self._params_handler.parameter_storage[param_key][0]\
+		        for param_key in self._result_param_keys
+		    ],
+		    output_names=["%s.%s"%output for output in self._outputs],
+		    input_names=["%s.%s"%i for i in self._inputs_handler._input_port_list]
+		)
+		if result_log is not None:
+			return ResultLog.create(
+			    result_log[0],
+			    reduction=reduction,
+			    segment_size=result_log[1],
+			    **columns
+			)
+		return ResultStore(max_count=max_count, reduction=reduction, **columns)
+
+	def _getResultParamKeys(self):
+		"""
+		Returns the swept parameters, in the order of result store columns
+		"""
+		return sorted(
+		    self._params_handler.parameter_storage.keys(),
+		    key=lambda x: (x[0].name(), x[1])
+		)
+
+	def _restoreResultStore(self, checkpoint):
+		"""
+		Returns the store of the results done before a checkpoint, ready to
+		receive the following results
+
+		:param checkpoint: Dict loaded by ``_loadCheckpoint``
+		"""
+		self._result_param_keys = self._getResultParamKeys()
+		if self._result_log is not None:
+			return ResultLog.reopen(
+			    self._result_log[0],
+			    checkpoint["done"],
+			    self._result_retention["reduction"],
+			    self._result_log[1]
+			)
+		# Results are not kept
+		return self._createResultStore(0, self._result_retention["reduction"])
+
+	def _getSweepSignature(self):
+		"""
+		Returns a hash of what a sweep checkpoint depends on, besides the key
+		given to ``setCheckpoint``
+		"""
+		return tools.hashJSON(dict(
+		    params=sorted([
+		        (cell.name(), param_name, param_value[0])\
+		        for (cell, param_name), param_value\
+		        in self._params_handler.parameter_storage.iteritems()
+		    ]),
+		    outputs=self._outputs,
+		    inputs=self._inputs_handler._input_port_list,
+		    result_log=self._result_log is not None
+		))
+
+	def _loadCheckpoint(self):
+		"""
+		Returns the checkpoint to resume from, None to start from scratch
+		"""
+		if self._checkpoint is None or not self._checkpoint["resume"]:
+			return None
+		# Only resume the next run
+		self._checkpoint["resume"] = False
+		checkpoint = tools.loadCheckpoint(
+		    self._checkpoint["path"],
+		    self._checkpoint["key"]
+		)
+		if checkpoint is None or checkpoint["sweep"] != self._getSweepSignature():
+			return None
+		return checkpoint
+
+	def _saveCheckpoint(self, done):
+		"""
+		Saves the progress of the running sweep
+
+		:param done: Number of combinations done
+		"""
+		get_state = self._checkpoint["get_state"]
+		tools.saveCheckpoint(dict(
+		    key=self._checkpoint["key"],
+		    sweep=self._getSweepSignature(),
+		    iteration=self._params_handler.getIterationSettings(),
+		    done=done,
+		    state=None if get_state is None else get_state()
+		), self._checkpoint["path"])
+
+	def _storeResult(self, result_store):
+		"""
+		Appends the current outputs, inputs and parameters to a result store
+
+		:param result_store: Store returned by ``_createResultStore``
+		"""
+		parameter_storage = self._params_handler.parameter_storage
+		result_store.append(
+		    [
+		        self.cellList[cell_id].outputs[port_name]\
+		        for cell_id, port_name in self._outputs
+		    ],
+		    [parameter_storage[param_key][1] for param_key in self._result_param_keys],
+		    self._inputs_handler.input_index,
+		    self._inputs_handler.getCurrentInputCombination
+		)
 
 	def setPortAsGraphOutput(self, cell_id, port_name, *args, **kwargs):
 		"""
@@ -349,6 +1524,376 @@ class Graph(object):
 		"""
 		self._inputs_handler = Graph._InputHandler(self.cellList)
 
+	def setGrayCodeEnumeration(self, enabled=True):
+		"""
+		Chooses the order in which parameter combinations are run
+
+		By default, parameters are enumerated like an odometer: when a
+		parameter wraps, the next one changes too, so several cells must be
+		re-executed at once. With Gray-code enumeration, each step changes
+		exactly one parameter value. Results are then produced in a different
+		order.
+
+		:param enabled: True to use Gray-code enumeration
+		"""
+		self._params_handler.gray_code = enabled
+
+	def countCellExecutions(self, gray_code=None):
+		"""
+		Predicts how many cell executions running the graph requires
+
+		:param gray_code: Enumeration to consider (current one if None)
+		:return: Number of cell executions for all pending input combinations
+		(only the current one if they are given by an iterator)
+		"""
+		return self.predictSweepCost(gray_code=gray_code)
+
+	def predictSweepCost(self, cell_costs=None, gray_code=None, order_by_cost=None):
+		"""
+		Predicts the cost of running the graph
+
+		:param cell_costs: Dict associating cell names to their cost (each
+		cell costs 1 if None)
+		:param gray_code: Enumeration to consider (current one if None)
+		:param order_by_cost: If True, swept parameters are ordered using
+		``cell_costs`` (or the costs given to ``setCellCosts``), if False they
+		are ordered by depth (current ordering if None)
+		:return: Cost of running all pending input combinations (only the
+		current one if they are given by an iterator)
+		"""
+		if self._prepareRunner() is None:
+			return 0
+
+		params_handler = self._params_handler
+		if gray_code is None:
+			gray_code = params_handler.gray_code
+		current_enumeration = params_handler.gray_code
+		params_handler.gray_code = gray_code
+		try:
+			if order_by_cost is not None:
+				ordering_costs = None
+				if order_by_cost:
+					ordering_costs = cell_costs if cell_costs is not None else self._cell_costs
+				self._sortParameters(ordering_costs)
+			changes = params_handler.countChanges()
+		finally:
+			params_handler.gray_code = current_enumeration
+			self._sortParameters(self._cell_costs)
+
+		# Every cell runs for the first combination
+		if len(self.plasm.cells()) > 0:
+			all_cells = [cell.name() for cell in self.plasm.cells()]
+		else:
+			all_cells = self.cellList.keys()
+		cost = self._getRerunCost(all_cells, cell_costs)
+		for changed_cells, step_count in changes:
+			cost += step_count * self._getRerunCost(changed_cells, cell_costs)
+
+		# Inputs given by an iterator cannot be counted in advance
+		input_combination_count = 1
+		if len(self._inputs_handler) > 0:
+			input_combination_count += self._inputs_handler.getPendingCount() or 0
+		return cost * input_combination_count
+
+	def measureCellCosts(self, repeat=3):
+		"""
+		Times each cell of the graph during a short calibration pass
+
+		The graph is executed with the current parameters and inputs, then
+		each cell is re-executed ``repeat`` times with its downstream cells.
+		The cost of a cell is what it adds to the cost of its downstream
+		cells.
+
+		Cells keeping a state from one execution to the next (counters,
+		trackers...) would be changed by these executions. If the graph can
+		be rebuilt (see ``setFactory``), a new graph with the same switching
+		parameters and inputs is timed instead, and the cells of this graph
+		are left untouched. Otherwise, this graph is executed
+		``1 + repeat*cell count`` times, before the sweep.
+
+		:param repeat: Number of timings per cell (the fastest is kept)
+		:return: Dict associating cell names to their cost in seconds
+		"""
+		if self._factory is None:
+			return self._timeCells(repeat)
+		graph = self._factory[0](*self._factory[1])
+		for (cell_id, param_name), values in self._param_overrides.iteritems():
+			graph.setSwitchingParameters(cell_id, param_name, values)
+		current_inputs = self._inputs_handler.getCurrentInputCombination()
+		for i in range(len(current_inputs)):
+			graph._inputs_handler[i] = current_inputs[i]
+		return graph._timeCells(repeat)
+
+	def _timeCells(self, repeat):
+		"""
+		Times each cell of this graph, see ``measureCellCosts``
+		"""
+		runner = self._prepareRunner()
+		if runner is None:
+			return dict()
+
+		def best_time(function, *args):
+			best = None
+			for _ in range(repeat):
+				start = time.time()
+				function(*args)
+				elapsed = time.time() - start
+				best = elapsed if best is None else min(best, elapsed)
+			return best
+
+		if len(self.plasm.cells()) == 0:
+			return dict([
+			    (cell_name, best_time(cell.process))\
+			    for cell_name, cell in self.cellList.iteritems()
+			])
+
+		runner(1)
+		rerun_times = dict([
+		    (cell.name(), best_time(runner, [cell.name()]))\
+		    for cell in self.plasm.cells()
+		])
+
+		cell_costs = dict()
+		def own_cost(cell_name):
+			if not cell_costs.has_key(cell_name):
+				downstream_cost = sum([
+				    own_cost(downstream_cell)\
+				    for downstream_cell in self.getDownstreamCells([cell_name])\
+				    if downstream_cell != cell_name
+				])
+				cell_costs[cell_name] = max(0., rerun_times[cell_name] - downstream_cost)
+			return cell_costs[cell_name]
+		for cell_name in rerun_times:
+			own_cost(cell_name)
+		return cell_costs
+
+	def setCellCosts(self, cell_costs):
+		"""
+		Orders swept parameters using the cost of each cell
+
+		Parameters whose change triggers the most expensive re-executions
+		then change the least often. Costs can come from ``measureCellCosts``
+		or from a previous run.
+
+		:param cell_costs: Dict associating cell names to their cost, None to
+		order parameters by depth again
+		"""
+		self._cell_costs = cell_costs
+
+	def setOutputCache(self, max_bytes, max_entries=None):
+		"""
+		Memoizes cell outputs during parameter sweeps
+
+		Outputs of each cell are stored, keyed by the values of the swept
+		parameters of the cell and of all its upstream cells. When the same
+		values come back, the outputs are restored instead of executing the
+		cell again. Cells must then give the same outputs for the same
+		parameters and inputs. The cache is emptied when inputs change.
+
+		:param max_bytes: Maximum estimated size of stored outputs, None or 0
+		to disable the cache
+		:param max_entries: Maximum number of stored snapshots (no limit if None)
+		"""
+		if not max_bytes:
+			self._output_cache = None
+		else:
+			self._output_cache = Graph._OutputCache(max_bytes, max_entries)
+
+	def setFrameCache(self, cell_ids, max_bytes=512*1024*1024):
+		"""
+		Shares the outputs of cells reading files between runs and graphs
+
+		Outputs of the given cells are kept in a LRU cache common to all
+		graphs of the process, keyed by the type and parameter values of the
+		cells, files being identified by their path and modification time.
+		When a cell would be executed with values found in the cache, its
+		outputs are restored instead, and only its downstream cells are
+		executed. Cells with inputs are always executed.
+
+		:param cell_ids: Names of the cells whose outputs only depend on their
+		parameters, such as image readers. Cache is not used if empty.
+		:param max_bytes: Maximum estimated size of the cache, shared by all
+		graphs of the process. Values whose data cannot be measured count as
+		a VGA color image.
+		"""
+		self._frame_cells = set(cell_ids)
+		if Graph._frame_cache is None:
+			Graph._frame_cache = Graph._OutputCache(max_bytes, opaque_size=_OPAQUE_FRAME_SIZE)
+		else:
+			Graph._frame_cache.max_bytes = max_bytes
+
+	def setResultCache(self, path, key, max_bytes=1024*1024*1024):
+		"""
+		Keeps the outputs computed by ``run`` on disk, to reuse them in later
+		invocations
+
+		Outputs are stored per output port, keyed by the given key, the
+		values of all swept parameters and the input values. Values naming an
+		existing file are identified by the file content. Combinations whose
+		outputs are all found are not run. Combinations with values which
+		cannot be identified, as objects represented by their address, are
+		always run. Cells must give the same outputs for the same parameters
+		and inputs.
+
+		:param path: Folder of the cache, shared between invocations. None to
+		disable the cache.
+		:param key: Anything identifying the graph, typically a hash of its
+		description (cells, connections and parameter values)
+		:param max_bytes: Maximum size of the cache, least recently used
+		outputs are removed to stay below it
+		"""
+		if path is None:
+			self._result_cache = None
+		else:
+			self._result_cache = ResultCache(path, max_bytes)
+		self._result_cache_key = key
+
+	@property
+	def result_cache_statistics(self):
+		"""
+		Hits, misses and size (in bytes) of the result cache
+		"""
+		if self._result_cache is None:
+			return None
+		return self._result_cache.getStatistics()
+
+	def setResultRetention(self, keep=None, reduction=None, callback=None):
+		"""
+		Chooses what ``run`` keeps in ``result`` and ``output``
+
+		By default, every output of every combination is kept until the next
+		run, which can use a lot of memory on long sweeps.
+
+		:param keep: Number of most recent results kept (all if None, none if 0)
+		:param reduction: Function applied to each output value before it is
+		kept, to keep for instance a summary or a hash of an image instead of
+		the image itself
+		:param callback: Function called with each computation result (as the
+		items of ``result``, before reduction) as soon as it is computed,
+		whatever is kept
+		"""
+		if keep is not None and keep < 0:
+			raise Exception("Number of kept results cannot be negative")
+		self._result_retention = dict(
+		    keep=keep,
+		    reduction=reduction,
+		    callback=callback
+		)
+
+	def setResultLog(self, path, segment_size=256*1024*1024):
+		"""
+		Writes the results of ``run`` to disk instead of keeping them in memory
+
+		Results are appended to a ResultLog in the given folder, replacing
+		any previous log, and ``result`` reads them back on access. The log
+		can be opened with ``ResultLog(path)`` by another process while the
+		sweep is running. The reduction and callback of
+		``setResultRetention`` still apply, but all results are written.
+
+		:param path: Folder of the log, None to keep results in memory
+		:param segment_size: Size (in bytes) of the files the log is split into
+		"""
+		if path is None:
+			self._result_log = None
+		else:
+			self._result_log = (path, segment_size)
+
+	def setCheckpoint(self, path, key=None, interval=60., resume=False,
+	                  get_state=None, set_state=None):
+		"""
+		Periodically saves the progress of ``run``, to resume it if interrupted
+
+		The checkpoint only holds the number of combinations done and the
+		iteration order, so that saving it does not depend on the number of
+		results. Results must then either be written to a result log (see
+		``setResultLog``), reopened when resuming, or not be kept (see
+		``setResultRetention``), ``run`` raises otherwise. A checkpoint is
+		only resumed if it was saved with the same key, parameter values,
+		inputs and outputs. Input combinations must be set again, as before
+		the interrupted run. Results done before the checkpoint are not given
+		to the retention callback again: what the callback computed from them
+		can be saved with ``get_state``.
+
+		:param path: File to save the checkpoint to, None to disable
+		:param key: Anything identifying the graph and its data, typically a
+		hash of the graph description
+		:param interval: Minimum time (in s) between two saves. A checkpoint
+		is also saved at the end of the run.
+		:param resume: If True and a matching checkpoint exists, the next run
+		continues from it
+		:param get_state: Function returning a picklable value saved with
+		each checkpoint, such as counters updated by the retention callback
+		:param set_state: Function given the value returned by ``get_state``
+		when a run resumes from a checkpoint
+		"""
+		if path is None:
+			self._checkpoint = None
+		else:
+			self._checkpoint = dict(
+			    path=path,
+			    key=key,
+			    interval=interval,
+			    resume=resume,
+			    get_state=get_state,
+			    set_state=set_state
+			)
+
+	def enableProfiling(self, enabled=True):
+		"""
+		Records the wall time of each cell execution
+
+		While profiling, cells are executed one by one from Python, in the
+		order the scheduler would use, with data moved along connections
+		between them. Recorded executions are available through ``profiler``.
+		Parallel runs are not profiled.
+
+		:param enabled: True to start profiling (previous records are kept),
+		False to stop
+		"""
+		if not enabled:
+			self._profiler = None
+		elif self._profiler is None:
+			self._profiler = Profiler()
+
+	@property
+	def profiler(self):
+		"""
+		Profiler holding recorded executions, None if profiling is disabled
+		"""
+		return self._profiler
+
+	@property
+	def frame_cache_statistics(self):
+		"""
+		Hits, misses, hit rate, entries and size (in bytes) of the frame
+		cache, for all graphs of the process
+		"""
+		if Graph._frame_cache is None:
+			return None
+		return Graph._frame_cache.getStatistics()
+
+	@property
+	def output_cache_statistics(self):
+		"""
+		Hits, misses, entries and size (in bytes) of the output cache
+		"""
+		if self._output_cache is None:
+			return None
+		return self._output_cache.getStatistics()
+
+	def getSwitchingParameters(self):
+		"""
+		Returns the parameters taking different values
+
+		:return: List of (cell name, parameter name, list of values)
+		"""
+		return [
+		    (cell.name(), param_name, list(param_value[0]))\
+		    for (cell, param_name), param_value\
+		    in sorted(self._params_handler.parameter_storage.iteritems(),
+		              key=lambda x: (x[0][0].name(), x[0][1]))
+		]
+
 	def setSwitchingParameters(self, cell_id, param_name, values):
 		"""
 		Set different possible values for a parameter
@@ -357,6 +1902,8 @@ class Graph(object):
 		:param param_name: Name of the variable parameter
 		:param values: List of values the parameter can take
 		"""
+		self._param_overrides[(cell_id, param_name)] = list(values)
+		self._reparametrized_cells.add(str(cell_id))
 		self._params_handler.setParameterPossibleValues(cell_id,
 		                                                param_name,
 		                                                values)
@@ -373,6 +1920,8 @@ class Graph(object):
 			)
 		if isinstance(value, list):
 			self.inputs = [(i,) for i in value]
+		elif isinstance(value, collections.Iterator):
+			self.inputs = ((i,) for i in value)
 		else:
 			self.inputs[0] = value
 
@@ -382,6 +1931,10 @@ class Graph(object):
 
 	@inputs.setter
 	def inputs(self, values):
+		"""
+		Sets the input combinations to run on (see
+		``_InputHandler.input_combinations``)
+		"""
 		if len(self._inputs_handler) == 0:
 			raise IndexError("No input was set for graph")
 		self._inputs_handler.input_combinations = values
@@ -390,15 +1943,29 @@ class Graph(object):
 	def output(self):
 		if len(self._outputs) == 0:
 			raise Exception("No output was set for graph")
-		if len(self._graph_output_buffer)==0:
+		if len(self._result_store)==0:
 			return None
-		if len(self._graph_output_buffer)==1:
-			return self._graph_output_buffer[0]
-		return self._graph_output_buffer
+		if len(self._outputs)>1:
+			outputs = zip(*[
+			    self._result_store.getOutputColumn(i)\
+			    for i in range(len(self._outputs))
+			])
+		else:
+			outputs = self._result_store.getOutputColumn(0)
+		if len(outputs)==1:
+			return outputs[0]
+		return outputs
 
 	@property
 	def result(self):
-		return self._graph_result_buffer
+		"""
+		Results of the last run, as a ResultStore (or a ResultLog, see
+		``setResultLog``)
+
+		Items are dict with ``outputs``, ``inputs`` and ``params`` keys, built
+		on access. Use ``ResultStore.exportNPZ`` to save all of them at once.
+		"""
+		return self._result_store
 
 	def size(self):
 		return len(self.cellList)
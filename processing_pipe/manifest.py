@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+The manifest module keeps what is read from QiData files and datasets on
+disk from one invocation to the next
+"""
+
+# Standard libraries
+import cPickle
+import hashlib
+import os
+
+# Third-party libraries
+import qidata
+from qidata import QiDataSet
+
+# Local modules
+from dataset_pack import DataSetPack, isPack
+
+class ManifestCache(object):
+	"""
+	On-disk cache of the types, streams and annotations of QiData files
+
+	There is one manifest per folder: a QiDataSet, or a folder containing
+	QiDataFiles. The entry of a file is valid as long as the modification
+	time and size of the file are unchanged, the entry of a dataset as long
+	as those of all the files directly in its folder are unchanged. Each
+	file and folder is only checked once by a cache instance. Manifests are
+	written by ``save``.
+
+	Dataset packs (see ``packDataSet``) are read from their header instead,
+	the files of a pack being given by the pack path followed by their name.
+
+	:param path: Folder of the manifests, created if needed
+	"""
+	def __init__(self, path):
+		self.path = path
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self._manifests = dict()
+		self._modified = set()
+		self._signatures = dict()
+		self._packs = dict()
+
+	def _getPack(self, path):
+		"""
+		Returns the DataSetPack of a path, None if it is not a pack
+		"""
+		path = os.path.abspath(path)
+		if not self._packs.has_key(path):
+			self._packs[path] = DataSetPack(path) if isPack(path) else None
+		return self._packs[path]
+
+	def _getManifestPath(self, folder):
+		return os.path.join(self.path, hashlib.sha1(folder).hexdigest())
+
+	def _getManifest(self, folder):
+		"""
+		Returns the manifest of a folder, loading it if needed
+		"""
+		folder = os.path.abspath(folder)
+		if not self._manifests.has_key(folder):
+			manifest = dict(folder=folder, files=dict(), dataset=None)
+			try:
+				with open(self._getManifestPath(folder), "rb") as f:
+					stored_manifest = cPickle.load(f)
+				if stored_manifest["folder"] == folder:
+					manifest = stored_manifest
+			except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+				pass
+			self._manifests[folder] = manifest
+		return self._manifests[folder]
+
+	def _getSignature(self, file_path):
+		"""
+		Returns (modification time, size) of a file
+		"""
+		if not self._signatures.has_key(file_path):
+			stat = os.stat(file_path)
+			self._signatures[file_path] = (stat.st_mtime, stat.st_size)
+		return self._signatures[file_path]
+
+	def _getDataSetSignature(self, dataset_path):
+		"""
+		Returns a hash of the names and signatures of the files of a dataset
+		"""
+		if not self._signatures.has_key(dataset_path):
+			signature = hashlib.sha1()
+			for file_name in sorted(os.listdir(dataset_path)):
+				signature.update(repr((
+				    file_name,
+				    self._getSignature(os.path.join(dataset_path, file_name))
+				)))
+			self._signatures[dataset_path] = signature.hexdigest()
+		return self._signatures[dataset_path]
+
+	def _getDataSetEntry(self, dataset_path):
+		manifest = self._getManifest(dataset_path)
+		signature = self._getDataSetSignature(dataset_path)
+		if manifest["dataset"] is None or manifest["dataset"]["signature"] != signature:
+			manifest["dataset"] = dict(
+			    signature=signature,
+			    streams=dict(),
+			    annotations_available=None
+			)
+			self._modified.add(manifest["folder"])
+		return manifest
+
+	def getFileInfo(self, file_path):
+		"""
+		Returns the type and annotations of a QiDataFile
+
+		:param file_path: Path of the file
+		:return: Dict with ``type`` (name of the QiData type) and
+		``annotations`` keys
+		:raise: TypeError if the file is not supported by QiData
+		"""
+		pack = self._getPack(os.path.dirname(file_path))
+		if pack is not None:
+			return pack.getFileInfo(os.path.basename(file_path))
+		manifest = self._getManifest(os.path.dirname(os.path.abspath(file_path)))
+		file_name = os.path.basename(file_path)
+		signature = self._getSignature(file_path)
+		entry = manifest["files"].get(file_name)
+		if entry is None or entry[0] != signature:
+			try:
+				with qidata.open(file_path, "r") as _f:
+					info = dict(type=str(_f.type), annotations=_f.annotations)
+			except TypeError:
+				info = None
+			entry = (signature, info)
+			manifest["files"][file_name] = entry
+			self._modified.add(manifest["folder"])
+		if entry[1] is None:
+			raise TypeError("%s is not supported by QiData"%file_path)
+		return entry[1]
+
+	def getDataSetStreams(self, dataset_path, type_name):
+		"""
+		Returns the streams of a given type in a QiDataSet
+
+		:param dataset_path: Path of the dataset
+		:param type_name: Name of the QiData type of the streams
+		:return: List of dicts associating timestamps to file names, in the
+		order given by ``QiDataSet.getStreamsOfType``
+		"""
+		pack = self._getPack(dataset_path)
+		if pack is not None:
+			return pack.getDataSetStreams(type_name)
+		manifest = self._getDataSetEntry(dataset_path)
+		streams = manifest["dataset"]["streams"]
+		if not streams.has_key(type_name):
+			with QiDataSet(dataset_path, "r") as _ds:
+				streams[type_name] = [
+				    dict(stream) for stream in _ds.getStreamsOfType(
+				        qidata.DataType[type_name]
+				    ).values()
+				]
+			self._modified.add(manifest["folder"])
+		return streams[type_name]
+
+	def getDataSetAnnotations(self, dataset_path):
+		"""
+		Returns the annotations available in a QiDataSet
+
+		:param dataset_path: Path of the dataset
+		:return: List of (annotator, metadata type)
+		"""
+		pack = self._getPack(dataset_path)
+		if pack is not None:
+			return pack.getDataSetAnnotations()
+		manifest = self._getDataSetEntry(dataset_path)
+		if manifest["dataset"]["annotations_available"] is None:
+			with QiDataSet(dataset_path, "r") as _ds:
+				manifest["dataset"]["annotations_available"] = list(
+				    _ds.annotations_available.keys()
+				)
+			self._modified.add(manifest["folder"])
+		return manifest["dataset"]["annotations_available"]
+
+	def save(self):
+		"""
+		Writes the manifests modified since the last call
+
+		Each manifest is written atomically, several processes can share the
+		manifest folder.
+		"""
+		for folder in self._modified:
+			manifest_path = self._getManifestPath(folder)
+			temporary_path = "%s.%d.tmp"%(manifest_path, os.getpid())
+			with open(temporary_path, "wb") as f:
+				cPickle.dump(self._manifests[folder], f, cPickle.HIGHEST_PROTOCOL)
+			os.rename(temporary_path, manifest_path)
+		self._modified = set()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+The matching module pairs graph outputs with annotations
+"""
+
+# Third-party libraries
+import numpy
+
+def _isBox(location):
+	return len(location) == 2 and isinstance(location[0], (list, tuple, numpy.ndarray))
+
+def locationMatrix(annotation_boxes, output_locations):
+	"""
+	Tells which output locations match which annotation boxes
+
+	A point matches a box containing it. A box matches a box containing it,
+	or a box sharing more than half of the volume of each of them. Locations
+	of different dimensions never match.
+
+	:param annotation_boxes: Boxes given by their two extremal points, or
+	None for annotations matching any location
+	:param output_locations: Boxes given by their two extremal points, or
+	points
+	:return: (matches, overlaps) arrays with a row per annotation and a
+	column per output. Overlaps are the intersections over union of matching
+	boxes, 1 for other matches.
+	"""
+	matches = numpy.zeros((len(annotation_boxes), len(output_locations)), dtype=bool)
+	overlaps = numpy.zeros(matches.shape)
+
+	# Group locations by kind and dimension, to compare each group at once
+	annotation_groups = dict()
+	for i in range(len(annotation_boxes)):
+		if annotation_boxes[i] is None:
+			matches[i] = True
+			overlaps[i] = 1.
+		else:
+			annotation_groups.setdefault(len(annotation_boxes[i][0]), []).append(i)
+	box_groups = dict()
+	point_groups = dict()
+	for j in range(len(output_locations)):
+		if _isBox(output_locations[j]):
+			box_groups.setdefault(len(output_locations[j][0]), []).append(j)
+		else:
+			point_groups.setdefault(len(output_locations[j]), []).append(j)
+
+	for dimension, rows in annotation_groups.iteritems():
+		boxes = numpy.array([annotation_boxes[i] for i in rows], dtype=float)
+		lower = boxes[:,numpy.newaxis,0]
+		upper = boxes[:,numpy.newaxis,1]
+
+		columns = box_groups.get(dimension, [])
+		if len(columns) > 0:
+			outputs = numpy.array([output_locations[j] for j in columns], dtype=float)
+			intersection_lower = numpy.maximum(lower, outputs[numpy.newaxis,:,0])
+			intersection_upper = numpy.minimum(upper, outputs[numpy.newaxis,:,1])
+			intersect = (intersection_upper >= intersection_lower).all(axis=2)
+			common = (intersection_upper - intersection_lower).prod(axis=2)
+			annotation_volume = (boxes[:,1] - boxes[:,0]).prod(axis=1)[:,numpy.newaxis]
+			output_volume = (outputs[:,1] - outputs[:,0]).prod(axis=1)[numpy.newaxis,:]
+			match = intersect & (
+			    (common == output_volume)\
+			    | ((2*common > annotation_volume) & (2*common > output_volume))
+			)
+			union = annotation_volume + output_volume - common
+			overlap = numpy.where(union > 0, common / numpy.where(union > 0, union, 1.), 1.)
+			matches[numpy.ix_(rows, columns)] = match
+			overlaps[numpy.ix_(rows, columns)] = numpy.where(match, overlap, 0.)
+
+		columns = point_groups.get(dimension, [])
+		if len(columns) > 0:
+			points = numpy.array([output_locations[j] for j in columns], dtype=float)
+			match = (
+			    (points[numpy.newaxis] >= lower) & (points[numpy.newaxis] <= upper)
+			).all(axis=2)
+			matches[numpy.ix_(rows, columns)] = match
+			overlaps[numpy.ix_(rows, columns)] = match
+
+	return matches, overlaps
+
+def solveAssignment(cost):
+	"""
+	Finds the assignment of rows to columns of minimal total cost
+
+	Hungarian algorithm, in O(n²m) for n rows and m columns.
+
+	:param cost: Array of n rows and m columns, with n <= m
+	:return: Array of the column assigned to each row
+	"""
+	row_count, column_count = cost.shape
+	row_potentials = numpy.zeros(row_count+1)
+	column_potentials = numpy.zeros(column_count+1)
+	# Row (1-based, 0 if none) assigned to each column, column 0 being the
+	# row being added
+	assigned_rows = numpy.zeros(column_count+1, dtype=int)
+	previous_columns = numpy.zeros(column_count+1, dtype=int)
+	for row in range(1, row_count+1):
+		assigned_rows[0] = row
+		column = 0
+		min_reduced_costs = numpy.full(column_count+1, numpy.inf)
+		used = numpy.zeros(column_count+1, dtype=bool)
+		while True:
+			# Grow the tree of alternating paths by the cheapest column
+			used[column] = True
+			reduced_costs = cost[assigned_rows[column]-1]\
+			                - row_potentials[assigned_rows[column]]\
+			                - column_potentials[1:]
+			improved = ~used[1:] & (reduced_costs < min_reduced_costs[1:])
+			min_reduced_costs[1:][improved] = reduced_costs[improved]
+			previous_columns[1:][improved] = column
+			candidates = numpy.where(used[1:], numpy.inf, min_reduced_costs[1:])
+			next_column = int(numpy.argmin(candidates)) + 1
+			delta = candidates[next_column-1]
+			row_potentials[assigned_rows[used]] += delta
+			column_potentials[used] -= delta
+			min_reduced_costs[~used] -= delta
+			column = next_column
+			if assigned_rows[column] == 0:
+				break
+		# Flip the augmenting path
+		while column != 0:
+			previous_column = previous_columns[column]
+			assigned_rows[column] = assigned_rows[previous_column]
+			column = previous_column
+
+	assignment = numpy.zeros(row_count, dtype=int)
+	for column in range(1, column_count+1):
+		if assigned_rows[column] != 0:
+			assignment[assigned_rows[column]-1] = column-1
+	return assignment
+
+def matchPairs(matches, overlaps):
+	"""
+	Pairs annotations with outputs, each at most once
+
+	The number of pairs is maximized first, then their total overlap.
+
+	:param matches: Boolean array telling which annotation (row) can be
+	paired with which output (column)
+	:param overlaps: Array of overlaps between 0 and 1, of the same shape
+	:return: List of (annotation index, output index)
+	"""
+	matches = numpy.asarray(matches, dtype=bool)
+	if not matches.any():
+		return []
+
+	# Annotations and outputs that can only be paired together are paired at
+	# once, the assignment is only solved for the others
+	row_degrees = matches.sum(axis=1)
+	column_degrees = matches.sum(axis=0)
+	isolated = matches & (row_degrees[:,numpy.newaxis] == 1) & (column_degrees == 1)
+	pairs = [(int(row), int(column)) for row, column in zip(*numpy.nonzero(isolated))]
+	rows = numpy.flatnonzero((row_degrees > 0) & ~isolated.any(axis=1))
+	columns = numpy.flatnonzero((column_degrees > 0) & ~isolated.any(axis=0))
+	if len(rows) == 0:
+		return pairs
+	matches = matches[numpy.ix_(rows, columns)]
+	overlaps = numpy.asarray(overlaps, dtype=float)[numpy.ix_(rows, columns)]
+
+	# One more pair always outweighs any overlap difference
+	weights = numpy.where(matches, min(matches.shape) + 1 + overlaps, 0.)
+	transposed = matches.shape[0] > matches.shape[1]
+	if transposed:
+		weights = weights.T
+	assignment = solveAssignment(-weights)
+
+	for i in range(len(assignment)):
+		row, column = (assignment[i], i) if transposed else (i, assignment[i])
+		if matches[row, column]:
+			pairs.append((int(rows[row]), int(columns[column])))
+	return sorted(pairs)
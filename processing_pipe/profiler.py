@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+The profiler module records the execution time of each cell of a graph
+"""
+
+# Standard libraries
+import json
+import os
+
+def percentile(sorted_values, p):
+	"""
+	Returns the nearest-rank percentile of sorted values
+
+	:param sorted_values: Non-empty list of values, in ascending order
+	:param p: Percentile to compute, between 0 and 100
+	"""
+	rank = max(0, int(-(-p*len(sorted_values) // 100)) - 1)
+	return sorted_values[rank]
+
+class Profiler(object):
+	"""
+	Records the wall time of each cell execution
+
+	Executions are grouped by run: a run is the execution of the graph for
+	one combination of inputs and parameters.
+	"""
+	def __init__(self):
+		self.runs = [] #: (input index, parameter combination) of each run
+		self.events = [] #: (cell name, start time, duration, run index) of each execution
+
+	def beginRun(self, input_index, params):
+		"""
+		Starts a new run
+
+		:param input_index: Index of the input combination used
+		:param params: Dict of the parameter values used
+		"""
+		self.runs.append((input_index, params))
+
+	def record(self, cell_name, start, duration):
+		"""
+		Records a cell execution in the current run
+
+		:param cell_name: Name of the executed cell
+		:param start: Start time, in seconds since the epoch
+		:param duration: Execution time, in seconds
+		"""
+		self.events.append((cell_name, start, duration, len(self.runs)-1))
+
+	def clear(self):
+		self.runs = []
+		self.events = []
+
+	def getSummary(self):
+		"""
+		Computes execution time statistics for each cell
+
+		:return: Dict associating cell names to dict with count, mean, p50,
+		p95 and max keys (times in seconds)
+		"""
+		durations = dict()
+		for cell_name, _, duration, _ in self.events:
+			durations.setdefault(cell_name, []).append(duration)
+
+		summary = dict()
+		for cell_name, cell_durations in durations.iteritems():
+			cell_durations.sort()
+			summary[cell_name] = dict(
+			    count=len(cell_durations),
+			    mean=sum(cell_durations)/len(cell_durations),
+			    p50=percentile(cell_durations, 50),
+			    p95=percentile(cell_durations, 95),
+			    max=cell_durations[-1]
+			)
+		return summary
+
+	def printSummary(self):
+		"""
+		Prints execution time statistics, most expensive cells first
+		"""
+		summary = self.getSummary()
+		print "%-30s %8s %12s %12s %12s %12s"%(
+		    "Cell", "Count", "Mean (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)"
+		)
+		for cell_name in sorted(summary,
+		                        key=lambda x: summary[x]["mean"]*summary[x]["count"],
+		                        reverse=True):
+			stats = summary[cell_name]
+			print "%-30s %8d %12.3f %12.3f %12.3f %12.3f"%(
+			    cell_name,
+			    stats["count"],
+			    1000*stats["mean"],
+			    1000*stats["p50"],
+			    1000*stats["p95"],
+			    1000*stats["max"]
+			)
+
+	def exportChromeTrace(self, filename):
+		"""
+		Writes recorded executions as a Chrome trace-event JSON file
+
+		The file can be opened in chrome://tracing or Perfetto.
+
+		:param filename: Name of the file to write
+		"""
+		origin = self.events[0][1] if len(self.events) > 0 else 0
+		pid = os.getpid()
+		trace_events = []
+		for cell_name, start, duration, run_index in self.events:
+			input_index, params = self.runs[run_index]
+			trace_events.append(dict(
+			    name=cell_name,
+			    cat="cell",
+			    ph="X",
+			    ts=1000000*(start-origin),
+			    dur=1000000*duration,
+			    pid=pid,
+			    tid=0,
+			    args=dict(run=run_index, input=input_index, params=params)
+			))
+		with open(filename, "w") as f:
+			json.dump(dict(traceEvents=trace_events, displayTimeUnit="ms"), f, default=repr)
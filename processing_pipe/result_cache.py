@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+The result_cache module keeps graph outputs on disk from one invocation to
+the next
+"""
+
+# Standard libraries
+import cPickle
+import os
+
+class ResultCache(object):
+	"""
+	Content-addressed on-disk storage of output values
+
+	Each value is pickled in a file named after its key, a hexadecimal hash
+	of everything the value depends on. Reading a value marks it as recently
+	used. When the cache grows over its maximum size, the least recently used
+	values are removed. Several processes can share a cache folder.
+
+	:param path: Folder of the cache, created if needed
+	:param max_bytes: Maximum size of the stored files
+	"""
+	def __init__(self, path, max_bytes):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self._size = sum([size for _, _, size in self._listEntries()])
+
+	def _getEntryPath(self, key):
+		return os.path.join(self.path, key[:2], key)
+
+	def _listEntries(self):
+		"""
+		Returns (last use time, file path, size) of all stored values
+		"""
+		out = []
+		for folder_name in os.listdir(self.path):
+			folder = os.path.join(self.path, folder_name)
+			if not os.path.isdir(folder):
+				continue
+			for file_name in os.listdir(folder):
+				if file_name.endswith(".tmp"):
+					continue
+				file_path = os.path.join(folder, file_name)
+				try:
+					stat = os.stat(file_path)
+				except OSError:
+					# Evicted by another process
+					continue
+				out.append((stat.st_mtime, file_path, stat.st_size))
+		return out
+
+	def get(self, key):
+		"""
+		Returns the value stored with a key
+
+		:param key: Hexadecimal hash
+		:raise: KeyError if no value is stored with this key
+		"""
+		entry_path = self._getEntryPath(key)
+		try:
+			with open(entry_path, "rb") as f:
+				value = cPickle.load(f)
+			os.utime(entry_path, None)
+		except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+			self.misses += 1
+			raise KeyError(key)
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		"""
+		Stores a value, evicting the least recently used ones if needed
+
+		:param key: Hexadecimal hash
+		:param value: Picklable value
+		:raise: The pickling error if the value cannot be pickled, nothing is
+		stored then
+		"""
+		entry_path = self._getEntryPath(key)
+		if not os.path.isdir(os.path.dirname(entry_path)):
+			try:
+				os.makedirs(os.path.dirname(entry_path))
+			except OSError:
+				# Created by another process
+				pass
+		temporary_path = "%s.%d.tmp"%(entry_path, os.getpid())
+		try:
+			with open(temporary_path, "wb") as f:
+				cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+		except BaseException:
+			os.remove(temporary_path)
+			raise
+		if os.path.exists(entry_path):
+			# Replaced
+			self._size -= os.path.getsize(entry_path)
+		self._size += os.path.getsize(temporary_path)
+		os.rename(temporary_path, entry_path)
+		if self._size > self.max_bytes:
+			self._evict()
+
+	def _evict(self):
+		"""
+		Removes the least recently used values, down to 90% of the maximum
+		size to avoid evicting at each insertion
+		"""
+		entries = sorted(self._listEntries())
+		self._size = sum([size for _, _, size in entries])
+		for _, file_path, size in entries:
+			if self._size <= 0.9*self.max_bytes:
+				break
+			try:
+				os.remove(file_path)
+			except OSError:
+				pass
+			self._size -= size
+
+	def getStatistics(self):
+		return dict(
+		    hits=self.hits,
+		    misses=self.misses,
+		    size=self._size
+		)
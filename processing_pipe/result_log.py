@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+The result_log module stores the results of a graph run on disk
+"""
+
+# Standard libraries
+import array
+import cPickle
+import mmap
+import os
+import struct
+
+# Local modules
+from result_store import ResultStore
+
+class ResultLog(object):
+	"""
+	Append-only, memory-mapped storage of the results of a graph run
+
+	A log is a folder containing:
+
+	- ``header``: pickled names of the parameters, outputs and inputs
+	- ``segment-<n>``: pickled results, one after the other. A new segment
+	  is started when the current one reaches the segment size.
+	- ``index``: (segment, offset, size) of each result, in fixed-size
+	  records
+
+	A result is written in its segment before its index record, so that a
+	log can be read by another process while it is being written: it then
+	contains the results indexed so far. Items are read on access, as the
+	items of a ResultStore.
+
+	To create a log, use ``ResultLog.create``.
+
+	:param path: Folder of the log to open
+	"""
+	_INDEX_RECORD = struct.Struct("<IQQ")
+
+	def __init__(self, path):
+		self.path = path
+		with open(os.path.join(path, "header"), "rb") as f:
+			header = cPickle.load(f)
+		self.param_names = header["param_names"]
+		self.param_values = header["param_values"]
+		self.output_names = header["output_names"]
+		self.input_names = header["input_names"]
+		self.reduction = None
+		self.segment_size = None
+		self._index_file = open(os.path.join(path, "index"), "rb")
+		self._index_map = None
+		self._segment_maps = dict()
+		self._segment_file = None
+		self._index_writer = None
+		self._segment = 0
+		self._written_count = 0
+		self._last_input_key = None
+		self._last_input_record = None
+
+	@staticmethod
+	def create(path, param_names=(), param_values=(), output_names=(), input_names=(),
+	           reduction=None, segment_size=256*1024*1024):
+		"""
+		Creates an empty log, replacing any log in the same folder
+
+		:param path: Folder of the log, created if needed
+		:param param_names: Names ("cell.param") of the swept parameters
+		:param param_values: List of the possible values of each parameter
+		:param output_names: Names ("cell.port") of the graph outputs
+		:param input_names: Names ("cell.port") of the graph inputs
+		:param reduction: Function applied to each output value before it is
+		written (values are written as is if None)
+		:param segment_size: Size (in bytes) from which a new segment is started
+		:return: ResultLog open for writing
+		"""
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		for file_name in os.listdir(path):
+			if file_name in ("header", "index") or file_name.startswith("segment-"):
+				os.remove(os.path.join(path, file_name))
+
+		# Write the header atomically, readers wait for it
+		with open(os.path.join(path, "header.tmp"), "wb") as f:
+			cPickle.dump(dict(
+			    param_names=list(param_names),
+			    param_values=[list(values) for values in param_values],
+			    output_names=list(output_names),
+			    input_names=list(input_names)
+			), f, cPickle.HIGHEST_PROTOCOL)
+		open(os.path.join(path, "index"), "wb").close()
+		os.rename(os.path.join(path, "header.tmp"), os.path.join(path, "header"))
+
+		log = ResultLog(path)
+		log.reduction = reduction
+		log.segment_size = segment_size
+		log._index_writer = open(os.path.join(path, "index"), "ab")
+		log._segment_file = open(log._getSegmentPath(0), "ab")
+		return log
+
+	@staticmethod
+	def reopen(path, count, reduction=None, segment_size=256*1024*1024):
+		"""
+		Opens an existing log to append results, dropping all results but the
+		first ones
+
+		:param path: Folder of the log
+		:param count: Number of results to keep
+		:param reduction: Function applied to each output value before it is
+		written (values are written as is if None)
+		:param segment_size: Size (in bytes) from which a new segment is started
+		:return: ResultLog open for writing
+		"""
+		log = ResultLog(path)
+		if count > len(log):
+			raise IOError("Result log %s has less than %d results"%(path, count))
+		segment, end = 0, 0
+		if count > 0:
+			segment, offset, size = ResultLog._INDEX_RECORD.unpack_from(
+			    log._index_map,
+			    (count-1)*ResultLog._INDEX_RECORD.size
+			)
+			end = offset + size
+		log._index_map = None
+		log._segment_maps = dict()
+		with open(os.path.join(path, "index"), "r+b") as f:
+			f.truncate(count*ResultLog._INDEX_RECORD.size)
+		for file_name in os.listdir(path):
+			if file_name.startswith("segment-") and int(file_name[8:]) > segment:
+				os.remove(os.path.join(path, file_name))
+		with open(log._getSegmentPath(segment), "ab") as f:
+			f.truncate(end)
+
+		log.reduction = reduction
+		log.segment_size = segment_size
+		log._index_writer = open(os.path.join(path, "index"), "ab")
+		log._segment_file = open(log._getSegmentPath(segment), "ab")
+		log._segment_file.seek(0, os.SEEK_END)
+		log._segment = segment
+		log._written_count = count
+		return log
+
+	def _getSegmentPath(self, segment):
+		return os.path.join(self.path, "segment-%06d"%segment)
+
+	def append(self, outputs, param_indices, input_key, inputs):
+		"""
+		Writes the result of one run
+
+		:param outputs: Values of the graph outputs
+		:param param_indices: Index of the value of each parameter
+		:param input_key: Identifier of the input combination used
+		:param inputs: Function returning the input values, only called when
+		``input_key`` differs from the one of the previous result (other
+		results refer to the result holding their inputs)
+		"""
+		if self._segment_file is None:
+			raise IOError("Result log %s is not open for writing"%self.path)
+		if self.reduction is not None:
+			outputs = [self.reduction(value) for value in outputs]
+		record_index = self._written_count
+		if input_key != self._last_input_key or self._last_input_record is None:
+			row = (list(outputs), list(param_indices), tuple(inputs()))
+			self._last_input_key = input_key
+			self._last_input_record = record_index
+		else:
+			row = (list(outputs), list(param_indices), self._last_input_record)
+		data = cPickle.dumps(row, cPickle.HIGHEST_PROTOCOL)
+
+		offset = self._segment_file.tell()
+		if offset > 0 and offset + len(data) > self.segment_size:
+			self._segment_file.close()
+			self._segment += 1
+			self._segment_file = open(self._getSegmentPath(self._segment), "ab")
+			offset = 0
+		self._segment_file.write(data)
+		self._segment_file.flush()
+		self._index_writer.write(
+		    ResultLog._INDEX_RECORD.pack(self._segment, offset, len(data))
+		)
+		self._index_writer.flush()
+		self._written_count += 1
+
+	def extend(self, other):
+		"""
+		Writes the results stored in a ResultStore
+
+		:param other: ResultStore with the same parameters and outputs
+		"""
+		for row in other.iterRows():
+			self.append(*row)
+
+	def close(self):
+		"""
+		Stops writing, the log can still be read
+		"""
+		if self._segment_file is not None:
+			self._segment_file.close()
+			self._index_writer.close()
+			self._segment_file = None
+
+	def _readRow(self, item):
+		"""
+		Reads a result as written by ``append``
+		"""
+		segment, offset, size = ResultLog._INDEX_RECORD.unpack_from(
+		    self._index_map,
+		    item*ResultLog._INDEX_RECORD.size
+		)
+		segment_map = self._segment_maps.get(segment)
+		if segment_map is None or offset+size > len(segment_map):
+			# The segment grew since it was mapped
+			with open(self._getSegmentPath(segment), "rb") as f:
+				segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			self._segment_maps[segment] = segment_map
+		return cPickle.loads(segment_map[offset:offset+size])
+
+	def getParamIndices(self, param_name):
+		"""
+		Returns the array of value indices of a parameter, one per result
+
+		:param param_name: Name of the parameter ("cell.param")
+		"""
+		param_index = self.param_names.index(param_name)
+		return array.array("l", [
+		    self._readRow(i)[1][param_index] for i in range(len(self))
+		])
+
+	def getOutputColumn(self, output):
+		"""
+		Returns the values taken by an output, one per result
+
+		All results are read, prefer iterating when the log is large.
+
+		:param output: Index or name ("cell.port") of the output
+		"""
+		if not isinstance(output, int):
+			output = self.output_names.index(output)
+		return [self._readRow(i)[0][output] for i in range(len(self))]
+
+	@property
+	def total_count(self):
+		return len(self)
+
+	def __len__(self):
+		count = os.fstat(self._index_file.fileno()).st_size // ResultLog._INDEX_RECORD.size
+		if count == 0:
+			return 0
+		if self._index_map is None or len(self._index_map) < count*ResultLog._INDEX_RECORD.size:
+			self._index_map = mmap.mmap(
+			    self._index_file.fileno(),
+			    0,
+			    access=mmap.ACCESS_READ
+			)
+		return count
+
+	def __getitem__(self, item):
+		if isinstance(item, slice):
+			return [self[i] for i in range(*item.indices(len(self)))]
+		count = len(self)
+		if item < 0:
+			item += count
+		if item < 0 or item >= count:
+			raise IndexError("Result index out of range")
+		outputs, param_indices, inputs = self._readRow(item)
+		if not isinstance(inputs, tuple):
+			inputs = self._readRow(inputs)[2]
+		return dict(
+		    outputs=outputs,
+		    inputs=list(inputs),
+		    params=dict([
+		        (name, values[index])\
+		        for name, values, index\
+		        in zip(self.param_names, self.param_values, param_indices)
+		    ])
+		)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def __eq__(self, other):
+		if isinstance(other, (list, ResultLog, ResultStore)):
+			return list(self) == list(other)
+		return NotImplemented
+
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		if equal is NotImplemented:
+			return equal
+		return not equal
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+The result_store module keeps the results of a graph run in columns
+"""
+
+# Standard libraries
+import array
+
+class ResultStore(object):
+	"""
+	Column-oriented storage of the results of a graph run
+
+	Each parameter is stored as an array of value indices, each output as a
+	column, and each input combination once, however many parameter
+	combinations were run on it. The dicts with ``outputs``, ``inputs`` and
+	``params`` keys returned by ``Graph.iterRun`` are only built when an item
+	is accessed.
+
+	:param param_names: Names ("cell.param") of the swept parameters
+	:param param_values: List of the possible values of each parameter
+	:param output_names: Names ("cell.port") of the graph outputs
+	:param input_names: Names ("cell.port") of the graph inputs
+	:param max_count: Number of most recent results kept (all if None)
+	:param reduction: Function applied to each output value before it is
+	stored (values are stored as is if None)
+	"""
+	def __init__(self, param_names=(), param_values=(), output_names=(), input_names=(),
+	             max_count=None, reduction=None):
+		self.param_names = list(param_names)
+		self.param_values = [list(values) for values in param_values]
+		self.output_names = list(output_names)
+		self.input_names = list(input_names)
+		self._param_indices = [array.array("l") for _ in self.param_names]
+		self._outputs = [[] for _ in self.output_names]
+		self._input_indices = array.array("l")
+		self._input_combinations = []
+		self._last_input_key = None
+		self._start = 0 #: number of evicted results still in the columns
+		self.max_count = max_count
+		self.reduction = reduction
+		self.total_count = 0 #: number of results appended, including evicted ones
+
+	def append(self, outputs, param_indices, input_key, inputs):
+		"""
+		Stores the result of one run
+
+		:param outputs: Values of the graph outputs
+		:param param_indices: Index of the value of each parameter
+		:param input_key: Identifier of the input combination used
+		:param inputs: Function returning the input values, only called when
+		``input_key`` differs from the one of the previous result
+		"""
+		self.total_count += 1
+		if self.max_count == 0:
+			return
+		if self.reduction is not None:
+			outputs = [self.reduction(value) for value in outputs]
+		if input_key != self._last_input_key or len(self._input_combinations) == 0:
+			self._input_combinations.append(tuple(inputs()))
+			self._last_input_key = input_key
+		self._input_indices.append(len(self._input_combinations)-1)
+		for column, index in zip(self._param_indices, param_indices):
+			column.append(index)
+		for column, value in zip(self._outputs, outputs):
+			column.append(value)
+		if self.max_count is not None and len(self) > self.max_count:
+			self._evict()
+
+	def _evict(self):
+		"""
+		Forgets the oldest result
+
+		Its outputs are released at once, but columns are only shifted when
+		as many results as kept were evicted, to keep appending in constant
+		amortized time.
+		"""
+		for column in self._outputs:
+			column[self._start] = None
+		self._start += 1
+		if self._start >= self.max_count:
+			self._compact()
+
+	def _compact(self):
+		"""
+		Removes evicted results from the columns
+		"""
+		if self._start == 0:
+			return
+		if self._start == len(self._input_indices):
+			first_input = len(self._input_combinations)
+		else:
+			first_input = self._input_indices[self._start]
+		self._input_indices = array.array("l", [
+		    i-first_input for i in self._input_indices[self._start:]
+		])
+		del self._input_combinations[:first_input]
+		for column in self._param_indices:
+			del column[:self._start]
+		for column in self._outputs:
+			del column[:self._start]
+		self._start = 0
+
+	def extend(self, other):
+		"""
+		Appends the results stored in another store
+
+		:param other: ResultStore with the same parameters and outputs
+		"""
+		if self.max_count is not None or self.reduction is not None:
+			for row in other.iterRows():
+				self.append(*row)
+			return
+
+		other._compact()
+		self.total_count += other.total_count
+		offset = len(self._input_combinations)
+		self._input_indices.extend(array.array(
+		    "l",
+		    [offset+i for i in other._input_indices]
+		))
+		self._input_combinations.extend(other._input_combinations)
+		self._last_input_key = None
+		for column, other_column in zip(self._param_indices, other._param_indices):
+			column.extend(other_column)
+		for column, other_column in zip(self._outputs, other._outputs):
+			column.extend(other_column)
+
+	def iterRows(self):
+		"""
+		Iterates on the stored results, as the arguments of ``append``
+
+		:return: Generator of (outputs, param_indices, input_key, inputs)
+		"""
+		self._compact()
+		for i in range(len(self)):
+			input_index = self._input_indices[i]
+			yield (
+			    [column[i] for column in self._outputs],
+			    [column[i] for column in self._param_indices],
+			    (id(self), input_index),
+			    lambda input_index=input_index: self._input_combinations[input_index]
+			)
+
+	def getParamIndices(self, param_name):
+		"""
+		Returns the array of value indices of a parameter, one per result
+
+		:param param_name: Name of the parameter ("cell.param")
+		"""
+		self._compact()
+		return self._param_indices[self.param_names.index(param_name)]
+
+	def getOutputColumn(self, output):
+		"""
+		Returns the values taken by an output, one per result
+
+		:param output: Index or name ("cell.port") of the output
+		"""
+		if not isinstance(output, int):
+			output = self.output_names.index(output)
+		self._compact()
+		return self._outputs[output]
+
+	def exportNPZ(self, filename):
+		"""
+		Writes all columns in a NumPy ``.npz`` archive
+
+		The archive contains ``input_index`` (index of the input combination
+		of each result), and for each parameter, output and input, arrays
+		named ``params.<cell>.<param>`` (value indices) with
+		``params.<cell>.<param>.values`` (possible values),
+		``outputs.<cell>.<port>`` and ``inputs.<cell>.<port>`` (one value per
+		input combination). Columns of objects are stored as object arrays.
+
+		:param filename: Name of the file to write
+		"""
+		import numpy
+
+		self._compact()
+
+		def to_array(values):
+			try:
+				return numpy.asarray(values)
+			except ValueError:
+				# Values of different shapes
+				out = numpy.empty(len(values), dtype=object)
+				out[:] = values
+				return out
+
+		columns = dict(input_index=numpy.frombuffer(self._input_indices, dtype=numpy.int_))
+		for name, values, indices in zip(self.param_names,
+		                                 self.param_values,
+		                                 self._param_indices):
+			columns["params."+name] = numpy.frombuffer(indices, dtype=numpy.int_)
+			columns["params."+name+".values"] = to_array(values)
+		for name, column in zip(self.output_names, self._outputs):
+			columns["outputs."+name] = to_array(column)
+		for i in range(len(self.input_names)):
+			columns["inputs."+self.input_names[i]] = to_array([
+			    combination[i] for combination in self._input_combinations
+			])
+		numpy.savez(filename, **columns)
+
+	def __getstate__(self):
+		# Functions may not be picklable, the owner sets the reduction back
+		state = self.__dict__.copy()
+		state["reduction"] = None
+		state["_last_input_key"] = None
+		return state
+
+	def __len__(self):
+		return len(self._input_indices) - self._start
+
+	def __getitem__(self, item):
+		if isinstance(item, slice):
+			return [self[i] for i in range(*item.indices(len(self)))]
+		if item < 0:
+			item += len(self)
+		if item < 0 or item >= len(self):
+			raise IndexError("Result index out of range")
+		item += self._start
+		return dict(
+		    outputs=[column[item] for column in self._outputs],
+		    inputs=list(self._input_combinations[self._input_indices[item]]),
+		    params=dict([
+		        (name, values[indices[item]])\
+		        for name, values, indices\
+		        in zip(self.param_names, self.param_values, self._param_indices)
+		    ])
+		)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def __eq__(self, other):
+		if isinstance(other, (ResultStore, list)):
+			return list(self) == list(other)
+		return NotImplemented
+
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		if equal is NotImplemented:
+			return equal
+		return not equal
@@ -3,7 +3,13 @@ The utils module provide some ecto cell manipulation, and graph generation
 """
 
 # Standard libraries
+import collections
+import cPickle
+import hashlib
+import heapq
 import json
+from multiprocessing.pool import ThreadPool
+import os
 
 def loadJSONFile(filename):
 	"""
@@ -14,6 +20,126 @@ def loadJSONFile(filename):
 	with open(filename, 'r') as f:
 		return json.loads(f.read())
 
+def saveJSONFile(data, filename):
+	"""
+	Save an object in a json file.
+	:param data: Object to serialize (objects JSON does not support are
+	written as their representation)
+	:param filename: Name of the file to write
+	"""
+	with open(filename, 'w') as f:
+		f.write(json.dumps(data, indent=2, sort_keys=True, default=repr))
+
+def hashJSON(data):
+	"""
+	Computes a hash of a JSON-serializable object, independent of key order
+	:param data: Object to hash
+	:return: Hexadecimal SHA-1 digest
+	"""
+	return hashlib.sha1(json.dumps(data, sort_keys=True, default=repr)).hexdigest()
+
+def saveCheckpoint(data, filename):
+	"""
+	Save an object in a pickle file, atomically: if interrupted, the previous
+	file is left intact.
+	:param data: Object to serialize
+	:param filename: Name of the file to write
+	"""
+	with open(filename+".tmp", 'wb') as f:
+		cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+	os.rename(filename+".tmp", filename)
+
+def loadCheckpoint(filename, key):
+	"""
+	Load an object saved by saveCheckpoint, if it was saved with the same key.
+	:param filename: Name of the file to read
+	:param key: Value the "key" item of the saved dict must have
+	:return: The saved dict, None if the file does not exist or the key differs
+	"""
+	if not os.path.exists(filename):
+		return None
+	with open(filename, 'rb') as f:
+		data = cPickle.load(f)
+	if data.get("key") != key:
+		return None
+	return data
+
+def mergeStreams(streams, folder=""):
+	"""
+	Merge timelines of files into a single one, lazily.
+	:param streams: List of dicts associating (seconds, nanoseconds)
+	timestamps to file names, one per input
+	:param folder: Folder the file names are relative to
+	:return: Generator of (timestamp in seconds, input index, file path),
+	sorted by timestamp
+	"""
+	def iter_stream(input_index, stream):
+		for ts, filename in sorted(stream.iteritems()):
+			yield (
+			    float(ts[0])+float(ts[1])/1000000000,
+			    input_index,
+			    os.path.join(folder, filename)
+			)
+	return heapq.merge(*[
+	    iter_stream(input_index, streams[input_index])\
+	    for input_index in range(len(streams))
+	])
+
+def groupStreams(changes, tolerance):
+	"""
+	Group changes of different inputs happening at the same time, lazily.
+	:param changes: Iterable of (timestamp, input index, file path), sorted
+	by timestamp (see mergeStreams)
+	:param tolerance: Maximum time (in seconds) between the first and the
+	last change of a group
+	:return: Generator of lists of changes, in which each input changes at
+	most once
+	"""
+	group = []
+	for change in changes:
+		if len(group) > 0 and (change[0]-group[0][0] > tolerance\
+		                       or change[1] in [x[1] for x in group]):
+			yield group
+			group = []
+		group.append(change)
+	if len(group) > 0:
+		yield group
+
+def _readFile(filename):
+	try:
+		with open(filename, 'rb') as f:
+			while f.read(1024*1024):
+				pass
+	except IOError:
+		# Reported by the cell opening it
+		pass
+
+def prefetchStreams(changes, depth, workers=4):
+	"""
+	Read the files of the next changes in background threads, so that they
+	are in the system cache when the graph opens them.
+	:param changes: Iterable of (timestamp, input index, file path)
+	:param depth: Number of changes read ahead of the one returned
+	:param workers: Number of reading threads
+	:return: Generator of the same changes, each returned once read
+	"""
+	pool = ThreadPool(workers)
+	pending = collections.deque()
+	try:
+		for change in changes:
+			pending.append((change, pool.apply_async(_readFile, (change[2],))))
+			if len(pending) > depth:
+				change, reading = pending.popleft()
+				reading.wait()
+				yield change
+		while len(pending) > 0:
+			change, reading = pending.popleft()
+			reading.wait()
+			yield change
+	finally:
+		pool.terminate()
+		pool.join()
+
 def createEctoCell(module, cell_type, name, params=list()):
 	"""
 	Create an ecto cell
@@ -54,7 +54,9 @@ setup(
             'processing-pipe = processing_pipe.__main__:main'
         ],
         'processing.commands': [
+            'bench = processing_pipe.commands.bench_command',
             'eval = processing_pipe.commands.eval_command',
+            'pack = processing_pipe.commands.pack_command',
             'run = processing_pipe.commands.run_command',
         ],
     }
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time taken to pair the outputs of a frame with its
+annotations, by ``compare`` and by the greedy pairing it replaced, on
+synthetic frames of jittered boxes with labels
+
+Run with ``python tests/bench_matching.py [frame count]``.
+"""
+
+# Standard libraries
+import random
+import sys
+import time
+
+# Local modules
+from processing_pipe.commands.eval_command import OutputDescription, compare
+
+OUTPUT = {
+    "cell_id":"detector",
+    "port_name":"objects",
+    "qidata_type":"<Object>",
+    "location":"key:box"
+}
+COMPARISON_RULES = [["key:label", "key:label", "Strict"]]
+LABELS = ["person", "face", "bag"]
+
+def greedyCompare(annotations, outputs):
+	"""
+	Pairs each output with the first remaining annotation it matches, as
+	``compare`` used to, reading the compared properties for every pair
+
+	:return: [true positives, false positives, false negatives, 0]
+	"""
+	def value_match(x, y):
+		return x["label"] == y["label"]
+
+	def location_match(x, y):
+		output_location = y["box"]
+		common_volume = 1
+		annotation_volume = 1
+		output_volume = 1
+		for i in range(len(x[0])):
+			if output_location[1][i] < x[0][i]\
+			   or x[1][i] < output_location[0][i]:
+				return False
+			common_volume *= (
+			    min(x[1][i], output_location[1][i])\
+			    - max(x[0][i], output_location[0][i])
+			)
+			annotation_volume *= (x[1][i]-x[0][i])
+			output_volume *= (output_location[1][i]-output_location[0][i])
+		return common_volume == output_volume\
+		       or (2*common_volume>annotation_volume\
+		           and 2*common_volume>output_volume)
+
+	annotations = list(annotations)
+	res = [0,0,0,0]
+	for output in outputs:
+		for i in range(len(annotations)):
+			annotation = annotations[i]
+			if location_match(annotation[1], output)\
+			   and value_match(annotation[0], output):
+				res[0] += 1
+				break
+		else:
+			res[1] += 1
+			continue
+		annotations.pop(i)
+	res[2] += len(annotations)
+	return res
+
+def createFrame(box_count, rand):
+	"""
+	Creates annotations of boxes, some of them overlapping, and outputs
+	close to them, with a few missed and a few spurious ones
+	"""
+	annotations = []
+	outputs = []
+	for _ in range(box_count):
+		x, y = rand.uniform(0, 600), rand.uniform(0, 440)
+		width, height = rand.uniform(20, 60), rand.uniform(20, 60)
+		label = rand.choice(LABELS)
+		annotations.append((dict(label=label), [[x, y], [x+width, y+height]]))
+		if rand.random() < 0.9:
+			dx, dy = rand.gauss(0, width/6), rand.gauss(0, height/6)
+			outputs.append(dict(label=label, box=[[x+dx, y+dy], [x+dx+width, y+dy+height]]))
+	for _ in range(box_count // 10):
+		x, y = rand.uniform(0, 600), rand.uniform(0, 440)
+		outputs.append(dict(label=rand.choice(LABELS), box=[[x, y], [x+40, y+40]]))
+	rand.shuffle(outputs)
+	return annotations, outputs
+
+def measure(function, frames):
+	totals = [0,0,0,0]
+	start = time.time()
+	for annotations, outputs in frames:
+		res = function(annotations, outputs)
+		for i in range(len(totals)):
+			totals[i] += res[i]
+	return 1000*(time.time()-start)/len(frames), totals
+
+def main(frame_count):
+	output_desc = OutputDescription(dict(OUTPUT), COMPARISON_RULES)
+	rand = random.Random(0)
+	for box_count in [5, 20, 50, 100]:
+		frames = [createFrame(box_count, rand) for _ in range(frame_count)]
+		greedy_time, greedy_totals = measure(greedyCompare, frames)
+		optimal_time, optimal_totals = measure(
+		    lambda annotations, outputs: compare(annotations, outputs, output_desc),
+		    frames
+		)
+		print "%3d boxes: greedy %7.3f ms/frame (%d TP), optimal %7.3f ms/frame (%d TP)"%(
+		    box_count,
+		    greedy_time,
+		    greedy_totals[0],
+		    optimal_time,
+		    optimal_totals[0]
+		)
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
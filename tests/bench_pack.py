@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the frames per second of a graph replaying the streams of a
+dataset, from its folder and from its pack, including the reading of the
+annotations of each frame
+
+Run with ``python tests/bench_pack.py [dataset]``, as root to measure with
+a cold system cache.
+"""
+
+# Standard libraries
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Local modules
+from processing_pipe.commands.eval_command import (
+    initEvaluationGraph, getDatasetStreams, runOnStreams, openDatasetFiles
+)
+from processing_pipe.dataset_pack import packDataSet
+from processing_pipe.manifest import ManifestCache
+
+GRAPH = {
+    "inputs":[
+        {
+            "cell_id":"pt",
+            "port_name":"in",
+            "qidata_type":"IMAGE_STEREO"
+        }
+    ],
+    "cells":[
+        {
+            "module":"ecto.cells",
+            "cell_type":"Passthrough",
+            "name":"pt"
+        }
+    ],
+    "outputs":[
+        {
+            "cell_id":"pt",
+            "port_name":"out"
+        }
+    ]
+}
+
+def dropSystemCache():
+	try:
+		with open("/proc/sys/vm/drop_caches", "w") as f:
+			f.write("3\n")
+		return True
+	except IOError:
+		return False
+
+def measure(dataset):
+	# A new manifest folder for each measure, so that annotations are read
+	# from the dataset
+	manifest_dir = tempfile.mkdtemp()
+	try:
+		manifest = ManifestCache(manifest_dir)
+		graph_description = dict(GRAPH, inputs=[dict(x) for x in GRAPH["inputs"]])
+		graph = initEvaluationGraph(graph_description)
+		cold = dropSystemCache()
+		start = time.time()
+		streams, start_ts = getDatasetStreams(dataset, graph_description["inputs"], manifest)
+		stage, close_dataset = openDatasetFiles(dataset)
+		try:
+			state_count, _ = runOnStreams(
+			    graph,
+			    streams,
+			    start_ts,
+			    lambda position, changes, results: manifest.getFileInfo(changes[0][2]),
+			    stage=stage
+			)
+		finally:
+			close_dataset()
+		return state_count/(time.time()-start), cold
+	finally:
+		shutil.rmtree(manifest_dir)
+
+def main(dataset):
+	pack_folder = tempfile.mkdtemp()
+	try:
+		pack_path = os.path.join(pack_folder, "dataset.qipack")
+		manifest_dir = tempfile.mkdtemp()
+		start = time.time()
+		packDataSet(dataset, pack_path, ManifestCache(manifest_dir))
+		shutil.rmtree(manifest_dir)
+		print "Packing: %.2f s"%(time.time()-start)
+		for label, path in [("Folder", dataset), ("Pack", pack_path)]:
+			frame_rate, cold = measure(path)
+			print "%-6s: %8.2f frames/s (%s cache)"%(
+			    label,
+			    frame_rate,
+			    "cold" if cold else "warm"
+			)
+	finally:
+		shutil.rmtree(pack_folder)
+
+if __name__ == "__main__":
+	main(sys.argv[1] if len(sys.argv) > 1 else "tests/data/kenzo_qidataset")
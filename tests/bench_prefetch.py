@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the frames per second of a graph run on the streams of a dataset,
+with and without prefetching its files
+
+Run with ``python tests/bench_prefetch.py [dataset [prefetch depth]]``, as
+root to measure with a cold system cache.
+"""
+
+# Standard libraries
+import shutil
+import sys
+import tempfile
+import time
+
+# Local modules
+from processing_pipe.commands.eval_command import (
+    initEvaluationGraph, getDatasetStreams, runOnStreams
+)
+from processing_pipe.manifest import ManifestCache
+
+GRAPH = {
+    "inputs":[
+        {
+            "cell_id":"pt",
+            "port_name":"in",
+            "qidata_type":"IMAGE_STEREO"
+        }
+    ],
+    "cells":[
+        {
+            "module":"ecto.cells",
+            "cell_type":"Passthrough",
+            "name":"pt"
+        }
+    ],
+    "outputs":[
+        {
+            "cell_id":"pt",
+            "port_name":"out"
+        }
+    ]
+}
+
+def dropSystemCache():
+	try:
+		with open("/proc/sys/vm/drop_caches", "w") as f:
+			f.write("3\n")
+		return True
+	except IOError:
+		return False
+
+def measure(dataset, prefetch, manifest):
+	graph_description = dict(GRAPH, inputs=[dict(x) for x in GRAPH["inputs"]])
+	graph = initEvaluationGraph(graph_description)
+	streams, start_ts = getDatasetStreams(dataset, graph_description["inputs"], manifest)
+	cold = dropSystemCache()
+	start = time.time()
+	state_count, _ = runOnStreams(graph,
+	                              streams,
+	                              start_ts,
+	                              lambda position, changes, results: None,
+	                              prefetch=prefetch)
+	return state_count/(time.time()-start), cold
+
+def main(dataset, prefetch):
+	manifest_dir = tempfile.mkdtemp()
+	try:
+		manifest = ManifestCache(manifest_dir)
+		for depth in (0, prefetch):
+			frame_rate, cold = measure(dataset, depth, manifest)
+			print "Prefetch %2d: %8.2f frames/s (%s cache)"%(
+			    depth,
+			    frame_rate,
+			    "cold" if cold else "warm"
+			)
+	finally:
+		shutil.rmtree(manifest_dir)
+
+if __name__ == "__main__":
+	main(
+	    sys.argv[1] if len(sys.argv) > 1 else "tests/data/kenzo_qidataset",
+	    int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	)
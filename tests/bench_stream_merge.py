@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how the merge of dataset stream timelines scales with their length
+
+Run with ``python tests/bench_stream_merge.py [frame count ...]``.
+"""
+
+# Standard libraries
+import bisect
+import sys
+import time
+
+# Local modules
+from processing_pipe.utils import mergeStreams
+
+def createTimelines(frame_count, stream_count=4):
+	"""
+	Creates timelines of cameras at different rates, with frame_count files
+	in total
+	"""
+	streams = []
+	for input_index in range(stream_count):
+		period = 33333333 + 1000000*input_index
+		streams.append(dict([
+		    ((i*period // 1000000000, i*period % 1000000000), "%d/%08d.png"%(input_index, i))\
+		    for i in range(frame_count // stream_count)
+		]))
+	return streams
+
+def flattenAndSort(streams, start_ts):
+	"""
+	Former implementation: all files in one sorted list, consumed from its
+	head, and a list of timestamps built to find the starting state
+	"""
+	timeline = sorted([
+	    (float(ts[0])+float(ts[1])/1000000000, input_index, filename)\
+	    for input_index in range(len(streams))\
+	        for ts, filename in streams[input_index].iteritems()
+	])
+	first = bisect.bisect_right([x[0] for x in timeline], start_ts)-1
+	count = 0
+	while len(timeline) > first:
+		timeline.pop(0)
+		count += 1
+	return count
+
+def mergeLazily(streams, start_ts):
+	count = 0
+	for _ in mergeStreams(streams):
+		count += 1
+	return count
+
+def main(frame_counts):
+	print "%10s %20s %20s"%("Frames", "Flatten+sort (s)", "Lazy merge (s)")
+	for frame_count in frame_counts:
+		streams = createTimelines(frame_count)
+		timings = []
+		for method in (flattenAndSort, mergeLazily):
+			if method is flattenAndSort and frame_count > 200000:
+				# Quadratic, would take hours
+				timings.append(float("nan"))
+				continue
+			start = time.time()
+			method(streams, 0.)
+			timings.append(time.time()-start)
+		print "%10d %20.3f %20.3f"%(frame_count, timings[0], timings[1])
+
+if __name__ == "__main__":
+	main([int(x) for x in sys.argv[1:]] or [10000, 100000, 200000, 1000000])
@@ -17,7 +17,7 @@ import shutil
 
 import processing_pipe
 from processing_pipe.utils import loadJSONFile
-from processing_pipe.commands import run_command, eval_command, main
+from processing_pipe.commands import run_command, eval_command, bench_command, pack_command, main
 
 #[MODULE INFO]-----------------------------------------------------------------
 __author__ = "sambrose"
@@ -97,6 +97,14 @@ def run_command_parser():
 def eval_command_parser():
 	return eval_command.make_command_parser()
 
+@pytest.fixture(scope="session")
+def bench_command_parser():
+	return bench_command.make_command_parser()
+
+@pytest.fixture(scope="session")
+def pack_command_parser():
+	return pack_command.make_command_parser()
+
 @pytest.fixture(scope="session")
 def main_command_parser():
 	return main.parser()
\ No newline at end of file
@@ -1,13 +1,26 @@
 # Standard library
+import os
 import pytest
+import shutil
+import warnings
 
 # Third-party libraries
 from ecto import cells
+import numpy
 
 # Local modules
 from processing_pipe.graph import (
 	Graph,
 )
+from processing_pipe.matching import locationMatrix, matchPairs
+from processing_pipe.result_cache import ResultCache
+from processing_pipe.result_log import ResultLog
+from processing_pipe.utils import (
+	loadJSONFile,
+	mergeStreams,
+	groupStreams,
+	prefetchStreams,
+)
 
 def test_noop_graph():
 	graph = Graph()
@@ -439,4 +452,663 @@ def test_graph_results():
 # 	assert(graph.output[-1][4] == 4)
 # 	assert(graph.output[-1][5] == 4)
 # 	assert(graph.output[-1][6] == 16)
-# 	assert(graph.output[-1][7] == 32)
\ No newline at end of file
+# 	assert(graph.output[-1][7] == 32)
+
+def test_parallel_run():
+	"""
+	Running the sweep in several processes must give the same results, in the
+	same order, as a serial run.
+	"""
+	graph_description = dict(
+		cells=[
+			dict(module="ecto.cells", cell_type="Constant", name="const1",
+			     params=[dict(param_name="value", values=[True, False])]),
+			dict(module="ecto.cells", cell_type="Constant", name="const2",
+			     params=[dict(param_name="value", values=[True, False, True])]),
+			dict(module="ecto.cells", cell_type="And", name="and1"),
+			dict(module="ecto.cells", cell_type="And", name="and2"),
+		],
+		inputs=[dict(cell_id="and1", port_name="in1")],
+		outputs=[dict(cell_id="and2", port_name="out")],
+		connections=[
+			{"from":"const1.out", "to":"and1.in2"},
+			{"from":"and1.out", "to":"and2.in1"},
+			{"from":"const2.out", "to":"and2.in2"},
+		]
+	)
+	graph = Graph.createFromDict(graph_description)
+	graph.input = [True, False, True]
+	graph.run()
+	serial_results = graph.result
+
+	graph.input = [True, False, True]
+	graph.run(workers=3)
+	assert(18 == len(graph.result))
+	assert(serial_results == graph.result)
+
+def test_iter_run():
+	"""
+	iterRun yields results one by one, without storing them in the graph
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=True))
+	graph.addCell(cells.And("and"))
+	graph.setPortAsGraphInput("and","in1")
+	graph.connect("const", "out", "and", "in2")
+	graph.setPortAsGraphOutput("and","out")
+	graph.setSwitchingParameters("const", "value", [True, False])
+	graph.input = [True, False]
+	results = graph.iterRun()
+	assert(
+		dict(outputs=[True], inputs=[True], params={"const.value":True})
+		== next(results)
+	)
+	assert([False, False, False] == [r["outputs"][0] for r in results])
+	assert([] == graph.result)
+
+def test_gray_code_enumeration():
+	"""
+	With Gray-code enumeration, each run changes only one parameter, which
+	saves cell executions compared to the default enumeration.
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const1", value=0))
+	graph.addCell(cells.Constant("const2", value=0))
+	graph.addCell(cells.Counter("count1"))
+	graph.addCell(cells.Counter("count2"))
+	graph.connect("const1", "out", "count1", "input")
+	graph.connect("const2", "out", "count2", "input")
+	graph.setPortAsGraphOutput("count1","count")
+	graph.setPortAsGraphOutput("count2","count")
+	graph.setSwitchingParameters("const1", "value", [0, 1, 2])
+	graph.setSwitchingParameters("const2", "value", [0, 1, 2])
+	assert(24 == graph.countCellExecutions())
+	graph.run()
+	assert([3, 9] == sorted(graph.output[-1]))
+
+	graph.setGrayCodeEnumeration()
+	assert(24 == graph.countCellExecutions(gray_code=False))
+	assert(20 == graph.countCellExecutions())
+	graph.run()
+	assert([3+3, 7+9] == sorted(graph.output[-1]))
+	params = [
+		(r["params"]["const1.value"], r["params"]["const2.value"])\
+		for r in graph.result
+	]
+	assert(9 == len(set(params)))
+	for previous, current in zip(params[:-1], params[1:]):
+		assert(1 == sum([a != b for a, b in zip(previous, current)]))
+
+def test_cost_driven_parameter_order():
+	"""
+	Given cell costs, the parameter whose change is the most expensive to
+	recompute changes the least often.
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("cheap", value=0))
+	graph.addCell(cells.Constant("expensive", value=0))
+	graph.addCell(cells.Passthrough("detector"))
+	graph.addCell(cells.Passthrough("threshold"))
+	graph.connect("expensive", "out", "detector", "in")
+	graph.connect("cheap", "out", "threshold", "in")
+	graph.setPortAsGraphOutput("detector","out")
+	graph.setSwitchingParameters("cheap", "value", [0, 1, 2])
+	graph.setSwitchingParameters("expensive", "value", [0, 1, 2])
+
+	cell_costs = graph.measureCellCosts()
+	assert(set(["cheap", "expensive", "detector", "threshold"]) == set(cell_costs))
+
+	cell_costs = dict(cheap=1, expensive=1, detector=10, threshold=1)
+	graph.setCellCosts(cell_costs)
+	assert(13+6*2+2*13 == graph.predictSweepCost(cell_costs))
+	graph.run()
+	assert([0, 0, 0, 1, 1, 1, 2, 2, 2] == [
+		r["params"]["expensive.value"] for r in graph.result
+	])
+	assert(
+		graph.predictSweepCost(cell_costs)
+		<= graph.predictSweepCost(cell_costs, order_by_cost=False)
+	)
+
+def test_cell_costs_keep_cell_state():
+	"""
+	Measuring cell costs does not change the state of the cells of a graph
+	that can be rebuilt
+	"""
+	graph = Graph.createFromDict(dict(
+		cells=[
+			dict(module="ecto.cells", cell_type="Passthrough", name="pt"),
+			dict(module="ecto.cells", cell_type="Counter", name="cnt"),
+		],
+		inputs=[dict(cell_id="pt", port_name="in")],
+		outputs=[dict(cell_id="cnt", port_name="count")],
+		connections=[{"from":"pt.out", "to":"cnt.input"}]
+	))
+	graph.input = [10, 20, 30, 40]
+	cell_costs = graph.measureCellCosts()
+	assert(set(["pt", "cnt"]) == set(cell_costs))
+	graph.run()
+	assert([1, 2, 3, 4] == graph.output)
+
+def test_output_cache():
+	"""
+	With the output cache, cells whose upstream parameters come back to
+	already seen values are not executed again.
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("inner", value=0))
+	graph.addCell(cells.Constant("outer", value=0))
+	graph.addCell(cells.Counter("count"))
+	graph.addCell(cells.Passthrough("pt"))
+	graph.connect("inner", "out", "count", "input")
+	graph.connect("outer", "out", "pt", "in")
+	graph.setPortAsGraphOutput("count","count")
+	graph.setSwitchingParameters("inner", "value", [0, 1, 2])
+	graph.setSwitchingParameters("outer", "value", [0, 1])
+	graph.setCellCosts(dict(pt=10))
+	graph.run()
+	assert([1, 2, 3, 4, 5, 6] == graph.output)
+	assert(None == graph.output_cache_statistics)
+
+	graph = Graph()
+	graph.addCell(cells.Constant("inner", value=0))
+	graph.addCell(cells.Constant("outer", value=0))
+	graph.addCell(cells.Counter("count"))
+	graph.addCell(cells.Passthrough("pt"))
+	graph.connect("inner", "out", "count", "input")
+	graph.connect("outer", "out", "pt", "in")
+	graph.setPortAsGraphOutput("count","count")
+	graph.setSwitchingParameters("inner", "value", [0, 1, 2])
+	graph.setSwitchingParameters("outer", "value", [0, 1])
+	graph.setCellCosts(dict(pt=10))
+	graph.setOutputCache(1024*1024)
+	graph.run()
+	assert([1, 2, 3, 1, 2, 3] == graph.output)
+	assert(6 == graph.output_cache_statistics["hits"])
+	assert(10 == graph.output_cache_statistics["misses"])
+
+def test_frame_cache():
+	"""
+	Outputs of frame cells are shared by all graphs of the process, and
+	restored instead of executing the cells again with the same parameters.
+	"""
+	Graph._frame_cache = None
+	def createGraph():
+		graph = Graph()
+		graph.addCell(cells.Constant("source", value=0))
+		graph.addCell(cells.Passthrough("pt"))
+		graph.connect("source", "out", "pt", "in")
+		graph.setPortAsGraphOutput("pt","out")
+		graph.setSwitchingParameters("source", "value", [0, 1, 2])
+		graph.setFrameCache(["source"], 1024*1024)
+		return graph
+
+	graph = createGraph()
+	graph.run()
+	assert([0, 1, 2] == graph.output)
+	assert(0 == graph.frame_cache_statistics["hits"])
+	assert(3 == graph.frame_cache_statistics["misses"])
+
+	graph = createGraph()
+	graph.setSwitchingParameters("source", "value", [2, 3, 0])
+	graph.run()
+	assert([2, 3, 0] == graph.output)
+	assert(2 == graph.frame_cache_statistics["hits"])
+	assert(4 == graph.frame_cache_statistics["misses"])
+	assert(1./3 == graph.frame_cache_statistics["hit_rate"])
+	Graph._frame_cache = None
+
+	# Frames whose data cannot be measured are still evicted
+	class Opaque(object):
+		def __init__(self, index):
+			self.index = index
+		def __repr__(self):
+			return "Opaque(%d)"%self.index
+	graph = createGraph()
+	graph.setSwitchingParameters("source", "value", [Opaque(i) for i in range(10)])
+	graph.setFrameCache(["source"], 7*640*480*3//2)
+	graph.run()
+	assert(3 == graph.frame_cache_statistics["entries"])
+	Graph._frame_cache = None
+
+def test_roll_over_input_iterator():
+	"""
+	Inputs can be given by an iterator, consumed one combination at a time
+	"""
+	graph = Graph()
+	graph.addCell(cells.Passthrough("pt"))
+	graph.addCell(cells.Counter("cnt"))
+	graph.setPortAsGraphInput("pt","in")
+	graph.connect("pt", "out", "cnt", "input")
+	graph.setPortAsGraphOutput("pt","out")
+	graph.setPortAsGraphOutput("cnt","count")
+
+	consumed = []
+	def read_inputs():
+		for i in range(10000):
+			consumed.append(i)
+			yield i
+	graph.input = read_inputs()
+	assert([0] == consumed)
+	results = graph.iterRun()
+	assert((0, 1) == tuple(next(results)["outputs"]))
+	assert((1, 2) == tuple(next(results)["outputs"]))
+	assert([0, 1] == consumed)
+	assert(9998 == len(list(results)))
+
+	graph.inputs = ((i, ) for i in range(5))
+	graph.run()
+	assert([(i, 10000+i+1) for i in range(5)] == graph.output)
+
+def test_step():
+	"""
+	step runs the graph once, only re-executing what changed since the
+	previous step.
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const1", value=1))
+	graph.addCell(cells.Constant("const2", value=2))
+	graph.addCell(cells.Counter("count1"))
+	graph.addCell(cells.Counter("count2"))
+	graph.connect("const1", "out", "count1", "input")
+	graph.connect("const2", "out", "count2", "input")
+	graph.setPortAsGraphOutput("count1","count")
+	graph.setPortAsGraphOutput("count2","count")
+	assert([1, 1] == graph.step()["outputs"])
+	graph.setSwitchingParameters("const1", "value", [3])
+	assert(
+		dict(outputs=[2, 1], inputs=[], params={"const1.value":3})
+		== graph.step()
+	)
+	assert([3, 2] == graph.step()["outputs"])
+
+	# Topology changes are taken into account
+	graph.addCell(cells.Passthrough("pt"))
+	graph.connect("const2", "out", "pt", "in")
+	graph.setPortAsGraphOutput("pt","out")
+	assert([4, 3, 2] == graph.step()["outputs"])
+
+def test_profiling():
+	"""
+	When profiling, each cell execution is recorded with the input and
+	parameters used.
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=True))
+	graph.addCell(cells.And("and"))
+	graph.addCell(cells.Passthrough("pt"))
+	graph.setPortAsGraphInput("and","in1")
+	graph.connect("const", "out", "and", "in2")
+	graph.connect("and", "out", "pt", "in")
+	graph.setPortAsGraphOutput("pt","out")
+	graph.setSwitchingParameters("const", "value", [True, False])
+	graph.input = [True, False]
+	graph.enableProfiling()
+	graph.run()
+	assert([True, False, False, False] == graph.output)
+
+	assert(
+		[(0, {"const.value":True}), (0, {"const.value":False}),
+		 (1, {"const.value":True}), (1, {"const.value":False})]
+		== graph.profiler.runs
+	)
+	assert(
+		["const", "and", "pt"]*4
+		== [event[0] for event in graph.profiler.events]
+	)
+	summary = graph.profiler.getSummary()
+	assert(set(["const", "and", "pt"]) == set(summary))
+	for stats in summary.values():
+		assert(4 == stats["count"])
+		assert(stats["p50"] <= stats["p95"] <= stats["max"])
+
+	trace_file = "/tmp/processing_pipe_trace.json"
+	graph.profiler.exportChromeTrace(trace_file)
+	trace = loadJSONFile(trace_file)
+	os.remove(trace_file)
+	assert(12 == len(trace["traceEvents"]))
+	assert("X" == trace["traceEvents"][0]["ph"])
+	assert(dict(run=0, input=0, params={"const.value":True})
+	       == trace["traceEvents"][0]["args"])
+
+def test_result_store():
+	"""
+	Results are stored in columns, and dicts are only built on access
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=True))
+	graph.addCell(cells.And("and"))
+	graph.setPortAsGraphInput("and", "in1")
+	graph.connect("const", "out", "and", "in2")
+	graph.setPortAsGraphOutput("and", "out")
+	graph.setSwitchingParameters("const", "value", [True, False])
+	graph.input = [True, False]
+	graph.run()
+
+	assert(4 == len(graph.result))
+	assert([0, 1, 0, 1] == list(graph.result.getParamIndices("const.value")))
+	assert([True, False, False, False] == graph.result.getOutputColumn("and.out"))
+	assert(
+		dict(outputs=[False], inputs=[False], params={"const.value":True})
+		== graph.result[-2]
+	)
+	assert([False, False] == [r["outputs"][0] for r in graph.result[2:]])
+
+	npz_file = "/tmp/processing_pipe_results.npz"
+	graph.result.exportNPZ(npz_file)
+	columns = numpy.load(npz_file)
+	assert([0, 0, 1, 1] == list(columns["input_index"]))
+	assert([0, 1, 0, 1] == list(columns["params.const.value"]))
+	assert([True, False] == list(columns["params.const.value.values"]))
+	assert([True, False, False, False] == list(columns["outputs.and.out"]))
+	assert([True, False] == list(columns["inputs.and.in1"]))
+	columns.close()
+	os.remove(npz_file)
+
+def test_result_retention():
+	"""
+	Only the results chosen by the retention policy are kept
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=True))
+	graph.addCell(cells.And("and"))
+	graph.setPortAsGraphInput("and", "in1")
+	graph.connect("const", "out", "and", "in2")
+	graph.setPortAsGraphOutput("and", "out")
+	graph.setSwitchingParameters("const", "value", [True, False])
+
+	graph.setResultRetention(keep=3)
+	graph.input = [True, False, True]
+	graph.run()
+	assert([False, True, False] == graph.output)
+	assert(
+		[(False, False), (True, True), (True, False)]
+		== [(r["inputs"][0], r["params"]["const.value"]) for r in graph.result]
+	)
+	assert(6 == graph.result.total_count)
+
+	seen = []
+	graph.setResultRetention(keep=0, callback=lambda r: seen.append(r["outputs"][0]))
+	graph.input = [True, False, True]
+	graph.run()
+	assert(0 == len(graph.result))
+	assert(None == graph.output)
+	assert([True, False, False, False, True, False] == seen)
+
+	graph.setResultRetention(reduction=lambda value: "yes" if value else "no")
+	graph.input = [True, False]
+	graph.run()
+	assert(["yes", "no", "no", "no"] == graph.output)
+
+def test_result_log():
+	"""
+	Results written to disk are read back on access, even by another reader
+	while the sweep is running
+	"""
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=True))
+	graph.addCell(cells.And("and"))
+	graph.setPortAsGraphInput("and", "in1")
+	graph.connect("const", "out", "and", "in2")
+	graph.setPortAsGraphOutput("and", "out")
+	graph.setSwitchingParameters("const", "value", [True, False])
+	graph.input = [True, False, True]
+	graph.run()
+	in_memory_results = list(graph.result)
+
+	log_path = "/tmp/processing_pipe_result_log"
+	read_counts = []
+	graph.setResultLog(log_path, segment_size=64)
+	graph.setResultRetention(
+		callback=lambda r: read_counts.append(len(ResultLog(log_path)))
+	)
+	graph.input = [True, False, True]
+	graph.run()
+
+	assert([1, 2, 3, 4, 5, 6] == read_counts)
+	assert(isinstance(graph.result, ResultLog))
+	assert(in_memory_results == graph.result)
+	assert([True, False, False, False, True, False] == graph.output)
+	assert(in_memory_results[-3] == ResultLog(log_path)[-3])
+	assert(1 < len([f for f in os.listdir(log_path) if f.startswith("segment-")]))
+	shutil.rmtree(log_path)
+
+def test_checkpoint_resume():
+	"""
+	An interrupted run resumes from its last checkpoint, which is ignored if
+	the graph changed
+	"""
+	def create_graph():
+		graph = Graph()
+		graph.addCell(cells.Constant("const1", value=True))
+		graph.addCell(cells.Constant("const2", value=True))
+		graph.addCell(cells.And("and"))
+		graph.connect("const1", "out", "and", "in1")
+		graph.connect("const2", "out", "and", "in2")
+		graph.setPortAsGraphOutput("and", "out")
+		graph.setSwitchingParameters("const1", "value", [True, False])
+		graph.setSwitchingParameters("const2", "value", [True, False, True])
+		return graph
+
+	graph = create_graph()
+	graph.run()
+	expected_results = list(graph.result)
+
+	def crash(result):
+		if len(graph.result) == 4:
+			raise KeyboardInterrupt
+	checkpoint_path = "/tmp/processing_pipe_checkpoint"
+	result_log = "/tmp/processing_pipe_checkpoint_log"
+	graph = create_graph()
+	graph.setResultLog(result_log)
+	graph.setResultRetention(callback=crash)
+	graph.setCheckpoint(checkpoint_path, key="graph", interval=0)
+	with pytest.raises(KeyboardInterrupt):
+		graph.run()
+
+	executed = []
+	graph = create_graph()
+	graph.setResultLog(result_log)
+	graph.setResultRetention(callback=executed.append)
+	graph.setCheckpoint(checkpoint_path, key="graph", resume=True)
+	graph.run()
+	# Crashed before the checkpoint of the 4th result
+	assert(3 == len(executed))
+	# Parameters at the same depth may be swept in any order
+	assert(sorted(expected_results) == sorted(graph.result))
+	shutil.rmtree(result_log)
+
+	# Results kept in memory are not saved in checkpoints
+	graph = create_graph()
+	graph.setCheckpoint(checkpoint_path, key="graph")
+	with pytest.raises(Exception):
+		graph.run()
+
+	# What the callback computes from the results is saved instead
+	counted = dict(results=0, true=0, crash=True)
+	def count(result):
+		counted["results"] += 1
+		counted["true"] += int(result["outputs"][0])
+		if counted["crash"] and 4 == counted["results"]:
+			raise KeyboardInterrupt
+	def set_state(state):
+		counted["results"], counted["true"] = state
+	for resume in [False, True]:
+		graph = create_graph()
+		graph.setResultRetention(keep=0, callback=count)
+		graph.setCheckpoint(checkpoint_path,
+		                    key="graph",
+		                    interval=0,
+		                    resume=resume,
+		                    get_state=lambda: (counted["results"], counted["true"]),
+		                    set_state=set_state)
+		if not resume:
+			with pytest.raises(KeyboardInterrupt):
+				graph.run()
+			counted["crash"] = False
+		else:
+			graph.run()
+	assert(6 == counted["results"])
+	assert(2 == counted["true"])
+
+	# A checkpoint saved with another key is not used
+	executed = []
+	graph = create_graph()
+	graph.setResultRetention(keep=0, callback=executed.append)
+	graph.setCheckpoint(checkpoint_path, key="other graph", resume=True)
+	graph.run()
+	assert(6 == len(executed))
+	os.remove(checkpoint_path)
+
+def test_result_cache():
+	"""
+	Outputs computed by a previous invocation are reused
+	"""
+	cache_path = "/tmp/processing_pipe_result_cache"
+	input_path = "/tmp/processing_pipe_result_cache_input"
+	def create_graph(values):
+		graph = Graph()
+		graph.addCell(cells.Constant("file", value=""))
+		graph.addCell(cells.Constant("const", value=0))
+		graph.addCell(cells.Passthrough("pt1"))
+		graph.addCell(cells.Passthrough("pt2"))
+		graph.connect("file", "out", "pt1", "in")
+		graph.connect("const", "out", "pt2", "in")
+		graph.setPortAsGraphOutput("pt1", "out")
+		graph.setPortAsGraphOutput("pt2", "out")
+		graph.setSwitchingParameters("file", "value", [input_path])
+		graph.setSwitchingParameters("const", "value", values)
+		graph.setResultCache(cache_path, key="graph")
+		return graph
+
+	with open(input_path, "w") as f:
+		f.write("first version")
+	graph = create_graph([1, 2])
+	graph.run()
+	assert([(input_path, 1), (input_path, 2)] == graph.output)
+	assert(0 == graph.result_cache_statistics["hits"])
+
+	# Only the new value is computed
+	graph = create_graph([1, 3, 2])
+	graph.run()
+	assert([(input_path, 1), (input_path, 3), (input_path, 2)] == graph.output)
+	assert(4 == graph.result_cache_statistics["hits"])
+	assert(1 == graph.result_cache_statistics["misses"])
+
+	# Files are identified by their content
+	with open(input_path, "w") as f:
+		f.write("second version")
+	graph = create_graph([1, 2])
+	graph.run()
+	assert(0 == graph.result_cache_statistics["hits"])
+
+	# Values which cannot be pickled are computed, not cached
+	class Unpicklable(object):
+		def __repr__(self):
+			return "Unpicklable()"
+		def __reduce__(self):
+			raise RuntimeError("Pickling of Unpicklable is not enabled")
+	graph = create_graph([Unpicklable()])
+	with warnings.catch_warnings(record=True) as caught:
+		warnings.simplefilter("always")
+		graph.run()
+	assert(1 == len(caught))
+	assert("Unpicklable()" == repr(graph.result[0]["outputs"][1]))
+	assert([] == [
+	    name for _, _, names in os.walk(cache_path) for name in names\
+	    if name.endswith(".tmp")
+	])
+
+	# Replacing a value does not count its previous size
+	cache = ResultCache(cache_path + "_replaced", 1024*1024)
+	cache.put("0123", "a"*1000)
+	size = cache.getStatistics()["size"]
+	cache.put("0123", "a"*1000)
+	assert(size == cache.getStatistics()["size"])
+	shutil.rmtree(cache_path + "_replaced")
+
+	shutil.rmtree(cache_path)
+	os.remove(input_path)
+
+def test_step_result_cache():
+	"""
+	Steps restore outputs found in the result cache without executing the
+	cells
+	"""
+	cache_path = "/tmp/processing_pipe_step_cache"
+	graph = Graph()
+	graph.addCell(cells.Constant("const", value=0))
+	graph.addCell(cells.Counter("cnt"))
+	graph.connect("const", "out", "cnt", "input")
+	graph.setPortAsGraphOutput("cnt", "count")
+	graph.setResultCache(cache_path, key="graph")
+	counts = []
+	for value in [1, 2, 1, 3]:
+		graph.setSwitchingParameters("const", "value", [value])
+		counts.append(graph.step()["outputs"][0])
+	# The counter did not run on the value seen before
+	assert([1, 2, 1] == counts[:3])
+	assert(1 == graph.result_cache_statistics["hits"])
+	assert(3 == graph.result_cache_statistics["misses"])
+	shutil.rmtree(cache_path)
+
+def test_match_pairs():
+	annotations = [[[0, 0], [10, 10]], [[8, 0], [18, 10]], None]
+	outputs = [[[7, 0], [15, 10]], [[1, 1], [9, 9]], [20, 20], [5, 5]]
+	matches, overlaps = locationMatrix(annotations, outputs)
+	assert([
+	    [False, True, False, True],
+	    [True, False, False, False],
+	    [True, True, True, True]
+	] == matches.tolist())
+	assert(0.64 == overlaps[0][1])
+	assert(1. == overlaps[0][3])
+
+	# Pairing the first output with the first annotation would leave the
+	# second annotation unpaired
+	matches = numpy.array([[True, True], [True, False]])
+	assert([(0, 1), (1, 0)] == matchPairs(matches, numpy.ones(matches.shape)))
+
+	# The number of pairs being equal, the largest overlaps are chosen
+	matches = numpy.ones((2, 2), dtype=bool)
+	overlaps = numpy.array([[0.9, 0.8], [0.2, 0.6]])
+	assert([(0, 0), (1, 1)] == matchPairs(matches, overlaps))
+	assert([] == matchPairs(numpy.zeros((2, 0), dtype=bool), numpy.zeros((2, 0))))
+
+def test_merge_streams():
+	streams = [
+	    {(2, 0): "a2", (0, 0): "a0", (1, 500000000): "a1"},
+	    {(1, 0): "b1", (0, 0): "b0"}
+	]
+	assert([
+	    (0., 0, "ds/a0"),
+	    (0., 1, "ds/b0"),
+	    (1., 1, "ds/b1"),
+	    (1.5, 0, "ds/a1"),
+	    (2., 0, "ds/a2")
+	] == list(mergeStreams(streams, "ds")))
+
+def test_group_streams():
+	changes = [
+	    (0., 0, "left0"), (0.001, 1, "right0"),
+	    (0.1, 1, "right1"), (0.102, 0, "left1"),
+	    (0.2, 0, "left2"), (0.202, 0, "left3"), (0.25, 1, "right2")
+	]
+	# An input changes at most once per group
+	assert([
+	    [(0., 0, "left0"), (0.001, 1, "right0")],
+	    [(0.1, 1, "right1"), (0.102, 0, "left1")],
+	    [(0.2, 0, "left2")],
+	    [(0.202, 0, "left3")],
+	    [(0.25, 1, "right2")]
+	] == list(groupStreams(iter(changes), 0.01)))
+	assert(len(changes) == len(list(groupStreams(changes, 0.))))
+
+def test_prefetch_streams():
+	changes = [
+	    (0., 0, "tests/data/ryan.jpg"),
+	    (1., 0, "tests/data/non_existing.jpg"),
+	    (2., 0, "tests/data/ryan_annotated.jpg")
+	]
+	assert(changes == list(prefetchStreams(iter(changes), 1)))
+	assert(changes == list(prefetchStreams(changes, 8, workers=2)))
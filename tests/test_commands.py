@@ -1,12 +1,23 @@
 # Standard library
 import os
 import pytest
+import shutil
+import subprocess
+import sys
+import time
 
 # Third-party libraries
 import argparse
 
 # Local modules
 from processing_pipe.__main__ import main
+from processing_pipe.commands import eval_command
+from processing_pipe.graph import Graph
+from processing_pipe.utils import loadJSONFile, saveJSONFile, loadCheckpoint, hashJSON
+
+# Manifests and outputs kept by eval, instead of the user cache (removed
+# with the sandbox after each test)
+EVAL_CACHE = "/tmp/processing_pipe/eval_cache"
 
 def test_main_call():
 	with pytest.raises(SystemExit) as _s:
@@ -21,6 +32,39 @@ def test_main_call():
 	with pytest.raises(SystemExit) as _s:
 		main(["eval", "-h"])
 	assert(0 == _s.value.code)
+	with pytest.raises(SystemExit) as _s:
+		main(["bench", "-h"])
+	assert(0 == _s.value.code)
+	with pytest.raises(SystemExit) as _s:
+		main(["pack", "-h"])
+	assert(0 == _s.value.code)
+
+def test_lazy_subcommand_loading():
+	"""
+	Startup benchmark: running a subcommand must not import the others, and
+	printing the version must not import any of them.
+	"""
+	script = """
+import sys
+from processing_pipe.__main__ import main
+try:
+	main(sys.argv[1:])
+except SystemExit:
+	pass
+print sorted([
+	name for name, module in sys.modules.items()\
+	if name.startswith("processing_pipe.commands.") and module is not None
+])
+"""
+	for args, expected_modules in [
+		    (["-v"], ["processing_pipe.commands.main"]),
+		    (["run", "-h"], ["processing_pipe.commands.main",
+		                     "processing_pipe.commands.run_command"]),
+		]:
+		start = time.time()
+		output = subprocess.check_output([sys.executable, "-c", script] + args)
+		print "processing-pipe %s: %f s"%(" ".join(args), time.time()-start)
+		assert(str(expected_modules) == output.strip().split("\n")[-1])
 
 def test_main_parser(main_command_parser):
 	with pytest.raises(SystemExit) as _s:
@@ -56,6 +100,73 @@ def test_run_command(command_args, run_command_parser):
 	assert(os.path.exists("/tmp/processing_pipe/ryan.jpg"))
 	os.remove("/tmp/processing_pipe/ryan.jpg")
 
+def test_run_command_cache(run_command_parser):
+	cache_path = "/tmp/processing_pipe_run_cache"
+	parsed_arguments = run_command_parser.parse_args([
+	    "--cache-dir", cache_path,
+	    "tests/data/parametrized_graph.json"
+	])
+	parsed_arguments.func(parsed_arguments)
+	assert(8 == sum([len(files) for _, _, files in os.walk(cache_path)]))
+	shutil.rmtree(cache_path)
+
+def test_run_command_checkpoint(run_command_parser):
+	checkpoint_path = "/tmp/processing_pipe_run_checkpoint"
+	graph_path = "tests/data/parametrized_graph.json"
+	parsed_arguments = run_command_parser.parse_args([
+	    "--checkpoint", checkpoint_path,
+	    graph_path
+	])
+	parsed_arguments.func(parsed_arguments)
+
+	# The checkpoint is only valid for the same graph
+	assert(None == loadCheckpoint(checkpoint_path, "another graph"))
+	checkpoint = loadCheckpoint(checkpoint_path, hashJSON(loadJSONFile(graph_path)))
+	assert(8 == checkpoint["done"])
+
+	# Nothing is left to run
+	parsed_arguments = run_command_parser.parse_args([
+	    "--checkpoint", checkpoint_path,
+	    "--resume",
+	    graph_path
+	])
+	parsed_arguments.func(parsed_arguments)
+	checkpoint = loadCheckpoint(checkpoint_path, hashJSON(loadJSONFile(graph_path)))
+	assert(8 == checkpoint["done"])
+	os.remove(checkpoint_path)
+
+
+def test_bench_command(bench_command_parser):
+	report_path = "/tmp/processing_pipe_bench.json"
+	parsed_arguments = bench_command_parser.parse_args([
+	    "--warmup", "1",
+	    "--repeat", "5",
+	    "--retention", "all",
+	    "--retention", "keep:1",
+	    "--retention", "log",
+	    "-o", report_path,
+	    "tests/data/parametrized_graph.json"
+	])
+	report = parsed_arguments.func(parsed_arguments)
+
+	assert(report == loadJSONFile(report_path))
+	os.remove(report_path)
+	assert(8 == len(report["configurations"]))
+	assert(
+	    {"const1.value":True, "const2.value":True, "const3.value":False}
+	    == report["configurations"][1]["params"]
+	)
+	for configuration in report["configurations"]:
+		assert(5 == configuration["runs"])
+		assert(0 < configuration["throughput"])
+		latency = configuration["latency"]
+		assert(latency["min"] <= latency["p50"] <= latency["p95"] <= latency["max"])
+	assert(0 < report["peak_rss"])
+	assert(["all", "keep:1", "log"] == [x["policy"] for x in report["retention"]])
+	for measure in report["retention"]:
+		assert(0 < measure["peak_rss"])
+		assert(0 <= measure["sweep_rss"] <= measure["peak_rss"])
+
 
 @pytest.mark.parametrize("command_args,expected",
   [
@@ -93,7 +204,7 @@ def test_run_command(command_args, run_command_parser):
   ]
 )
 def test_eval_command_fail(command_args, expected, eval_command_parser):
-	parsed_arguments = eval_command_parser.parse_args(command_args)
+	parsed_arguments = eval_command_parser.parse_args(["--cache-dir", EVAL_CACHE] + command_args)
 	with pytest.raises(expected["type"]) as _e:
 		parsed_arguments.func(parsed_arguments)
 	assert(expected["message"] == _e.value.message)
@@ -220,7 +331,7 @@ def test_eval_command_fail(command_args, expected, eval_command_parser):
   ]
 )
 def test_eval_command(command_args, expected, eval_command_parser):
-	parsed_arguments = eval_command_parser.parse_args(command_args)
+	parsed_arguments = eval_command_parser.parse_args(["--cache-dir", EVAL_CACHE] + command_args)
 	results = parsed_arguments.func(parsed_arguments)
 	for res in results.values():
 		assert(res.has_key("_time_"))
@@ -229,3 +340,130 @@ def test_eval_command(command_args, expected, eval_command_parser):
 		assert(0 < t)
 	assert(expected == results)
 
+
+def test_pack_command(pack_command_parser, eval_command_parser):
+	pack_path = "/tmp/processing_pipe_gjacob.qipack"
+	parsed_arguments = pack_command_parser.parse_args([
+	    "--cache-dir", EVAL_CACHE,
+	    "-o", pack_path,
+	    "tests/data/gjacob_qidataset"
+	])
+	assert(pack_path == parsed_arguments.func(parsed_arguments))
+
+	# A pack is evaluated as the dataset it was made from
+	results = []
+	for dataset_path in ["tests/data/gjacob_qidataset", pack_path]:
+		parsed_arguments = eval_command_parser.parse_args([
+		    "--input-dataset", dataset_path,
+		    "--cache-dir", EVAL_CACHE,
+		    "tests/data/dummy_graph_for_eval.json"
+		])
+		result = parsed_arguments.func(parsed_arguments)[dataset_path]
+		result.pop("_time_")
+		results.append(result)
+	os.remove(pack_path)
+	assert(results[0] == results[1])
+	assert(dict(fdr=(152,182), sensitivity=(30,30)) == results[1]["pt2.out(Person)"]["sambrose"][0])
+
+@pytest.mark.parametrize("input_dataset",
+                          [
+                            "tests/data/gjacob_qidataset",
+                            "tests/data/*_qidataset",
+                          ]
+                        )
+def test_eval_command_stateless(input_dataset, eval_command_parser):
+	# Frames or datasets of a stateless graph are shared between processes,
+	# and give the same results as a single process
+	graph_path = "/tmp/processing_pipe_stateless_graph.json"
+	graph_description = loadJSONFile("tests/data/dummy_graph_for_eval.json")
+	graph_description["stateless"] = True
+	saveJSONFile(graph_description, graph_path)
+	results = []
+	for graph, jobs in [("tests/data/dummy_graph_for_eval.json", "2"), (graph_path, "2"), (graph_path, "1")]:
+		parsed_arguments = eval_command_parser.parse_args([
+		    "--input-dataset", input_dataset,
+		    "--cache-dir", EVAL_CACHE,
+		    "-j", jobs,
+		    graph
+		])
+		result = parsed_arguments.func(parsed_arguments)
+		for res in result.values():
+			res.pop("_time_")
+		results.append(result)
+	os.remove(graph_path)
+	assert(results[0] == results[1] == results[2])
+
+def test_eval_command_resume(eval_command_parser, monkeypatch):
+	# An interrupted evaluation, resumed from its checkpoint, gives the
+	# same counters as an uninterrupted one
+	checkpoint_path = "/tmp/processing_pipe_eval_checkpoint"
+	command_args = [
+	    "--input-dataset", "tests/data/gjacob_qidataset",
+	    "--cache-dir", EVAL_CACHE,
+	    "--checkpoint", checkpoint_path,
+	    "--checkpoint-interval", "0",
+	    "tests/data/dummy_graph_for_eval.json"
+	]
+	count_result = eval_command.countResult
+	calls = dict(count=0, interrupt_at=None)
+	def interruptible_count(*args):
+		calls["count"] += 1
+		if calls["count"] == calls["interrupt_at"]:
+			raise KeyboardInterrupt
+		count_result(*args)
+	monkeypatch.setattr(eval_command, "countResult", interruptible_count)
+
+	def evaluate(args):
+		calls["count"] = 0
+		parsed_arguments = eval_command_parser.parse_args(args)
+		results = parsed_arguments.func(parsed_arguments)
+		for res in results.values():
+			res.pop("_time_")
+		return results
+
+	expected = evaluate(command_args)
+	total_calls = calls["count"]
+	os.remove(checkpoint_path)
+
+	calls["interrupt_at"] = total_calls // 2
+	with pytest.raises(KeyboardInterrupt):
+		evaluate(command_args)
+	calls["interrupt_at"] = None
+	results = evaluate(command_args + ["--resume"])
+	os.remove(checkpoint_path)
+
+	# Only the states after the checkpoint were counted again
+	assert(calls["count"] <= total_calls - total_calls // 2 + 2)
+	assert(expected == results)
+
+def test_eval_command_cache(eval_command_parser, monkeypatch):
+	# A single configuration is run frame by frame, its outputs are read
+	# from the cache by a later evaluation, without executing any cell
+	graph_path = "/tmp/processing_pipe_cached_graph.json"
+	graph_description = loadJSONFile("tests/data/dummy_graph_for_eval.json")
+	graph_description["stateless"] = True
+	graph_description["cells"][1]["params"][0]["values"] = [[[15], [34]]]
+	saveJSONFile(graph_description, graph_path)
+	execute_cells = Graph._executeCells
+	executions = [0]
+	def counting_execute_cells(*args):
+		executions[0] += 1
+		execute_cells(*args)
+	monkeypatch.setattr(Graph, "_executeCells", counting_execute_cells)
+
+	results = []
+	for _ in range(2):
+		executions[0] = 0
+		parsed_arguments = eval_command_parser.parse_args([
+		    "--input-dataset", "tests/data/gjacob_qidataset",
+		    "--cache-dir", EVAL_CACHE,
+		    "--cache",
+		    graph_path
+		])
+		result = parsed_arguments.func(parsed_arguments)["tests/data/gjacob_qidataset"]
+		result.pop("_time_")
+		results.append((result, executions[0]))
+	os.remove(graph_path)
+	assert(0 < results[0][1])
+	assert(0 == results[1][1])
+	assert(results[0][0] == results[1][0])